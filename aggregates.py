@@ -0,0 +1,235 @@
+import os
+import time
+import sqlite3
+import threading
+import pandas as pd
+from config import STATE_DIR
+from cdc import ChangeCapture, ENTITY_KEYS
+from utils.issue_log import log_issue
+from utils.metrics import METRICS
+
+# Each fact row holds what one issue or branch contributes to the summaries. Applying a delta takes the
+# stored contribution of every changed key back out and adds the new one, so a refresh only touches the
+# changed rows and applying the same delta twice leaves the summaries as they were. The store remembers
+# which CDC capture it applied last, deltas that do not follow on from it are replaced by a rebuild.
+
+FACT_COLUMNS = {
+    'issues' : ['repo_id', 'state', 'author_id', 'assignee_id', 'merged_week'],
+    'branches' : ['repo_id']
+}
+
+# Summary table, the fact columns it groups by, the columns they land in and the count they add to
+
+CONTRIBUTIONS = {
+    'issues' : [
+        ('repo_issue_counts', ['repo_id', 'state'], ['repo_id', 'state'], 'issues'),
+        ('user_issue_counts', ['author_id'], ['user_id'], 'authored'),
+        ('user_issue_counts', ['assignee_id'], ['user_id'], 'assigned'),
+        ('weekly_merged_prs', ['merged_week'], ['week'], 'merged')
+    ],
+    'branches' : [
+        ('repo_branch_counts', ['repo_id'], ['repo_id'], 'branches')
+    ]
+}
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS issues_facts (issue_id TEXT PRIMARY KEY, repo_id TEXT, state TEXT, author_id TEXT, assignee_id TEXT, merged_week TEXT) WITHOUT ROWID',
+    'CREATE TABLE IF NOT EXISTS branches_facts (branch_id TEXT PRIMARY KEY, repo_id TEXT) WITHOUT ROWID',
+    'CREATE TABLE IF NOT EXISTS repo_issue_counts (repo_id TEXT NOT NULL, state TEXT NOT NULL, issues INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (repo_id, state)) WITHOUT ROWID',
+    'CREATE TABLE IF NOT EXISTS user_issue_counts (user_id TEXT PRIMARY KEY, authored INTEGER NOT NULL DEFAULT 0, assigned INTEGER NOT NULL DEFAULT 0) WITHOUT ROWID',
+    'CREATE TABLE IF NOT EXISTS weekly_merged_prs (week TEXT PRIMARY KEY, merged INTEGER NOT NULL DEFAULT 0) WITHOUT ROWID',
+    'CREATE TABLE IF NOT EXISTS repo_branch_counts (repo_id TEXT PRIMARY KEY, branches INTEGER NOT NULL DEFAULT 0) WITHOUT ROWID',
+    'CREATE INDEX IF NOT EXISTS IX_user_issue_counts_authored ON user_issue_counts (authored)',
+    'CREATE TABLE IF NOT EXISTS store_state (name TEXT PRIMARY KEY, value TEXT) WITHOUT ROWID'
+]
+
+# Rows whose counts all fall back to zero are removed
+
+EMPTY_ROWS = {
+    'repo_issue_counts' : 'issues = 0',
+    'user_issue_counts' : 'authored = 0 AND assigned = 0',
+    'weekly_merged_prs' : 'merged = 0',
+    'repo_branch_counts' : 'branches = 0'
+}
+
+
+class AggregateStore:
+    def __init__(self, db_path = None):
+        self.db_path = db_path or os.path.join(STATE_DIR, 'aggregates.db')
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread = False)
+        self._conn.execute('PRAGMA journal_mode = WAL')
+        self._conn.execute('PRAGMA synchronous = NORMAL')
+
+        for statement in SCHEMA:
+            self._conn.execute(statement)
+
+        for entity in FACT_COLUMNS:
+            self._conn.execute(f'CREATE TEMP TABLE IF NOT EXISTS staged_{entity} ({ENTITY_KEYS[entity]} TEXT PRIMARY KEY)')
+
+        self._conn.commit()
+
+    def _log_issue(self, message):
+        log_issue(message)
+
+    def _facts(self, entity, df):
+        key = ENTITY_KEYS[entity]
+        facts = df.copy()
+
+        # Merged PRs are bucketed by the Monday of the week they merged in
+
+        if entity == 'issues':
+            merged_at = pd.to_datetime(facts['pr_merged_at'], errors = 'coerce', utc = True).dt.tz_convert(None)
+            facts['merged_week'] = merged_at.dt.to_period('W-SUN').dt.start_time.dt.strftime('%Y-%m-%d')
+
+        facts = facts[[key] + FACT_COLUMNS[entity]].drop_duplicates(subset = [key], keep = 'last')
+
+        return facts.astype(object).where(facts.notna(), None)
+
+    def _contribute(self, entity, sign):
+        # Adds (1) or takes back (-1) what the stored facts of the staged keys count towards every summary
+
+        key = ENTITY_KEYS[entity]
+
+        for table, fact_columns, target_columns, measure in CONTRIBUTIONS[entity]:
+            self._conn.execute(
+                f'''
+                INSERT INTO {table} ({', '.join(target_columns)}, {measure})
+                SELECT {', '.join(fact_columns)}, {sign} * COUNT(*)
+                FROM {entity}_facts
+                WHERE {key} IN (SELECT {key} FROM staged_{entity})
+                    AND {' AND '.join(f'{column} IS NOT NULL' for column in fact_columns)}
+                GROUP BY {', '.join(fact_columns)}
+                ON CONFLICT ({', '.join(target_columns)}) DO UPDATE SET {measure} = {measure} + excluded.{measure}
+                '''
+            )
+
+    def apply(self, entity, changed_df, deleted_keys):
+        key = ENTITY_KEYS[entity]
+        columns = [key] + FACT_COLUMNS[entity]
+        facts = self._facts(entity, changed_df)
+        keys = set(facts[key].dropna()) | set(pd.Series(deleted_keys, dtype = object).dropna())
+
+        with self._lock:
+            self._conn.execute(f'DELETE FROM staged_{entity}')
+            self._conn.executemany(f'INSERT INTO staged_{entity} ({key}) VALUES (?)', ((value,) for value in keys))
+
+            self._contribute(entity, -1)
+            self._conn.execute(f'DELETE FROM {entity}_facts WHERE {key} IN (SELECT {key} FROM staged_{entity})')
+            self._conn.executemany(
+                f'INSERT INTO {entity}_facts ({", ".join(columns)}) VALUES ({", ".join("?" for _ in columns)})',
+                facts[facts[key].notna()].itertuples(index = False, name = None)
+            )
+            self._contribute(entity, 1)
+
+            for table in {table for table, _, _, _ in CONTRIBUTIONS[entity]}:
+                self._conn.execute(f'DELETE FROM {table} WHERE {EMPTY_ROWS[table]}')
+
+            self._conn.commit()
+
+        return len(keys)
+
+    def _state(self, name):
+        rows = self._query('SELECT value FROM store_state WHERE name = ?', (name,))
+
+        return rows[0][0] if rows else None
+
+    def _set_state(self, name, value):
+        with self._lock:
+            self._conn.execute('DELETE FROM store_state WHERE name = ?', (name,))
+
+            if value is not None:
+                self._conn.execute('INSERT INTO store_state (name, value) VALUES (?, ?)', (name, value))
+
+            self._conn.commit()
+
+    def _read_frame(self, path):
+        return pd.read_csv(path, dtype = str, keep_default_na = False, na_values = [''])
+
+    def rebuild(self, change_capture = None):
+        # Recounts everything from the clean files, for a new store or one that missed a capture
+
+        change_capture = change_capture or ChangeCapture()
+        self._set_state('capture_id', None)
+
+        with self._lock:
+            for table in ['issues_facts', 'branches_facts'] + list(EMPTY_ROWS):
+                self._conn.execute(f'DELETE FROM {table}')
+
+            self._conn.commit()
+
+        for entity in FACT_COLUMNS:
+            start = time.perf_counter()
+            applied = self.apply(entity, self._read_frame(os.path.join(change_capture.clean_dir, f'{entity}_clean.csv')), [])
+            self._log_issue(f'{entity.upper()} - Aggregates rebuilt | {applied} keys in {time.perf_counter() - start:.2f}s.')
+
+    def refresh(self, change_capture = None):
+        # Reads the delta files the last capture wrote, whether or not the loader has run since
+
+        change_capture = change_capture or ChangeCapture()
+        manifest = change_capture.delta_manifest()
+        applied_id = self._state('capture_id')
+
+        if applied_id is not None and manifest.get('capture_id') == applied_id:
+            self._log_issue('AGGREGATES - Skipped | deltas already applied.')
+            return
+
+        # A capture diffs against the last committed one, so it only follows on if the store applied that one too
+
+        if applied_id is None or manifest.get('previous_id') != applied_id:
+            self.rebuild(change_capture)
+            self._set_state('capture_id', manifest.get('capture_id'))
+            return
+
+        for entity in FACT_COLUMNS:
+            start = time.perf_counter()
+            changed_df = pd.concat([
+                self._read_frame(change_capture.delta_path(entity, kind))
+                for kind in ['insert', 'update']
+            ], ignore_index = True)
+            deleted_df = pd.read_csv(change_capture.delta_path(entity, 'delete'), dtype = str)
+
+            applied = self.apply(entity, changed_df, deleted_df[ENTITY_KEYS[entity]])
+            elapsed = time.perf_counter() - start
+
+            METRICS.counter('aggregate_rows_applied_total', 'Delta rows folded into the aggregate summaries').inc(applied, entity = entity)
+            METRICS.histogram('aggregate_refresh_seconds', 'Time spent applying one entity delta to the summaries').observe(elapsed, entity = entity)
+            self._log_issue(f'{entity.upper()} - Aggregated | {applied} changed keys in {elapsed:.2f}s.')
+
+        self._set_state('capture_id', manifest.get('capture_id'))
+
+    def _query(self, sql, params = ()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def repo_issue_counts(self, repo_id):
+        return dict(self._query('SELECT state, issues FROM repo_issue_counts WHERE repo_id = ?', (repo_id,)))
+
+    def open_issues(self, repo_id):
+        return self.repo_issue_counts(repo_id).get('open', 0)
+
+    def user_issue_counts(self, user_id):
+        rows = self._query('SELECT authored, assigned FROM user_issue_counts WHERE user_id = ?', (user_id,))
+        authored, assigned = rows[0] if rows else (0, 0)
+
+        return {'authored' : authored, 'assigned' : assigned}
+
+    def top_authors(self, limit = 10):
+        return self._query(
+            'SELECT user_id, authored FROM user_issue_counts WHERE authored > 0 ORDER BY authored DESC, user_id LIMIT ?',
+            (limit,)
+        )
+
+    def merged_prs_per_week(self, since = None):
+        return dict(self._query(
+            'SELECT week, merged FROM weekly_merged_prs WHERE week >= ? ORDER BY week',
+            (since or '',)
+        ))
+
+    def branch_count(self, repo_id):
+        rows = self._query('SELECT branches FROM repo_branch_counts WHERE repo_id = ?', (repo_id,))
+
+        return rows[0][0] if rows else 0
+
+    def close(self):
+        self._conn.close()
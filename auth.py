@@ -1,40 +1,63 @@
-import requests
 import os
 import datetime
 from dotenv import load_dotenv
-from config import ISSUES_DIR
+from utils.rate_limit import load_token_pool, mask_token
+from utils.issue_log import log_issue
+from utils.http_transport import HttpTransport
 
 class GithubAuth:
     def __init__(self):
         load_dotenv('pipeline.env')
         self.pat = os.getenv('GITHUB_TOKEN')
+        self.tokens = load_token_pool()
         self.auth_url = 'https://api.github.com/user'
+        self.quota = {}
+        self.transport = HttpTransport.shared()
         self.headers = {
-            'Authorization' : f'Bearer {self.pat}',
             'Accept' : 'application/vnd.github+json',
             'User-Agent': 'github-issues-pipeline'
         }
 
     def _log_issue(self, message):
-        timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-
-        with open(os.path.join(ISSUES_DIR, 'auth_error_log.txt'), 'a', encoding = 'UTF-8') as issue_log:
-            issue_log.write(f'{timestamp}: {message}\n')
+        log_issue(message, 'auth_error_log.txt')
 
     def validate_token(self):
-        if not self.pat:
+        if not self.tokens:
             self._log_issue('Github token not found in environment variables.')
             raise Exception('Github token not found in environment variables.')
 
-        resp = requests.get(self.auth_url, headers = self.headers)
+        for token in self.tokens:
+            masked = mask_token(token)
+
+            resp = self.transport.get(
+                self.auth_url,
+                headers = {
+                    **self.headers,
+                    'Authorization' : f'Bearer {token}'
+                }
+            )
+
+            if resp.status_code == 401:
+                self._log_issue(f'Github token {masked} invalid or expired.')
+                raise Exception(f'Github token {masked} invalid or expired.')
+
+            if not resp.ok:
+                self._log_issue(f'Authentication failed for token {masked}: {resp.status_code}.')
+                raise Exception(f'Authentication failed for token {masked}: {resp.status_code}.')
+
+            self.quota[masked] = {
+                'limit' : int(resp.headers.get('X-RateLimit-Limit', 0)),
+                'remaining' : int(resp.headers.get('X-RateLimit-Remaining', 0)),
+                'reset' : datetime.datetime.fromtimestamp(int(resp.headers.get('X-RateLimit-Reset', 0)))
+            }
+
+            self._log_issue(
+                f'TOKEN {masked} | {self.quota[masked]["remaining"]}/{self.quota[masked]["limit"]} '
+                f'requests remaining, resets at {self.quota[masked]["reset"]:%H:%M:%S}.'
+            )
 
-        if resp.status_code == 401:
-            self._log_issue('Github token invalid or expired.')
-            raise Exception('Github token invalid or expired.')
-        
-        if not resp.ok:
-            self._log_issue(f'Authentication failed: {resp.status_code}.')
-            raise Exception(f'Authentication failed: {resp.status_code}.')
+        total_remaining = sum(quota['remaining'] for quota in self.quota.values())
+        self._log_issue(f'TOKEN POOL - Validated | {len(self.tokens)} tokens, {total_remaining} requests remaining.')
 
         return True
     
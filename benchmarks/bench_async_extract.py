@@ -0,0 +1,58 @@
+import asyncio
+import os
+import sys
+import time
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from extract import ExtractData
+from utils.rate_limit import RateLimitScheduler
+from utils.response_cache import ResponseCache
+from benchmarks.mock_github import MockGithubServer
+
+REPO_COUNT = 100
+CONCURRENCY_LEVELS = [1, 8, 32, 128]
+
+
+def run_sync(extractor, repo_names):
+    start = time.perf_counter()
+    records = []
+
+    for repo in repo_names:
+        extractor._fetch_repo_records(repo, 'issues', records.extend)
+
+    return time.perf_counter() - start, len(records)
+
+
+def run_async(extractor, repo_names, concurrency):
+    extractor.concurrency['issues'] = concurrency
+
+    records = []
+
+    start = time.perf_counter()
+    asyncio.run(extractor._fetch_all_async(repo_names, 'issues', records.extend))
+
+    return time.perf_counter() - start, len(records)
+
+
+def main():
+    with MockGithubServer(scale = '10x') as server, tempfile.TemporaryDirectory() as cache_dir:
+        dataset = server.dataset
+        repo_names = sorted(dataset.tracked_repo_names(), key = lambda name: -dataset.issue_counts[dataset.repo_index[name]])[:REPO_COUNT]
+        extractor = ExtractData()
+        extractor.cache = ResponseCache(cache_dir)
+        extractor.base_url = server.base_url
+        extractor.scheduler = RateLimitScheduler(['benchmark-token'], requests_per_second = None)
+
+        baseline, rows = run_sync(extractor, repo_names)
+        print(f'{"mode":<14}{"seconds":>10}{"rows":>10}{"speedup":>10}')
+        print(f'{"sync":<14}{baseline:>10.2f}{rows:>10}{1:>10.1f}x')
+
+        for concurrency in CONCURRENCY_LEVELS:
+            elapsed, rows = run_async(extractor, repo_names, concurrency)
+            print(f'{f"async x{concurrency}":<14}{elapsed:>10.2f}{rows:>10}{baseline / elapsed:>10.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.guid_gen import generate_guid, generate_guids, _cached_guid, NAMESPACE_USER
+
+ROW_COUNTS = [10_000, 100_000, 1_000_000]
+UNIQUE_RATIO = 0.05
+
+
+def build_frame(rows):
+    rng = np.random.default_rng(42)
+    logins = np.array([f'user-{n}' for n in range(max(1, int(rows * UNIQUE_RATIO)))], dtype = object)
+    author_login = logins[rng.integers(0, len(logins), rows)]
+
+    return pd.DataFrame({'author_login' : author_login})
+
+
+def run_apply(df):
+    start = time.perf_counter()
+    guids = df.apply(
+        lambda r: generate_guid(
+            NAMESPACE_USER,
+            r['author_login']
+        ),
+        axis = 1
+    )
+
+    return time.perf_counter() - start, guids
+
+
+def run_batch(df):
+    _cached_guid.cache_clear()
+
+    start = time.perf_counter()
+    guids = generate_guids(NAMESPACE_USER, df['author_login'])
+
+    return time.perf_counter() - start, guids
+
+
+def main():
+    print(f'{"rows":>10}{"apply s":>10}{"batch s":>10}{"speedup":>10}  identical')
+
+    for rows in ROW_COUNTS:
+        df = build_frame(rows)
+        apply_seconds, apply_guids = run_apply(df)
+        batch_seconds, batch_guids = run_batch(df)
+
+        identical = (
+            apply_guids.str.encode('UTF-8').tolist()
+            == batch_guids.str.encode('UTF-8').tolist()
+        )
+
+        print(f'{rows:>10}{apply_seconds:>10.3f}{batch_seconds:>10.3f}{apply_seconds / batch_seconds:>9.0f}x  {identical}')
+
+        if not identical:
+            raise SystemExit('Batch GUIDs differ from generate_guid output.')
+
+
+if __name__ == '__main__':
+    main()
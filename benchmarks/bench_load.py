@@ -0,0 +1,82 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+from sqlalchemy import text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from load import LoadData
+from config import CLEAN_DIR
+from utils.sql_tables import metadata, issues
+from utils.guid_gen import generate_guids, NAMESPACE_ISSUE
+
+ISSUE_COUNTS = [10_000, 100_000]
+CLEAN_FILES = ['owners_clean', 'users_clean', 'repos_clean', 'branches_clean']
+
+
+def build_clean_dir(target_dir, issue_count):
+    # Real dimensions from the checked-in clean data, issues resampled up to the requested size
+
+    for file_name in CLEAN_FILES:
+        shutil.copy(Path(CLEAN_DIR) / f'{file_name}.csv', Path(target_dir) / f'{file_name}.csv')
+
+    issues_df = pd.read_csv(Path(CLEAN_DIR) / 'issues_clean.csv')
+    issues_df = issues_df.sample(n = issue_count, replace = True, random_state = 42).reset_index(drop = True)
+    issues_df['number'] = issues_df.index
+    issues_df['issue_id'] = generate_guids(NAMESPACE_ISSUE, pd.Series(issues_df.index).astype(str))
+    issues_df.to_csv(Path(target_dir) / 'issues_clean.csv', index = False)
+
+
+def run_bulk(work_dir):
+    loader = LoadData(f'sqlite:///{work_dir}/bulk.db')
+    loader.clean_dir = work_dir
+    loader.load_all()
+
+    return loader.load_stats['issues']['rows_per_second']
+
+
+def run_row_by_row(work_dir):
+    # Reference path: parent tables bulk loaded, issues inserted one statement per row
+
+    loader = LoadData(f'sqlite:///{work_dir}/rows.db')
+    loader.clean_dir = work_dir
+    loader.connect_db()
+
+    for table_name in ['owners', 'users', 'repos']:
+        table = metadata.tables[table_name]
+        loader.load_table(table, loader._read_clean(table))
+
+    issues_df = loader._read_clean(issues)
+    insert_sql = text(
+        'INSERT INTO issues (' + ', '.join(f'[{col}]' for col in issues_df.columns) + ') '
+        'VALUES (' + ', '.join(f':{col}' for col in issues_df.columns) + ')'
+    )
+
+    start = time.perf_counter()
+
+    with loader.engine.begin() as conn:
+        for row in loader._to_rows(issues_df):
+            conn.execute(insert_sql, row)
+
+    return len(issues_df) / (time.perf_counter() - start)
+
+
+def main():
+    print(f'{"issues":>10}{"row-by-row/s":>16}{"bulk/s":>12}{"speedup":>10}')
+
+    for issue_count in ISSUE_COUNTS:
+        with tempfile.TemporaryDirectory() as work_dir:
+            build_clean_dir(work_dir, issue_count)
+            row_rate = run_row_by_row(work_dir)
+            bulk_rate = run_bulk(work_dir)
+
+        print(f'{issue_count:>10}{row_rate:>16.0f}{bulk_rate:>12.0f}{bulk_rate / row_rate:>9.1f}x')
+
+
+if __name__ == '__main__':
+    main()
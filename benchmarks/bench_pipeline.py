@@ -0,0 +1,151 @@
+import argparse
+import importlib
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.mock_github import MockGithubServer
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+PHASES = ['extract', 'extract_incremental', 'transform', 'load']
+
+
+def run_once(server, work_dir, async_mode, graphql):
+    # config.py resolves data/ against the working directory, so each run gets a fresh tree
+
+    os.chdir(work_dir)
+
+    import config
+    importlib.reload(config)
+
+    from extract import ExtractData
+    from extract_graphql import GraphQLExtractData
+    from transform import CleanData
+    from load import LoadData
+    from cdc import ChangeCapture
+    from config import RAW_DIR
+    from utils.raw_storage import read_manifest
+    from utils.rate_limit import RateLimitScheduler
+    from utils.metrics import METRICS
+
+    METRICS.reset()
+    os.environ.setdefault('GITHUB_TOKEN', 'benchmark-token')
+    timings = {}
+
+    def extract():
+        extractor = GraphQLExtractData() if graphql else ExtractData()
+        extractor.base_url = server.base_url
+        extractor.owners = server.dataset.owners
+        extractor.async_mode = async_mode
+        extractor.requests_per_second = None
+        extractor.scheduler = RateLimitScheduler(['benchmark-token'], requests_per_second = None)
+
+        start = time.perf_counter()
+        repo_names = extractor.fetch_repos()
+        extractor.fetch_issues(repo_names)
+        extractor.fetch_branches(repo_names)
+        elapsed = time.perf_counter() - start
+
+        return sum(entry['records'] for entry in read_manifest(RAW_DIR).values()), elapsed
+
+    timings['extract'] = extract()
+
+    # Second pass runs against warm ETags and watermarks, the steady state of a nightly run
+
+    timings['extract_incremental'] = extract()
+
+    start = time.perf_counter()
+    cleaner = CleanData()
+    cleaner.clean_repos()
+    cleaner.clean_owners()
+    cleaner.clean_branches()
+    cleaner.clean_issues()
+    cleaner.clean_users()
+    clean_rows = sum(METRICS.counter('clean_rows_in_total').values.values())
+    timings['transform'] = (clean_rows, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    loader = LoadData(f'sqlite:///{os.path.join(work_dir, "benchmark.db")}')
+    change_capture = ChangeCapture()
+    change_capture.capture_all()
+    loader.load_deltas(change_capture)
+    change_capture.commit()
+    load_rows = sum(METRICS.counter('load_rows_total').values.values())
+    timings['load'] = (load_rows, time.perf_counter() - start)
+
+    return timings
+
+
+def read_baseline():
+    if not os.path.exists(BASELINE_PATH):
+        return {}
+
+    with open(BASELINE_PATH, 'r', encoding = 'UTF-8') as file:
+        return json.load(file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'End to end extract, transform and load benchmark against the mock API.')
+    parser.add_argument('--scale', default = '1x', help = 'synthetic dataset size, e.g. 1x, 10x, 100x, 1000x')
+    parser.add_argument('--seed', type = int, default = 42)
+    parser.add_argument('--latency', type = float, default = 0.01, help = 'injected seconds per request')
+    parser.add_argument('--repeat', type = int, default = 1, help = 'runs per phase, the best throughput is kept')
+    engine = parser.add_mutually_exclusive_group()
+    engine.add_argument('--async', dest = 'async_mode', action = 'store_true', help = 'use the asyncio extraction engine')
+    engine.add_argument('--graphql', action = 'store_true', help = 'use batched GraphQL extraction')
+    parser.add_argument('--tolerance', type = float, default = 0.25, help = 'allowed drop below baseline throughput')
+    parser.add_argument('--update-baseline', action = 'store_true', help = 'record these results as the new baseline')
+    args = parser.parse_args()
+
+    cwd = os.getcwd()
+    best = {}
+
+    with MockGithubServer(scale = args.scale, seed = args.seed, latency = args.latency, rate_limit = 10 ** 9) as server:
+        for _ in range(args.repeat):
+            with tempfile.TemporaryDirectory() as work_dir:
+                try:
+                    timings = run_once(server, work_dir, args.async_mode, args.graphql)
+                finally:
+                    os.chdir(cwd)
+
+            for phase, (rows, seconds) in timings.items():
+                rows_per_second = rows / seconds if seconds else 0
+
+                if rows_per_second >= best.get(phase, {}).get('rows_per_second', 0):
+                    best[phase] = {'rows' : rows, 'seconds' : round(seconds, 3), 'rows_per_second' : round(rows_per_second, 1)}
+
+    key = f'{args.scale}{"-async" if args.async_mode else ""}{"-graphql" if args.graphql else ""}'
+    baseline = read_baseline()
+    expected = baseline.get(key, {})
+    regressions = []
+
+    print(f'{"phase":<22}{"rows":>10}{"seconds":>10}{"rows/s":>12}{"baseline":>12}')
+
+    for phase in PHASES:
+        result = best[phase]
+        floor = expected.get(phase)
+        print(f'{phase:<22}{result["rows"]:>10}{result["seconds"]:>10.2f}{result["rows_per_second"]:>12.0f}{floor or "-":>12}')
+
+        if floor and result['rows_per_second'] < floor * (1 - args.tolerance):
+            regressions.append(f'{phase} at {result["rows_per_second"]:.0f} rows/s, baseline {floor:.0f}')
+
+    if args.update_baseline:
+        baseline[key] = {phase : best[phase]['rows_per_second'] for phase in PHASES}
+
+        with open(BASELINE_PATH, 'w', encoding = 'UTF-8') as file:
+            json.dump(baseline, file, indent = 4)
+
+        print(f'Baseline for {key} updated.')
+        return
+
+    if regressions:
+        print('Throughput regression: ' + '; '.join(regressions))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+import os
+import sys
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.mock_github import MockGithubServer
+from utils.http_transport import HttpTransport
+
+REQUEST_COUNT = 2000
+
+
+def run(get, base_url, repo_name):
+    start = time.perf_counter()
+
+    for page in range(REQUEST_COUNT):
+        resp = get(
+            f'{base_url}repos/{repo_name}/branches',
+            headers = {'Authorization' : 'Bearer benchmark-token'},
+            params = {'per_page' : 100, 'page' : page % 5 + 1}
+        )
+        resp.raise_for_status()
+
+    return (time.perf_counter() - start) / REQUEST_COUNT * 1000
+
+
+def main():
+    with MockGithubServer(latency = 0, rate_limit = 10 ** 9) as server:
+        repo_name = server.dataset.tracked_repo_names()[0]
+        transport = HttpTransport(pool_size = 1)
+
+        fresh_ms = run(requests.get, server.base_url, repo_name)
+        pooled_ms = run(transport.get, server.base_url, repo_name)
+
+        print(f'{"transport":<24}{"ms/request":>12}')
+        print(f'{"requests.get":<24}{fresh_ms:>12.3f}')
+        print(f'{"pooled session":<24}{pooled_ms:>12.3f}')
+        print(f'{"speedup":<24}{fresh_ms / pooled_ms:>11.2f}x')
+
+
+if __name__ == '__main__':
+    main()
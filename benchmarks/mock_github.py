@@ -0,0 +1,502 @@
+import base64
+import gzip
+import json
+import hashlib
+import multiprocessing
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, urlencode
+from benchmarks.synthetic import SyntheticGithub
+
+REPO_PATH = re.compile(r'^/repos/(?P<owner>[^/]+)/(?P<repo>[^/]+)/(?P<endpoint>issues|branches)$')
+OWNER_REPOS_PATH = re.compile(r'^/(?:users|orgs)/(?P<owner>[^/]+)/repos$')
+GRAPHQL_REPOSITORY = re.compile(r'(?P<alias>\w+): repository\(owner: \$(?P<owner>\w+), name: \$(?P<name>\w+)\) \{\s*(?P<connection>\w+)\((?P<arguments>[^)]*)\)')
+GRAPHQL_OWNER = re.compile(r'repositoryOwner\(login: \$(?P<login>\w+)\)')
+GRAPHQL_NESTED = re.compile(r'\w+\(first: (\d+)')
+MAX_PER_PAGE = 100
+
+
+def _cursor(offset):
+    return base64.b64encode(f'cursor:{offset}'.encode('UTF-8')).decode('UTF-8')
+
+
+def _offset(cursor):
+    return int(base64.b64decode(cursor).decode('UTF-8').split(':')[1]) if cursor else 0
+
+
+def _nested(nodes):
+    # Nested connections are served whole, the extractor only pages them in past its first page
+
+    return {'pageInfo' : {'hasNextPage' : False, 'endCursor' : _cursor(len(nodes)) if nodes else None}, 'nodes' : nodes}
+
+
+def _user_node(user):
+    if user is None:
+        return None
+
+    return {'login' : user['login'], 'databaseId' : user['id']}
+
+
+# GraphQL nodes are built from the REST records, so both APIs always serve the same data
+
+def _repo_node(repo, open_issues, open_pulls):
+    return {
+        'databaseId' : repo['id'],
+        'name' : repo['name'],
+        'nameWithOwner' : repo['full_name'],
+        'description' : repo['description'],
+        'url' : repo['html_url'],
+        'isPrivate' : repo['private'],
+        'isFork' : repo['fork'],
+        'isArchived' : repo['archived'],
+        'isDisabled' : repo['disabled'],
+        'visibility' : repo['visibility'].upper(),
+        'createdAt' : repo['created_at'],
+        'updatedAt' : repo['updated_at'],
+        'pushedAt' : repo['pushed_at'],
+        'stargazerCount' : repo['stargazers_count'],
+        'forkCount' : repo['forks_count'],
+        'watchers' : {'totalCount' : repo['watchers_count']},
+        'issues' : {'totalCount' : open_issues},
+        'pullRequests' : {'totalCount' : open_pulls},
+        'primaryLanguage' : {'name' : repo['language']} if repo['language'] else None,
+        'defaultBranchRef' : {'name' : repo['default_branch']},
+        'repositoryTopics' : _nested([{'topic' : {'name' : topic}} for topic in repo['topics']]),
+        'owner' : {'login' : repo['owner']['login'], 'databaseId' : repo['owner']['id']}
+    }
+
+
+def _issue_node(issue):
+    node = {
+        'databaseId' : issue['id'],
+        'number' : issue['number'],
+        'title' : issue['title'],
+        'state' : issue['state'].upper(),
+        'locked' : issue['locked'],
+        'createdAt' : issue['created_at'],
+        'updatedAt' : issue['updated_at'],
+        'closedAt' : issue['closed_at'],
+        'author' : _user_node(issue['user']),
+        'comments' : {'totalCount' : issue['comments']},
+        'labels' : _nested([{'name' : label['name'], 'color' : label['color']} for label in issue['labels']]),
+        'assignees' : _nested([_user_node(user) for user in issue['assignees']])
+    }
+
+    if issue['pull_request'] is not None:
+        node['mergedAt'] = issue['pull_request']['merged_at']
+
+    return node
+
+
+def _ref_node(branch):
+    return {
+        'name' : branch['name'],
+        'target' : {'oid' : branch['commit']['sha']},
+        'branchProtectionRule' : {'id' : 'BPR_main'} if branch['protected'] else None
+    }
+
+
+def _query_cost(query):
+    # Github's formula, one request per connection plus first * nested connections, per 100 requests
+
+    blocks = list(GRAPHQL_REPOSITORY.finditer(query))
+    requests = 0
+
+    for number, block in enumerate(blocks):
+        end = blocks[number + 1].start() if number + 1 < len(blocks) else len(query)
+        outer = int(GRAPHQL_NESTED.search(block['connection'] + '(' + block['arguments']).group(1))
+        requests += 1 + outer * len(GRAPHQL_NESTED.findall(query, block.end(), end))
+
+    return max(1, round(requests / 100))
+
+
+class MockGithubHandler(BaseHTTPRequestHandler):
+    # Keep-alive like the real API, TCP_NODELAY so split header/body writes don't stall on delayed ACKs
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body, headers = None):
+        payload = json.dumps(body).encode('UTF-8')
+
+        self.send_response(status)
+
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+
+        if self.server.compress and 'gzip' in self.headers.get('Accept-Encoding', ''):
+            payload = gzip.compress(payload, compresslevel = 5)
+            self.send_header('Content-Encoding', 'gzip')
+
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _link_header(self, url, params, page, total_pages):
+        def page_url(page_number):
+            query = {key: values[0] for key, values in params.items()}
+            query['page'] = page_number
+            return f'http://{self.headers["Host"]}{url.path}?{urlencode(query)}'
+
+        links = []
+
+        if page < total_pages:
+            links.append(f'<{page_url(page + 1)}>; rel="next"')
+
+            if self.server.advertise_last:
+                links.append(f'<{page_url(total_pages)}>; rel="last"')
+
+        if page > 1:
+            links.append(f'<{page_url(1)}>; rel="first"')
+            links.append(f'<{page_url(page - 1)}>; rel="prev"')
+
+        return ', '.join(links)
+
+    def _listing(self, endpoint, match, params):
+        dataset = self.server.dataset
+
+        if endpoint == 'repos':
+            if match['owner'] not in dataset.owner_numbers:
+                return None
+
+            indexes = dataset.owner_repo_indexes(match['owner'])
+            return len(indexes), lambda position: dataset.repo(indexes[position])
+
+        full_name = f'{match["owner"]}/{match["repo"]}'
+
+        if full_name not in dataset.repo_index:
+            return None
+
+        index = dataset.repo_index[full_name]
+
+        if endpoint == 'branches':
+            return dataset.branch_counts[index], lambda position: dataset.branch(index, position)
+
+        # Only open issues exist in the synthetic data, as in the checked-in snapshot
+
+        if params.get('state', ['open'])[0] == 'closed':
+            return 0, None
+
+        first = dataset.first_issue_since(index, params['since'][0]) if 'since' in params else 0
+        count = dataset.issue_counts[index] - first
+
+        # Newest first like the API default, oldest first for sort=updated&direction=asc
+
+        if params.get('sort', [''])[0] == 'updated' and params.get('direction', [''])[0] == 'asc':
+            return count, lambda position: dataset.issue(index, first + position)
+
+        return count, lambda position: dataset.issue(index, dataset.issue_counts[index] - 1 - position)
+
+    def _rate_limit(self, resource = 'core'):
+        # One window per token and resource, conditional 304s are free like on the real API
+
+        token = (self.headers.get('Authorization', 'anonymous'), resource)
+
+        with self.server.lock:
+            window = self.server.windows.get(token)
+            now = time.time()
+
+            if window is None or now >= window['reset']:
+                window = {'used' : 0, 'reset' : int(now) + self.server.rate_limit_window}
+                self.server.windows[token] = window
+
+            return window
+
+    def _rate_headers(self, window, resource = 'core'):
+        return {
+            'X-RateLimit-Limit' : str(self.server.rate_limit),
+            'X-RateLimit-Remaining' : str(max(self.server.rate_limit - window['used'], 0)),
+            'X-RateLimit-Used' : str(window['used']),
+            'X-RateLimit-Reset' : str(window['reset']),
+            'X-RateLimit-Resource' : resource
+        }
+
+    def _injected_error(self):
+        with self.server.lock:
+            return self.server.rng.random() < self.server.error_rate
+
+    def _admit(self, resource = 'core'):
+        time.sleep(self.server.latency + self.server.latency_jitter * self.server.rng.random())
+
+        if self.server.require_auth and 'Authorization' not in self.headers:
+            self._send_json(401, {'message' : 'Requires authentication'})
+            return None
+
+        window = self._rate_limit(resource)
+
+        if window['used'] >= self.server.rate_limit:
+            self._send_json(403, {'message' : 'API rate limit exceeded'}, self._rate_headers(window, resource))
+            return None
+
+        if self._injected_error():
+            self._send_json(self.server.rng.choice([500, 502, 503]), {'message' : 'Injected server error'}, self._rate_headers(window, resource))
+            return None
+
+        return window
+
+    def do_GET(self):
+        url = urlparse(re.sub(r'^/+', '/', self.path))
+        params = parse_qs(url.query)
+        window = self._admit()
+
+        if window is None:
+            return
+
+        if url.path == '/user':
+            with self.server.lock:
+                window['used'] += 1
+
+            self._send_json(200, {'login' : 'mock-user', 'id' : 1, 'type' : 'User'}, self._rate_headers(window))
+            return
+
+        repo_match = REPO_PATH.match(url.path)
+        owner_match = OWNER_REPOS_PATH.match(url.path)
+
+        if repo_match:
+            listing = self._listing(repo_match['endpoint'], repo_match, params)
+        elif owner_match:
+            listing = self._listing('repos', owner_match, params)
+        else:
+            listing = None
+
+        if listing is None:
+            self._send_json(404, {'message' : 'Not Found'}, self._rate_headers(window))
+            return
+
+        count, record = listing
+        page = int(params.get('page', ['1'])[0])
+        per_page = min(int(params.get('per_page', ['30'])[0]), MAX_PER_PAGE)
+        start = (page - 1) * per_page
+        body = [record(position) for position in range(start, min(start + per_page, count))]
+
+        payload = json.dumps(body).encode('UTF-8')
+        etag = f'W/"{hashlib.sha1(payload).hexdigest()}"'
+        total_pages = max(1, -(-count // per_page))
+        headers = {'ETag' : etag}
+        link_header = self._link_header(url, params, page, total_pages)
+
+        if link_header:
+            headers['Link'] = link_header
+
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+
+            for name, value in {**headers, **self._rate_headers(window)}.items():
+                self.send_header(name, value)
+
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        with self.server.lock:
+            window['used'] += 1
+
+        self._send_json(200, body, {**headers, **self._rate_headers(window)})
+
+    def _graphql_page(self, count, record, node, first, after):
+        start = _offset(after)
+        end = min(start + first, count)
+
+        return {
+            'pageInfo' : {'hasNextPage' : end < count, 'endCursor' : _cursor(end) if end > start else after},
+            'nodes' : [node(record(position)) for position in range(start, end)]
+        }
+
+    def _pull_positions(self, index):
+        # Which issue positions are pull requests, only known by building the records once
+
+        with self.server.lock:
+            positions = self.server.pull_positions.get(index)
+
+        if positions is None:
+            dataset = self.server.dataset
+            positions = [
+                position for position in range(dataset.issue_counts[index])
+                if dataset.issue(index, position)['pull_request'] is not None
+            ]
+
+            with self.server.lock:
+                self.server.pull_positions[index] = positions
+
+        return positions
+
+    def _owner_repo_node(self, repo):
+        index = self.server.dataset.repo_index[repo['full_name']]
+        pulls = len(self._pull_positions(index))
+
+        return _repo_node(repo, self.server.dataset.issue_counts[index] - pulls, pulls)
+
+    def _graphql_connection(self, index, connection, arguments, variables):
+        dataset = self.server.dataset
+        first = min(int(re.search(r'first: (\d+)', arguments).group(1)), MAX_PER_PAGE)
+        after_match = re.search(r'after: \$(\w+)', arguments)
+        after = variables.get(after_match.group(1)) if after_match else None
+
+        if connection == 'refs':
+            return self._graphql_page(dataset.branch_counts[index], lambda position: dataset.branch(index, position), _ref_node, first, after)
+
+        pulls = self._pull_positions(index)
+
+        if connection == 'pullRequests':
+            # Newest first, the only order the extractor asks for
+
+            return self._graphql_page(len(pulls), lambda position: dataset.issue(index, pulls[-1 - position]), _issue_node, first, after)
+
+        since_match = re.search(r'since: \$(\w+)', arguments)
+        since = variables.get(since_match.group(1)) if since_match else None
+        first_since = dataset.first_issue_since(index, since) if since else 0
+        pull_set = set(pulls)
+        positions = [position for position in range(first_since, dataset.issue_counts[index]) if position not in pull_set]
+
+        return self._graphql_page(len(positions), lambda position: dataset.issue(index, positions[position]), _issue_node, first, after)
+
+    def do_POST(self):
+        url = urlparse(re.sub(r'^/+', '/', self.path))
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+        if url.path != '/graphql':
+            self._send_json(404, {'message' : 'Not Found'})
+            return
+
+        window = self._admit('graphql')
+
+        if window is None:
+            return
+
+        # Only the query shapes extract_graphql.py sends are understood, enough to stand in for the API
+
+        request = json.loads(body)
+        query = request['query']
+        variables = request.get('variables') or {}
+        dataset = self.server.dataset
+        data = {}
+        errors = []
+        owner_match = GRAPHQL_OWNER.search(query)
+
+        if owner_match:
+            owner = variables[owner_match['login']]
+
+            if owner in dataset.owner_numbers:
+                indexes = dataset.owner_repo_indexes(owner)
+                page = self._graphql_page(
+                    len(indexes),
+                    lambda position: dataset.repo(indexes[position]),
+                    lambda repo: self._owner_repo_node(repo),
+                    100,
+                    variables.get('after')
+                )
+                data['repositoryOwner'] = {'repositories' : page}
+            else:
+                data['repositoryOwner'] = None
+                errors.append({'type' : 'NOT_FOUND', 'path' : ['repositoryOwner'], 'message' : f'Could not resolve to a RepositoryOwner with the login of \'{owner}\'.'})
+
+        for block in GRAPHQL_REPOSITORY.finditer(query):
+            full_name = f'{variables[block["owner"]]}/{variables[block["name"]]}'
+
+            if full_name not in dataset.repo_index:
+                data[block['alias']] = None
+                errors.append({'type' : 'NOT_FOUND', 'path' : [block['alias']], 'message' : f'Could not resolve to a Repository with the name \'{full_name}\'.'})
+                continue
+
+            data[block['alias']] = {
+                block['connection'] : self._graphql_connection(dataset.repo_index[full_name], block['connection'], block['arguments'], variables)
+            }
+
+        cost = _query_cost(query)
+
+        with self.server.lock:
+            window['used'] += cost
+
+        data['rateLimit'] = {
+            'cost' : cost,
+            'remaining' : max(self.server.rate_limit - window['used'], 0),
+            'resetAt' : time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(window['reset']))
+        }
+        payload = {'data' : data}
+
+        if errors:
+            payload['errors'] = errors
+
+        self._send_json(200, payload, self._rate_headers(window, 'graphql'))
+
+
+class MockHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+def _serve(options, port_queue):
+    httpd = MockHTTPServer(('127.0.0.1', 0), MockGithubHandler)
+    httpd.dataset = SyntheticGithub(options['scale'], options['seed'])
+    httpd.latency = options['latency']
+    httpd.latency_jitter = options['latency_jitter']
+    httpd.error_rate = options['error_rate']
+    httpd.rate_limit = options['rate_limit']
+    httpd.rate_limit_window = options['rate_limit_window']
+    httpd.advertise_last = options['advertise_last']
+    httpd.require_auth = options['require_auth']
+    httpd.compress = options['compress']
+    httpd.rng = random.Random(options['seed'])
+    httpd.lock = threading.Lock()
+    httpd.windows = {}
+    httpd.pull_positions = {}
+    port_queue.put(httpd.server_address[1])
+    httpd.serve_forever()
+
+
+class MockGithubServer:
+    # Served from a separate process so the server never competes with the client for the GIL
+
+    def __init__(
+        self,
+        scale = 1,
+        seed = 42,
+        latency = 0.02,
+        latency_jitter = 0.0,
+        error_rate = 0.0,
+        rate_limit = 5000,
+        rate_limit_window = 3600,
+        advertise_last = True,
+        require_auth = True,
+        compress = True
+    ):
+        self.dataset = SyntheticGithub(scale, seed)
+        self.options = {
+            'scale' : scale,
+            'seed' : seed,
+            'latency' : latency,
+            'latency_jitter' : latency_jitter,
+            'error_rate' : error_rate,
+            'rate_limit' : rate_limit,
+            'rate_limit_window' : rate_limit_window,
+            'advertise_last' : advertise_last,
+            'require_auth' : require_auth,
+            'compress' : compress
+        }
+        self.port_queue = multiprocessing.Queue()
+        self.process = multiprocessing.Process(
+            target = _serve,
+            args = (self.options, self.port_queue),
+            daemon = True
+        )
+        self.port = None
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.port}/'
+
+    def __enter__(self):
+        self.process.start()
+        self.port = self.port_queue.get(timeout = 30)
+        return self
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        self.process.join()
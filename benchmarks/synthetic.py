@@ -0,0 +1,281 @@
+import argparse
+import bisect
+import datetime
+import hashlib
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Sizes of the checked-in data/raw_data snapshot, every scale is a multiple of these
+
+BASELINE = {
+    'repos' : 300,
+    'issues' : 3210,
+    'branches' : 2628,
+    'users' : 480
+}
+
+SCALES = {
+    '1x' : 1,
+    '10x' : 10,
+    '100x' : 100,
+    '1000x' : 1000
+}
+
+REPOS_PER_OWNER = 300
+LANGUAGES = ['Python', 'TypeScript', 'C#', 'C++', 'Go', 'Rust', 'Java', 'PowerShell', None]
+LABELS = ['bug', 'enhancement', 'documentation', 'question', 'needs-triage', 'good first issue']
+TOPICS = ['ai', 'azure', 'cli', 'devtools', 'machine-learning', 'python', 'typescript', 'vscode']
+EPOCH = datetime.datetime(2024, 1, 1, tzinfo = datetime.timezone.utc)
+
+
+def parse_scale(scale):
+    if isinstance(scale, str):
+        return SCALES[scale] if scale in SCALES else float(scale.rstrip('x'))
+
+    return scale
+
+
+def _timestamp(seconds):
+    return (EPOCH + datetime.timedelta(seconds = seconds)).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def _seconds(timestamp):
+    parsed = datetime.datetime.strptime(timestamp, '%Y-%m-%dT%H:%M:%SZ').replace(tzinfo = datetime.timezone.utc)
+
+    return int((parsed - EPOCH).total_seconds())
+
+
+def _sha(*parts):
+    return hashlib.sha1('|'.join(map(str, parts)).encode('UTF-8')).hexdigest()
+
+
+def _counts(rng, repo_count, total, minimum):
+    # Heavy tailed like the real snapshot, a few busy repos and a long tail of quiet ones
+
+    weights = [rng.paretovariate(1.1) for _ in range(repo_count)]
+    scale = max(total - minimum * repo_count, 0) / sum(weights)
+
+    return [minimum + int(weight * scale) for weight in weights]
+
+
+class SyntheticGithub:
+    # Records are rebuilt on demand from (seed, repo, number), so 1000x never has to fit in memory
+
+    def __init__(self, scale = 1, seed = 42):
+        self.scale = parse_scale(scale)
+        self.seed = seed
+        rng = random.Random(seed)
+
+        repo_count = max(1, int(BASELINE['repos'] * self.scale))
+        owner_count = -(-repo_count // REPOS_PER_OWNER)
+
+        self.owners = [f'synthetic-org-{number:04d}' for number in range(owner_count)]
+        self.owner_numbers = {owner : number for number, owner in enumerate(self.owners)}
+        self.user_count = max(1, int(BASELINE['users'] * self.scale))
+        self.issue_counts = _counts(rng, repo_count, int(BASELINE['issues'] * self.scale), 0)
+        self.branch_counts = _counts(rng, repo_count, int(BASELINE['branches'] * self.scale), 1)
+        self.repo_names = [f'{self.owners[index // REPOS_PER_OWNER]}/repo-{index:06d}' for index in range(repo_count)]
+        self.repo_index = {full_name : index for index, full_name in enumerate(self.repo_names)}
+
+        # Roughly the snapshot's mix, most repos are tracked and a few are archived or forks
+
+        self.repo_flags = [
+            {'archived' : rng.random() < 0.12, 'fork' : rng.random() < 0.01}
+            for _ in range(repo_count)
+        ]
+        self.issue_steps = [rng.randint(600, 86400) for _ in range(repo_count)]
+
+    @property
+    def totals(self):
+        return {
+            'owners' : len(self.owners),
+            'repos' : len(self.repo_names),
+            'issues' : sum(self.issue_counts),
+            'branches' : sum(self.branch_counts)
+        }
+
+    def tracked_repo_names(self):
+        return [
+            full_name for full_name, flags in zip(self.repo_names, self.repo_flags)
+            if not flags['archived'] and not flags['fork']
+        ]
+
+    def owner_repo_indexes(self, owner):
+        start = self.owner_numbers[owner] * REPOS_PER_OWNER
+
+        return range(start, min(start + REPOS_PER_OWNER, len(self.repo_names)))
+
+    def _user(self, rng):
+        user_id = 1000 + rng.randrange(self.user_count)
+
+        return {
+            'login' : f'synthetic-user-{user_id}',
+            'id' : user_id,
+            'node_id' : f'U_{_sha("user", user_id)[:16]}',
+            'type' : 'User',
+            'site_admin' : False
+        }
+
+    def repo(self, index):
+        rng = random.Random(f'{self.seed}:repo:{index}')
+        owner, name = self.repo_names[index].split('/')
+        owner_id = 5000000 + index // REPOS_PER_OWNER
+        created = rng.randint(0, 20000000)
+        stars = int(rng.paretovariate(1.2)) - 1
+
+        return {
+            'id' : 100000000 + index,
+            'node_id' : f'R_{_sha("repo", self.seed, index)[:16]}',
+            'name' : name,
+            'full_name' : self.repo_names[index],
+            'private' : False,
+            'owner' : {
+                'login' : owner,
+                'id' : owner_id,
+                'node_id' : f'O_{_sha("owner", owner_id)[:16]}',
+                'url' : f'https://api.github.com/users/{owner}',
+                'type' : 'Organization',
+                'site_admin' : False
+            },
+            'html_url' : f'https://github.com/{self.repo_names[index]}',
+            'description' : rng.choice([None, f'Synthetic repository {index}']),
+            'fork' : self.repo_flags[index]['fork'],
+            'url' : f'https://api.github.com/repos/{self.repo_names[index]}',
+            'created_at' : _timestamp(created),
+            'updated_at' : _timestamp(created + rng.randint(0, 10000000)),
+            'pushed_at' : _timestamp(created + rng.randint(0, 10000000)),
+            'size' : rng.randint(0, 500000),
+            'stargazers_count' : stars,
+            'watchers_count' : stars,
+            'language' : rng.choice(LANGUAGES),
+            'has_issues' : True,
+            'forks_count' : stars // 10,
+            'archived' : self.repo_flags[index]['archived'],
+            'disabled' : False,
+            'open_issues_count' : self.issue_counts[index],
+            'license' : None,
+            'topics' : rng.sample(TOPICS, rng.randint(0, 3)),
+            'visibility' : 'public',
+            'forks' : stars // 10,
+            'open_issues' : self.issue_counts[index],
+            'watchers' : stars,
+            'default_branch' : 'main'
+        }
+
+    # Issue n is updated at (n + 1) * step seconds after EPOCH, so update order is number order
+
+    def issue_updated_seconds(self, index, position):
+        return (position + 1) * self.issue_steps[index]
+
+    def first_issue_since(self, index, since):
+        since_seconds = _seconds(since)
+
+        return bisect.bisect_left(
+            range(self.issue_counts[index]),
+            since_seconds,
+            key = lambda position: self.issue_updated_seconds(index, position)
+        )
+
+    def issue(self, index, position):
+        rng = random.Random(f'{self.seed}:issue:{index}:{position}')
+        full_name = self.repo_names[index]
+        number = position + 1
+        updated = self.issue_updated_seconds(index, position)
+        created = updated - rng.randint(0, self.issue_steps[index])
+        is_pull = rng.random() < 0.25
+        assignee = self._user(rng) if rng.random() < 0.15 else None
+
+        return {
+            'url' : f'https://api.github.com/repos/{full_name}/issues/{number}',
+            'repository_url' : f'https://api.github.com/repos/{full_name}',
+            'html_url' : f'https://github.com/{full_name}/issues/{number}',
+            'id' : 2000000000 + index * 1000000 + position,
+            'node_id' : f'I_{_sha("issue", self.seed, index, position)[:16]}',
+            'number' : number,
+            'title' : f'Synthetic issue {number} in repo {index}',
+            'user' : self._user(rng),
+            'labels' : [
+                {'id' : 9000 + LABELS.index(label), 'name' : label, 'color' : 'ededed', 'default' : label == 'bug'}
+                for label in rng.sample(LABELS, rng.choice([0, 0, 0, 1, 2]))
+            ],
+            'state' : 'open',
+            'locked' : rng.random() < 0.01,
+            'assignee' : assignee,
+            'assignees' : [assignee] if assignee else [],
+            'comments' : int(rng.paretovariate(1.5)) - 1,
+            'created_at' : _timestamp(created),
+            'updated_at' : _timestamp(updated),
+            'closed_at' : None,
+            'author_association' : 'NONE',
+            'pull_request' : {
+                'url' : f'https://api.github.com/repos/{full_name}/pulls/{number}',
+                'merged_at' : None
+            } if is_pull else None,
+            'body' : rng.choice([None, 'Steps to reproduce the problem.'])
+        }
+
+    def branch(self, index, position):
+        full_name = self.repo_names[index]
+        sha = _sha('branch', self.seed, index, position)
+
+        return {
+            'name' : 'main' if position == 0 else f'feature/synthetic-{position}',
+            'commit' : {
+                'sha' : sha,
+                'url' : f'https://api.github.com/repos/{full_name}/commits/{sha}'
+            },
+            'protected' : position == 0
+        }
+
+    def repos_for(self, owner):
+        return [self.repo(index) for index in self.owner_repo_indexes(owner)]
+
+    def issues_for(self, full_name):
+        index = self.repo_index[full_name]
+
+        return [self.issue(index, position) for position in range(self.issue_counts[index])]
+
+    def branches_for(self, full_name):
+        index = self.repo_index[full_name]
+
+        return [self.branch(index, position) for position in range(self.branch_counts[index])]
+
+
+def write_raw(dataset, raw_dir, compression = None):
+    # Writes raw files the way extract.py leaves them, tagged and ready for CleanData
+
+    from utils.raw_storage import RawWriter
+
+    with RawWriter(raw_dir, 'repos_raw', compression) as writer:
+        for owner in dataset.owners:
+            writer.write(dataset.repos_for(owner))
+
+    with RawWriter(raw_dir, 'issues_raw', compression) as issue_writer, RawWriter(raw_dir, 'branches_raw', compression) as branch_writer:
+        for full_name in dataset.tracked_repo_names():
+            tags = {'repo_full_name' : full_name, 'repo_name' : full_name.split('/', 1)[1]}
+            issue_writer.write([{**issue, **tags} for issue in dataset.issues_for(full_name)])
+            branch_writer.write([{**branch, **tags} for branch in dataset.branches_for(full_name)])
+
+    return {'repos' : writer.records, 'issues' : issue_writer.records, 'branches' : branch_writer.records}
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Write a seeded synthetic raw dataset.')
+    parser.add_argument('--scale', default = '10x', help = 'one of 1x, 10x, 100x, 1000x or any multiple')
+    parser.add_argument('--seed', type = int, default = 42)
+    parser.add_argument('--out', required = True, help = 'raw data directory to write')
+    parser.add_argument('--compression', choices = ['gzip', 'zstd'])
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok = True)
+    dataset = SyntheticGithub(args.scale, args.seed)
+    counts = write_raw(dataset, args.out, args.compression)
+
+    print(f'{args.scale}: ' + ', '.join(f'{count} {name}' for name, count in counts.items()))
+
+
+if __name__ == '__main__':
+    main()
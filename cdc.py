@@ -0,0 +1,191 @@
+import io
+import os
+import json
+import uuid
+import pandas as pd
+from pathlib import Path
+from config import CLEAN_DIR, DELTA_DIR, STATE_DIR
+from utils.issue_log import log_issue
+from utils.columnar import read_parquet
+from utils.metrics import METRICS
+
+ENTITY_KEYS = {
+    'owners' : 'owner_id',
+    'users' : 'user_id',
+    'repos' : 'repo_id',
+    'issues' : 'issue_id',
+    'branches' : 'branch_id',
+    'labels' : 'label_id',
+    'topics' : 'topic_id',
+    'issue_labels' : 'issue_label_id',
+    'repo_topics' : 'repo_topic_id'
+}
+
+# Columns that change every run without the entity changing
+
+VOLATILE_COLS = {
+    'branches' : ['ingested_at']
+}
+
+DELTA_KINDS = ['insert', 'update', 'delete']
+
+class ChangeCapture:
+    def __init__(self):
+        self.clean_dir = CLEAN_DIR
+        self.input_format = 'csv'
+        self.delta_dir = DELTA_DIR
+        self.snapshot_dir = os.path.join(STATE_DIR, 'cdc')
+        self.pending_snapshots = {}
+        self.delta_counts = {}
+        self.capture_id = None
+
+        os.makedirs(self.snapshot_dir, exist_ok = True)
+
+    def _log_issue(self, message):
+        log_issue(message)
+
+    def _snapshot_path(self, entity):
+        return Path(self.snapshot_dir) / f'{entity}_hashes.csv'
+
+    def delta_path(self, entity, kind):
+        return Path(self.delta_dir) / f'{entity}_{kind}.csv'
+
+    def _read_json(self, path):
+        if not path.exists():
+            return {}
+
+        with open(path, 'r', encoding = 'UTF-8') as file:
+            return json.load(file)
+
+    def _write_json(self, path, data):
+        tmp_path = path.with_suffix('.json.tmp')
+
+        with open(tmp_path, 'w', encoding = 'UTF-8') as file:
+            json.dump(data, file, indent = 4)
+
+        os.replace(tmp_path, path)
+
+    def committed_capture(self):
+        # Id of the capture the snapshots were last moved forward to
+
+        return self._read_json(Path(self.snapshot_dir) / 'capture.json').get('capture_id')
+
+    def delta_manifest(self):
+        # Which capture wrote the delta files on disk and which committed capture it diffed against
+
+        return self._read_json(Path(self.delta_dir) / 'capture.json')
+
+    def _start_capture(self):
+        if self.capture_id is not None:
+            return
+
+        self.capture_id = uuid.uuid4().hex
+        self._write_json(Path(self.delta_dir) / 'capture.json', {
+            'capture_id' : self.capture_id,
+            'previous_id' : self.committed_capture()
+        })
+
+    def _row_hashes(self, df, entity):
+        key = ENTITY_KEYS[entity]
+        hash_cols = [col for col in df.columns if col != key and col not in VOLATILE_COLS.get(entity, [])]
+
+        # Hashing the CSV text keeps the hash stable no matter how pandas infers dtypes
+
+        return pd.util.hash_pandas_object(df[hash_cols], index = False)
+
+    def _read_previous(self, entity):
+        snapshot_path = self._snapshot_path(entity)
+
+        if not snapshot_path.exists():
+            return pd.DataFrame(columns = [ENTITY_KEYS[entity], 'row_hash']).astype({'row_hash' : 'uint64'})
+
+        return pd.read_csv(snapshot_path, dtype = {ENTITY_KEYS[entity] : str, 'row_hash' : 'uint64'})
+
+    def _read_clean(self, entity):
+        # Parquet snapshots go through the same CSV text, so the row hashes don't depend on the format
+
+        if self.input_format == 'parquet':
+            source = io.StringIO(read_parquet(self.clean_dir, f'{entity}_clean').to_csv(index = False))
+        else:
+            source = Path(self.clean_dir) / f'{entity}_clean.csv'
+
+        return pd.read_csv(
+            source,
+            dtype = str,
+            keep_default_na = False,
+            encoding = 'UTF-8'
+        )
+
+    def capture(self, entity):
+        self._start_capture()
+        key = ENTITY_KEYS[entity]
+        current = self._read_clean(entity)
+
+        snapshot = pd.DataFrame({
+            key : current[key],
+            'row_hash' : self._row_hashes(current, entity).to_numpy()
+        })
+
+        diff = snapshot.merge(
+            self._read_previous(entity),
+            on = key,
+            how = 'outer',
+            suffixes = ('', '_prev'),
+            indicator = True
+        )
+
+        insert_keys = diff.loc[diff['_merge'] == 'left_only', key]
+        update_keys = diff.loc[(diff['_merge'] == 'both') & (diff['row_hash'] != diff['row_hash_prev']), key]
+        delete_keys = diff.loc[diff['_merge'] == 'right_only', [key]]
+
+        deltas = {
+            'insert' : current[current[key].isin(insert_keys)],
+            'update' : current[current[key].isin(update_keys)],
+            'delete' : delete_keys
+        }
+
+        for kind, delta_df in deltas.items():
+            delta_df.to_csv(self.delta_path(entity, kind), index = False, encoding = 'UTF-8')
+
+        # Snapshots only move forward once the loader has applied these deltas
+
+        self.pending_snapshots[entity] = snapshot
+        self.delta_counts[entity] = {kind : len(delta_df) for kind, delta_df in deltas.items()}
+
+        for kind, count in self.delta_counts[entity].items():
+            METRICS.counter('cdc_rows_total', 'Changed rows captured per entity and kind').inc(count, entity = entity, kind = kind)
+
+        self._log_issue(
+            f'{entity.upper()} - Changes | {len(deltas["insert"])} inserts, '
+            f'{len(deltas["update"])} updates, {len(deltas["delete"])} deletes, '
+            f'{len(current) - len(deltas["insert"]) - len(deltas["update"])} unchanged.'
+        )
+
+        return self.delta_counts[entity]
+
+    def capture_all(self):
+        for entity in ENTITY_KEYS:
+            self.capture(entity)
+
+        return self.delta_counts
+
+    def retry_later(self, entity, keys):
+        # Rows the loader quarantined keep their previous hash, so the next run sees them as changed again
+
+        key = ENTITY_KEYS[entity]
+        snapshot = self.pending_snapshots[entity]
+        previous = self._read_previous(entity)
+        held = snapshot[key].isin(keys)
+
+        self.pending_snapshots[entity] = pd.concat([snapshot[~held], previous[previous[key].isin(keys)]], ignore_index = True)
+
+    def commit(self):
+        for entity, snapshot in self.pending_snapshots.items():
+            tmp_path = self._snapshot_path(entity).with_suffix('.csv.tmp')
+            snapshot.to_csv(tmp_path, index = False, encoding = 'UTF-8')
+            os.replace(tmp_path, self._snapshot_path(entity))
+
+        if self.capture_id is not None:
+            self._write_json(Path(self.snapshot_dir) / 'capture.json', {'capture_id' : self.capture_id})
+
+        self.pending_snapshots = {}
@@ -4,6 +4,15 @@ BASE_DIR = 'data'
 RAW_DIR = os.path.join(BASE_DIR, 'raw_data')
 CLEAN_DIR = os.path.join(BASE_DIR, 'clean_data')
 ISSUES_DIR = os.path.join(BASE_DIR, 'issue_log')
+CACHE_DIR = os.path.join(BASE_DIR, 'cache')
+STATE_DIR = os.path.join(BASE_DIR, 'state')
+DELTA_DIR = os.path.join(BASE_DIR, 'delta_data')
+METRICS_DIR = os.path.join(BASE_DIR, 'metrics')
+REJECT_DIR = os.path.join(BASE_DIR, 'rejects')
 
-for directory in [RAW_DIR, CLEAN_DIR, ISSUES_DIR]:
-    os.makedirs(directory, exist_ok = True)
\ No newline at end of file
+for directory in [RAW_DIR, CLEAN_DIR, ISSUES_DIR, CACHE_DIR, STATE_DIR, DELTA_DIR, METRICS_DIR, REJECT_DIR]:
+    os.makedirs(directory, exist_ok = True)
+
+# Owners extracted by default, GITHUB_OWNERS in pipeline.env overrides this list
+
+OWNERS = ['microsoft']
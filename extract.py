@@ -1,10 +1,27 @@
 import json
+import asyncio
+import aiohttp
 import requests
 import os
-import datetime
+import time
+import shutil
+import multiprocessing
+from itertools import islice
+from urllib.parse import urlparse, parse_qs
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from dotenv import load_dotenv
-from config import RAW_DIR, ISSUES_DIR
+from config import RAW_DIR, CACHE_DIR, STATE_DIR
+from utils.response_cache import ResponseCache
+from utils.watermarks import WatermarkStore
+from utils.checkpoint import ExtractCheckpoint
+from utils.raw_storage import RawWriter, raw_file_path, iter_raw_records
+from utils.fields import project_records
+from utils.rate_limit import RateLimitScheduler, load_token_pool
+from utils.sharding import load_owners, shard_repos, split_tokens
+from utils.issue_log import log_issue
+from utils.http_transport import HttpTransport, RETRY_STATUSES, RETRY_EXCEPTIONS
+from utils.metrics import METRICS
 
 class ExtractData:
     def __init__ (self):
@@ -12,157 +29,589 @@ class ExtractData:
         self.pat = os.getenv('GITHUB_TOKEN')
         self.base_url = 'https://api.github.com/'
         self.headers = {
-           'Authorization' : f'Bearer {self.pat}',
            'Accept' : 'application/vnd.github+json',
            'User-Agent' : 'github-issues-pipeline'
         }
         self.max_pages = 3
         self.per_page = 100
-        self.owner = 'microsoft'
+        self.owners = load_owners()
+        self.async_mode = False
+        self.raw_compression = None
 
-    def _write_to_file(self, file_name, file_contents):
-        curr_path = Path(RAW_DIR) / f'{file_name}.json'
-        backup_path = Path(RAW_DIR) / f'{file_name}_backup.json'
+        # Only the fields in utils/fields.py are written to the raw files, turn off to keep full payloads for debugging
 
-        if backup_path.exists():
-            backup_path.unlink()
-        
-        if curr_path.exists():
-            curr_path.rename(backup_path)
+        self.project_payloads = True
+        self.concurrency = {
+            'repos' : 8,
+            'issues' : 8,
+            'branches' : 8
+        }
+        self.cache = ResponseCache(CACHE_DIR)
+        self.cache.evict()
+        self.watermarks = WatermarkStore(os.path.join(STATE_DIR, 'issue_watermarks.json'))
+        self.requests_per_second = 10
+        self.burst = 20
+        self.shard_workers = os.cpu_count()
+        self.shard_by = 'owner'
+        self.scheduler = RateLimitScheduler(load_token_pool(), self.requests_per_second, self.burst)
+
+        # Issues and branches can be fetched at the same time, so the pool covers both
 
-        with open(os.path.join(RAW_DIR, f'{file_name}.json'), 'w', encoding = 'UTF-8') as file:
-            json.dump(file_contents, file, ensure_ascii = False, indent = 4)
+        self.transport = HttpTransport.shared()
+        self.transport.ensure_pool_size(sum(self.concurrency.values()))
 
     def _log_issue(self, message):
-        timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        log_issue(message)
+
+
+    def _parse_links(self, link_header):
+        if not link_header:
+            return {}
+
+        return {link['rel']: link['url'] for link in requests.utils.parse_header_links(link_header)}
+
+    def _last_page(self, links, page_limit):
+        if 'last' not in links:
+            return None
+
+        last_page = int(parse_qs(urlparse(links['last']).query)['page'][0])
+
+        if page_limit is not None:
+            last_page = min(last_page, page_limit)
+
+        return last_page
+
+    def _request_headers(self, token, url, params, conditional = True):
+        return {
+            **self.headers,
+            'Authorization' : f'Bearer {token}',
+            **(self.cache.conditional_headers(url, params) if conditional else {})
+        }
+
+    def _record_response(self, url, status, seconds, size):
+        endpoint = urlparse(url).path.rstrip('/').rsplit('/', 1)[-1]
+
+        METRICS.counter('http_requests_total', 'Github API requests by endpoint and status').inc(endpoint = endpoint, status = status)
+        METRICS.histogram('http_request_seconds', 'Github API request latency').observe(seconds, endpoint = endpoint)
+        METRICS.counter('http_response_bytes_total', 'Bytes downloaded from the Github API').inc(size, endpoint = endpoint)
+
+    def _get_page(self, url, params, conditional = True):
+        attempt = 0
+
+        while True:
+            token = self.scheduler.acquire()
+            start = time.perf_counter()
+            resp = self.transport.get(
+                url,
+                headers = self._request_headers(token, url, params, conditional),
+                params = params
+            )
+            self._record_response(url, resp.status_code, time.perf_counter() - start, len(resp.content))
+            self.scheduler.update(token, resp.headers)
+
+            delay = self.scheduler.retry_delay(resp.status_code, resp.headers, attempt, resp.text)
+
+            if delay is None:
+                break
+
+            self._log_issue(f'Rate limited ({resp.status_code}) on {url}, retrying in {delay:.1f}s.')
+            time.sleep(delay)
+            attempt += 1
+
+        if resp.status_code == 304:
+            cached = self.cache.get(url, params)
+
+            # Evicted or unreadable since the request went out, so the page is fetched again without the ETag
+
+            if cached is None and conditional:
+                self._log_issue(f'Cache miss on 304 for {url}, refetching unconditionally.')
+                return self._get_page(url, params, conditional = False)
+
+            records, link_header = cached
+            return records, self._parse_links(link_header)
+
+        resp.raise_for_status()
+        self.cache.store(url, params, resp.headers, resp.text)
+
+        return resp.json(), self._parse_links(resp.headers.get('Link'))
+
+    async def _get_page_async(self, session, url, params, conditional = True):
+        attempt = 0
+        transport_attempt = 0
+
+        while True:
+            token = await self.scheduler.acquire_async()
+            start = time.perf_counter()
+
+            try:
+                async with session.get(
+                    url,
+                    headers = self._request_headers(token, url, params, conditional),
+                    params = params
+                ) as resp:
+                    payload = await resp.read()
+
+            except RETRY_EXCEPTIONS as e:
+                delay = self.transport.retry_delay(transport_attempt, type(e).__name__)
+
+                if delay is None:
+                    raise
+
+                self._log_issue(f'Connection failed ({type(e).__name__}) on {url}, retrying in {delay:.1f}s.')
+                await asyncio.sleep(delay)
+                transport_attempt += 1
+                continue
+
+            self._record_response(url, resp.status, time.perf_counter() - start, len(payload))
+            self.scheduler.update(token, resp.headers)
+
+            # Server errors get the transport's retry budget, rate limits the scheduler's
+
+            if resp.status in RETRY_STATUSES:
+                delay = self.transport.retry_delay(transport_attempt, str(resp.status))
+                transport_attempt += 1
+            else:
+                delay = self.scheduler.retry_delay(resp.status, resp.headers, attempt, payload)
+                attempt += 1
+
+            if delay is None:
+                break
+
+            self._log_issue(f'Retrying ({resp.status}) on {url} in {delay:.1f}s.')
+            await asyncio.sleep(delay)
 
-        with open(os.path.join(ISSUES_DIR, 'pipeline_error_log.txt'), 'a', encoding = 'UTF-8') as issue_log:
-            issue_log.write(f'{timestamp}: {message}\n')
+        if resp.status == 304:
+            cached = self.cache.get(url, params)
 
+            if cached is None and conditional:
+                self._log_issue(f'Cache miss on 304 for {url}, refetching unconditionally.')
+                return await self._get_page_async(session, url, params, conditional = False)
+
+            records, link_header = cached
+            return records, self._parse_links(link_header)
+
+        resp.raise_for_status()
+        body = payload.decode(resp.get_encoding())
+        self.cache.store(url, params, resp.headers, body)
+
+        return json.loads(body), self._parse_links(resp.headers.get('Link'))
+
+    def report_cache(self):
+        METRICS.counter('http_cache_hits_total', 'Responses served from the ETag cache').inc(self.cache.hits)
+        METRICS.counter('http_cache_bytes_saved_total', 'Bytes served from the ETag cache').inc(self.cache.bytes_saved)
+        self._log_issue(
+            f'CACHE - Complete | {self.cache.hits} hits, {self.cache.misses} misses, '
+            f'{self.cache.bytes_saved} bytes served from cache.'
+        )
+        self.cache.reset_stats()
+
+    def _project(self, file_name, records):
+        if not self.project_payloads:
+            return records
+
+        return project_records(file_name, records)
+
+    def _is_tracked_repo(self, repo):
+        return not repo['visibility'] == 'private' and not repo['archived'] == True and not repo['fork'] == True
 
     def fetch_repos(self):
-        page = 1
         repo_names = []
-        repos_data = []
 
-        while page <= self.max_pages:
-            try:
-                resp = requests.get(
-                    f'{self.base_url}/users/{self.owner}/repos',
-                    headers = self.headers,
-                    params = {
-                        'per_page' : self.per_page,
-                        'page' : page
-                    }
+        def on_page(repos, position):
+            writer.write(self._project('repos_raw', repos))
+
+            for repo in repos:
+                if self._is_tracked_repo(repo):
+                    repo_names.append(repo['full_name'])
+
+        try:
+            with RawWriter(RAW_DIR, 'repos_raw', self.raw_compression) as writer:
+                for owner in self.owners:
+                    self._fetch_pages(
+                        f'{self.base_url}/users/{owner}/repos',
+                        params = {'per_page' : self.per_page},
+                        page_limit = self.max_pages,
+                        workers = self.concurrency['repos'],
+                        on_page = on_page
+                    )
+
+        except requests.exceptions.RequestException as e:
+            self._log_issue(e)
+            raise
+
+        except Exception as e:
+            self._log_issue(e)
+            raise
+
+        return repo_names
+
+    def _repo_params(self, repo, endpoint):
+        params = {'per_page' : self.per_page}
+
+        if endpoint == 'issues':
+            watermark = self.watermarks.get(repo)
+
+            # The API defaults to open issues only, an issue closed since the watermark would never come back
+
+            if watermark:
+                params.update({
+                    'since' : watermark,
+                    'state' : 'all',
+                    'sort' : 'updated',
+                    'direction' : 'asc'
+                })
+
+        return params
+
+    def _page_limit(self, endpoint):
+        # Issues are bounded by the watermark rather than a page cap
+
+        if endpoint == 'issues':
+            return None
+
+        return self.max_pages
+
+    def _first_page(self, positions):
+        return next((position for position in positions or [] if position['page'] == 1), None)
+
+    def _next_link(self, positions, first):
+        latest = max((positions or []) + [first], key = lambda position: position['page'])
+
+        return latest['page'], latest.get('next')
+
+    def _fetch_pages(self, url, params, page_limit, workers, on_page, positions = None):
+        # Positions are the pages a checkpoint already holds, the first one keeps the original params
+
+        first = self._first_page(positions)
+
+        if first is None:
+            page_records, links = self._get_page(url, {**params, 'page' : 1})
+            first = {'page' : 1, 'params' : params, 'last' : self._last_page(links, page_limit), 'next' : links.get('next')}
+            on_page(page_records, first)
+
+        params = first['params']
+        last_page = first['last']
+
+        # With the page count advertised, the remaining pages can all be requested at once
+
+        if last_page is not None:
+            done = {position['page'] for position in positions or []}
+            missing = [page for page in range(2, last_page + 1) if page not in done]
+
+            with ThreadPoolExecutor(max_workers = workers) as pool:
+                pages = pool.map(
+                    lambda page: self._get_page(url, {**params, 'page' : page})[0],
+                    missing
                 )
 
-                resp.raise_for_status()
-                repos = resp.json()
+                for page, page_records in zip(missing, pages):
+                    on_page(page_records, {'page' : page})
+
+            return
+
+        page, next_link = self._next_link(positions, first)
+
+        while next_link and (page_limit is None or page < page_limit):
+            page_records, links = self._get_page(next_link, None)
+            page += 1
+            next_link = links.get('next')
+            on_page(page_records, {'page' : page, 'next' : next_link})
+
+    def _tag_repo(self, repo, endpoint, on_page, checkpoint = None):
+        def tagged(records, position):
+            for record in records:
+                record['repo_full_name'] = repo
+                record['repo_name'] = repo.split('/', 1)[1]
 
-                if repos == []:
-                    break
+            records = self._project(f'{endpoint}_raw', records)
 
-                repos_data.extend(repos)
+            # Journaled before it reaches the raw writer, whose output is dropped if the run fails
 
-                for repo in repos:
-                    if not repo['visibility'] == 'private' and not repo['archived'] == True and not repo['fork'] == True:
-                        repo_names.append(repo['name'])
+            if checkpoint is not None:
+                checkpoint.record(repo, position, records)
 
-                page += 1
-            
-            except requests.exceptions.RequestException as e:
-                self._log_issue(e)
-                raise
+            on_page(records)
 
-            except Exception as e:
-                self._log_issue(e)
-                raise
+        return tagged
 
-        self._write_to_file('repos_raw', repos_data)
+    def _fetch_repo_records(self, repo, endpoint, on_page, checkpoint = None):
+        try:
+            self._fetch_pages(
+                f'{self.base_url}/repos/{repo}/{endpoint}',
+                params = self._repo_params(repo, endpoint),
+                page_limit = self._page_limit(endpoint),
+                workers = self.concurrency[endpoint],
+                on_page = self._tag_repo(repo, endpoint, on_page, checkpoint),
+                positions = checkpoint.resume_positions(repo) if checkpoint else None
+            )
+
+            if checkpoint is not None:
+                checkpoint.complete(repo)
+
+        except requests.exceptions.RequestException as e:
+            self._log_issue(e)
+            raise
+
+        except Exception as e:
+            self._log_issue(e)
+            raise
+
+    async def _get_page_limited(self, session, semaphore, url, params):
+        async with semaphore:
+            return await self._get_page_async(session, url, params)
+
+    async def _get_numbered_page(self, session, semaphore, url, params, page):
+        page_records, _ = await self._get_page_limited(session, semaphore, url, {**params, 'page' : page})
+
+        return page, page_records
+
+    async def _fetch_pages_async(self, session, semaphore, url, params, page_limit, on_page, positions = None):
+        first = self._first_page(positions)
+
+        if first is None:
+            page_records, links = await self._get_page_limited(session, semaphore, url, {**params, 'page' : 1})
+            first = {'page' : 1, 'params' : params, 'last' : self._last_page(links, page_limit), 'next' : links.get('next')}
+            on_page(page_records, first)
+
+        params = first['params']
+        last_page = first['last']
+
+        if last_page is not None:
+            done = {position['page'] for position in positions or []}
+            pages = asyncio.as_completed([
+                self._get_numbered_page(session, semaphore, url, params, page)
+                for page in range(2, last_page + 1)
+                if page not in done
+            ])
+
+            for next_page in pages:
+                page, page_records = await next_page
+                on_page(page_records, {'page' : page})
+
+            return
+
+        page, next_link = self._next_link(positions, first)
+
+        while next_link and (page_limit is None or page < page_limit):
+            page_records, links = await self._get_page_limited(session, semaphore, next_link, None)
+            page += 1
+            next_link = links.get('next')
+            on_page(page_records, {'page' : page, 'next' : next_link})
+
+    async def _fetch_repo_records_async(self, session, semaphore, repo, endpoint, on_page, checkpoint = None):
+        await self._fetch_pages_async(
+            session,
+            semaphore,
+            f'{self.base_url}/repos/{repo}/{endpoint}',
+            params = self._repo_params(repo, endpoint),
+            page_limit = self._page_limit(endpoint),
+            on_page = self._tag_repo(repo, endpoint, on_page, checkpoint),
+            positions = checkpoint.resume_positions(repo) if checkpoint else None
+        )
+
+        if checkpoint is not None:
+            checkpoint.complete(repo)
+
+    async def _fetch_all_async(self, repo_names, endpoint, on_page, checkpoint = None):
+        limit = self.concurrency[endpoint]
+        semaphore = asyncio.Semaphore(limit)
+
+        async with self.transport.async_session(limit) as session:
+            await asyncio.gather(*(
+                self._fetch_repo_records_async(session, semaphore, repo, endpoint, on_page, checkpoint)
+                for repo in repo_names
+            ))
+
+    def _fetch_all(self, repo_names, endpoint, on_page, checkpoint = None):
+        if not self.async_mode:
+            for repo in repo_names:
+                self._fetch_repo_records(repo, endpoint, on_page, checkpoint)
+
+            return
+
+        try:
+            asyncio.run(self._fetch_all_async(repo_names, endpoint, on_page, checkpoint))
+
+        except aiohttp.ClientError as e:
+            self._log_issue(e)
+            raise
+
+        except Exception as e:
+            self._log_issue(e)
+            raise
+
+    def _carry_forward(self, writer, previous_path, changed_ids):
+        # Carry forward every previously extracted issue that did not change this run
+
+        if not previous_path.exists():
+            return
+
+        unchanged = []
+
+        for issue in iter_raw_records(previous_path):
+            if issue['id'] not in changed_ids:
+                unchanged.append(issue)
+
+            # Issues from a run that kept full payloads shrink as they are carried forward
+
+            if len(unchanged) >= self.per_page:
+                writer.write(self._project('issues_raw', unchanged))
+                unchanged = []
+
+        writer.write(self._project('issues_raw', unchanged))
+
+    def _checkpoint(self, raw_dir, file_name):
+        return ExtractCheckpoint(Path(raw_dir or RAW_DIR) / 'checkpoints', file_name)
+
+    def _replay_checkpoint(self, checkpoint, repo_names, on_page):
+        # Pages a failed run already fetched go straight to the new output, only the rest is requested again
+
+        if not checkpoint.resumed:
+            return
+
+        replayed = 0
+
+        for _, _, records in checkpoint.replay(repo_names):
+            on_page(records)
+            replayed += len(records)
+
+        METRICS.counter('extract_resumed_records_total', 'Records restored from an extraction checkpoint').inc(replayed, file = checkpoint.path.stem)
+        self._log_issue(
+            f'{checkpoint.path.stem} - Resumed | {len(checkpoint.completed)} repos complete, '
+            f'{len(checkpoint.positions)} started, {replayed} records from the checkpoint.'
+        )
+
+    def fetch_issues(self, repo_names, raw_dir = None):
+        # With a raw_dir only this batch's changed issues are written there, merge_partitions finishes the job
+
+        previous_path = raw_file_path(RAW_DIR, 'issues_raw')
+        changed_ids = set()
+
+        def on_page(issues):
+            writer.write(issues)
+
+            for issue in issues:
+                changed_ids.add(issue['id'])
+                self.watermarks.advance(issue['repo_full_name'], issue.get('updated_at'))
+
+        with self._checkpoint(raw_dir, 'issues_raw') as checkpoint, RawWriter(raw_dir or RAW_DIR, 'issues_raw', self.raw_compression) as writer:
+            self._replay_checkpoint(checkpoint, repo_names, on_page)
+            self._fetch_all(checkpoint.pending(repo_names), 'issues', on_page, checkpoint)
+
+            if raw_dir is None:
+                self._carry_forward(writer, previous_path, changed_ids)
+
+        checkpoint.clear()
+
+        if raw_dir is None:
+            self.watermarks.save()
+
+        self._log_issue(f'ISSUES - Extracted | {len(changed_ids)} changed, {writer.records} total.')
+
+    def fetch_branches(self, repo_names, raw_dir = None):
+        with self._checkpoint(raw_dir, 'branches_raw') as checkpoint, RawWriter(raw_dir or RAW_DIR, 'branches_raw', self.raw_compression) as writer:
+            self._replay_checkpoint(checkpoint, repo_names, writer.write)
+            self._fetch_all(checkpoint.pending(repo_names), 'branches', writer.write, checkpoint)
+
+        checkpoint.clear()
+
+    def merge_partitions(self, file_name, partition_dirs):
+        previous_path = raw_file_path(RAW_DIR, file_name)
+        changed_ids = set()
+
+        with RawWriter(RAW_DIR, file_name, self.raw_compression) as writer:
+            for partition_dir in partition_dirs:
+                records = iter_raw_records(raw_file_path(partition_dir, file_name))
+
+                while batch := list(islice(records, self.per_page)):
+                    writer.write(batch)
+
+                    # Partitions may come from other processes, so watermarks are rebuilt from the records
+
+                    if file_name == 'issues_raw':
+                        for record in batch:
+                            changed_ids.add(record['id'])
+                            self.watermarks.advance(record['repo_full_name'], record.get('updated_at'))
+
+            if file_name == 'issues_raw':
+                self._carry_forward(writer, previous_path, changed_ids)
+
+        # Watermarks only advance once every partition is safely in the main raw file
+
+        if file_name == 'issues_raw':
+            self.watermarks.save()
+
+        self._log_issue(f'{file_name} - Merged | {len(partition_dirs)} partitions, {writer.records} records.')
+
+    def repo_names_from_raw(self):
+        repo_names = []
+
+        for repo in iter_raw_records(raw_file_path(RAW_DIR, 'repos_raw')):
+            if self._is_tracked_repo(repo):
+                repo_names.append(repo['full_name'])
 
         return repo_names
 
-    def fetch_issues(self, repo_names):
-        all_issues = []
-        
-        for repo in repo_names:
-            page = 1
-
-            while page <= self.max_pages:
-                try:
-                    resp = requests.get(
-                            f'{self.base_url}/repos/{self.owner}/{repo}/issues',
-                            headers = self.headers,
-                            params = {
-                                'per_page' : self.per_page,
-                                'page' : page
-                            }
-                        )
-                    
-                    resp.raise_for_status()
-                    issues = resp.json()
-
-                    if issues == []:
-                        break
-
-                    for issue in issues:
-                        issue['repo_name'] = repo
-                        all_issues.append(issue)
-
-                    page += 1
-                
-                except requests.exceptions.RequestException as e:
-                    self._log_issue(e)
-                    raise
+    def _shard_settings(self, rate_divisor):
+        return {
+            'base_url' : self.base_url,
+            'per_page' : self.per_page,
+            'max_pages' : self.max_pages,
+            'async_mode' : self.async_mode,
+            'raw_compression' : self.raw_compression,
+            'project_payloads' : self.project_payloads,
+            'concurrency' : self.concurrency,
+            'requests_per_second' : None if self.requests_per_second is None else self.requests_per_second / rate_divisor,
+            'burst' : max(1, self.burst // rate_divisor)
+        }
 
-                except Exception as e:
-                    self._log_issue(e)
-                    raise
-        
-        self._write_to_file('issues_raw', all_issues)
-        
-    
-    def fetch_branches(self, repo_names):
-        all_branches = []
-
-        for repo in repo_names:
-            page = 1
-
-            while page <= self.max_pages:
-                try:
-                    resp = requests.get(
-                        f'{self.base_url}/repos/{self.owner}/{repo}/branches',
-                        headers = self.headers,
-                        params = {
-                            'per_page' : self.per_page,
-                            'page' : page
-                        }
-                    )
+    def fetch_sharded(self, repo_names, endpoint, workers = None, shard_by = None):
+        file_name = f'{endpoint}_raw'
+        shards = shard_repos(repo_names, workers or self.shard_workers, shard_by or self.shard_by)
+        token_shards, rate_divisor = split_tokens(list(self.scheduler.tokens), len(shards))
+        settings = self._shard_settings(rate_divisor)
+        shard_root = Path(RAW_DIR) / 'shards' / endpoint
+        partition_dirs = [shard_root / f'shard_{shard_number:03d}' for shard_number in range(len(shards))]
 
-                    resp.raise_for_status()
-                    branches = resp.json()
+        # Spawned workers, forking a process that is already running threads can deadlock
 
-                    if branches == []:
-                        break
+        try:
+            with ProcessPoolExecutor(max_workers = len(shards), mp_context = multiprocessing.get_context('spawn')) as pool:
+                futures = [
+                    pool.submit(_extract_shard, type(self), settings, tokens, endpoint, shard, partition_dir)
+                    for shard, tokens, partition_dir in zip(shards, token_shards, partition_dirs)
+                ]
 
-                    for branch in branches:
-                        branch['repo_name'] = repo
-                        all_branches.append(branch)
+                for future in futures:
+                    METRICS.merge(future.result())
 
-                    page += 1
+            self.merge_partitions(file_name, partition_dirs)
 
-                except requests.exceptions.RequestException as e:
-                    self._log_issue(e)
-                    raise
-                
-                except Exception as e:
-                    self._log_issue(e)
-                    raise
+        # Shard directories hold the checkpoints, a failed run leaves them for the next one to resume
+
+        except Exception as e:
+            self._log_issue(f'{file_name} - Sharded extract failed: {e}')
+            raise
+
+        shutil.rmtree(shard_root, ignore_errors = True)
+
+        self._log_issue(f'{file_name} - Sharded | {len(repo_names)} repos across {len(shards)} shards by {shard_by or self.shard_by}.')
+
+def _extract_shard(extractor_class, settings, tokens, endpoint, repo_names, partition_dir):
+    extractor = extractor_class()
+
+    for attr, value in settings.items():
+        setattr(extractor, attr, value)
+
+    extractor.scheduler = RateLimitScheduler(tokens, extractor.requests_per_second, extractor.burst)
+    partition_dir.mkdir(parents = True, exist_ok = True)
+
+    if endpoint == 'issues':
+        extractor.fetch_issues(repo_names, raw_dir = partition_dir)
+    else:
+        extractor.fetch_branches(repo_names, raw_dir = partition_dir)
+
+    extractor.report_cache()
+
+    return METRICS.snapshot()
 
-        self._write_to_file('branches_raw', all_branches)
-        
-# extractor = ExtractData()
-# repo_names = extractor.fetch_repos()
-# extractor.fetch_issues(repo_names)
-# extractor.fetch_branches(repo_names)
-# print(len(repo_names))
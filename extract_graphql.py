@@ -0,0 +1,520 @@
+import time
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from extract import ExtractData
+from config import RAW_DIR
+from utils.raw_storage import RawWriter, raw_file_path
+from utils.http_transport import RETRY_STATUSES
+from utils.metrics import METRICS
+
+REPO_FIELDS = '''
+    databaseId
+    name
+    nameWithOwner
+    description
+    url
+    isPrivate
+    isFork
+    isArchived
+    isDisabled
+    visibility
+    createdAt
+    updatedAt
+    pushedAt
+    stargazerCount
+    forkCount
+    watchers { totalCount }
+    issues(states: [OPEN]) { totalCount }
+    pullRequests(states: [OPEN]) { totalCount }
+    primaryLanguage { name }
+    defaultBranchRef { name }
+    repositoryTopics(first: 20) { pageInfo { hasNextPage endCursor } nodes { topic { name } } }
+    owner { login ... on Organization { databaseId } ... on User { databaseId } }
+'''
+
+ISSUE_FIELDS = '''
+    databaseId
+    number
+    title
+    state
+    locked
+    createdAt
+    updatedAt
+    closedAt
+    author { login ... on User { databaseId } ... on Bot { databaseId } ... on Mannequin { databaseId } }
+    comments { totalCount }
+    labels(first: 20) { pageInfo { hasNextPage endCursor } nodes { name color } }
+    assignees(first: 10) { pageInfo { hasNextPage endCursor } nodes { login databaseId } }
+'''
+
+# Connections nested in a node only come with their first page, the rest is paged in through the parent.
+# Nested pages cost a lot less than the outer ones, so they are asked for in full
+
+NESTED_CONNECTIONS = {
+    'labels' : 'name color',
+    'assignees' : 'login databaseId',
+    'repositoryTopics' : 'topic { name }'
+}
+
+NESTED_PARENTS = {
+    'issues' : 'issue',
+    'pullRequests' : 'pullRequest'
+}
+
+# What the REST API shows for an author whose account was deleted
+
+GHOST_USER = {'login' : 'ghost', 'id' : 10137}
+
+# Each connection is one nested page, the REST issues endpoint also returns pull requests. Like the
+# REST requests, a first extract only asks for open ones and a watermarked one for every state
+
+CONNECTIONS = {
+    'issues' : {
+        'arguments' : 'first: {first}, after: ${after}, filterBy: {{since: ${since}, states: ${states}}}, orderBy: {{field: UPDATED_AT, direction: ASC}}',
+        'variables' : {'after' : 'String', 'since' : 'DateTime', 'states' : '[IssueState!]'},
+        'fields' : ISSUE_FIELDS
+    },
+    'pullRequests' : {
+        'arguments' : 'first: {first}, after: ${after}, states: ${states}, orderBy: {{field: UPDATED_AT, direction: DESC}}',
+        'variables' : {'after' : 'String', 'states' : '[PullRequestState!]'},
+        'fields' : ISSUE_FIELDS + '    mergedAt\n'
+    },
+    'refs' : {
+        'arguments' : 'first: {first}, after: ${after}, refPrefix: "refs/heads/"',
+        'variables' : {'after' : 'String'},
+        'fields' : 'name\n    target { oid }\n    branchProtectionRule { id }\n'
+    }
+}
+
+ENDPOINT_CONNECTIONS = {
+    'issues' : ['issues', 'pullRequests'],
+    'branches' : ['refs']
+}
+
+
+class GraphQLExtractData(ExtractData):
+    def __init__(self):
+        super().__init__()
+        self.batch_size = 25
+        self.include_pull_requests = True
+
+    @property
+    def graphql_url(self):
+        return f'{self.base_url.rstrip("/")}/graphql'
+
+    # Requests
+
+    def _post_query(self, query, variables):
+        attempt = 0
+        transport_attempt = 0
+
+        while True:
+            token = self.scheduler.acquire()
+            start = time.perf_counter()
+
+            try:
+                resp = self.transport.post(
+                    self.graphql_url,
+                    headers = {**self.headers, 'Authorization' : f'Bearer {token}'},
+                    json = {'query' : query, 'variables' : variables}
+                )
+
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                delay = self.transport.retry_delay(transport_attempt, type(e).__name__)
+
+                if delay is None:
+                    raise
+
+                transport_attempt += 1
+                time.sleep(delay)
+                continue
+
+            self._record_response(self.graphql_url, resp.status_code, time.perf_counter() - start, len(resp.content))
+            self.scheduler.update(token, resp.headers)
+
+            # Queries are read-only, so a POST is as safe to retry here as a GET
+
+            if resp.status_code in RETRY_STATUSES:
+                delay = self.transport.retry_delay(transport_attempt, str(resp.status_code))
+                transport_attempt += 1
+            else:
+                delay = self.scheduler.retry_delay(resp.status_code, resp.headers, attempt, resp.text)
+                attempt += 1
+
+            if delay is None:
+                break
+
+            self._log_issue(f'Retrying GraphQL query ({resp.status_code}) in {delay:.1f}s.')
+            time.sleep(delay)
+
+        resp.raise_for_status()
+        payload = resp.json()
+
+        # Missing or renamed repos come back as per-alias errors next to the data of every other repo
+
+        for error in payload.get('errors', []):
+            self._log_issue(f'GraphQL | {error.get("type", "ERROR")} at {error.get("path")}: {error.get("message")}')
+
+        if payload.get('data') is None:
+            raise Exception(f'GraphQL query failed: {payload.get("errors")}')
+
+        rate_limit = payload['data'].get('rateLimit') or {}
+        METRICS.counter('graphql_cost_total', 'GraphQL rate-limit points spent').inc(rate_limit.get('cost', 1))
+
+        return payload['data']
+
+    def _connection_query(self, requests_batch, since):
+        declarations = []
+        blocks = []
+        variables = {}
+
+        for number, (repo, connection, cursor) in enumerate(requests_batch):
+            spec = CONNECTIONS[connection]
+            owner, name = repo.split('/', 1)
+            names = {'owner' : f'owner{number}', 'name' : f'name{number}'}
+            names.update({variable : f'{variable}{number}' for variable in spec['variables']})
+
+            declarations += [f'${names["owner"]}: String!', f'${names["name"]}: String!']
+            declarations += [f'${names[variable]}: {kind}' for variable, kind in spec['variables'].items()]
+            variables.update({names['owner'] : owner, names['name'] : name, names['after'] : cursor})
+
+            if 'since' in spec['variables']:
+                variables[names['since']] = since.get(repo)
+
+            if 'states' in spec['variables']:
+                variables[names['states']] = None if since.get(repo) else ['OPEN']
+
+            arguments = spec['arguments'].format(first = self.per_page, after = names['after'], since = names.get('since'), states = names.get('states'))
+            blocks.append(
+                f'r{number}: repository(owner: ${names["owner"]}, name: ${names["name"]}) {{\n'
+                f'  {connection}({arguments}) {{\n'
+                f'    pageInfo {{ hasNextPage endCursor }}\n'
+                f'    nodes {{ {spec["fields"]} }}\n'
+                f'  }}\n'
+                f'}}'
+            )
+
+        query = f'query({", ".join(declarations)}) {{\n' + '\n'.join(blocks) + '\nrateLimit { cost remaining resetAt }\n}'
+
+        return query, variables
+
+    def _nested_query(self, requests_batch):
+        declarations = []
+        blocks = []
+        variables = {}
+
+        for number, (repo, connection, node, field, cursor) in enumerate(requests_batch):
+            owner, name = repo.split('/', 1)
+            declarations += [f'$owner{number}: String!', f'$name{number}: String!', f'$after{number}: String']
+            variables.update({f'owner{number}' : owner, f'name{number}' : name, f'after{number}' : cursor})
+            selection = f'{field}(first: 100, after: $after{number}) {{ pageInfo {{ hasNextPage endCursor }} nodes {{ {NESTED_CONNECTIONS[field]} }} }}'
+
+            if connection in NESTED_PARENTS:
+                declarations.append(f'$number{number}: Int!')
+                variables[f'number{number}'] = node['number']
+                selection = f'{NESTED_PARENTS[connection]}(number: $number{number}) {{ {selection} }}'
+
+            blocks.append(f'n{number}: repository(owner: $owner{number}, name: $name{number}) {{ {selection} }}')
+
+        query = f'query({", ".join(declarations)}) {{\n' + '\n'.join(blocks) + '\nrateLimit { cost remaining resetAt }\n}'
+
+        return query, variables
+
+    # Shape conversion, every record matches what the REST endpoints return for the fields CleanData reads
+
+    def _repo_record(self, node):
+        stars = node['stargazerCount']
+
+        return {
+            'id' : node['databaseId'],
+            'name' : node['name'],
+            'full_name' : node['nameWithOwner'],
+            'description' : node['description'],
+            'url' : f'{self.base_url}repos/{node["nameWithOwner"]}',
+            'html_url' : node['url'],
+            'topics' : [topic['topic']['name'] for topic in node['repositoryTopics']['nodes']],
+            'language' : (node['primaryLanguage'] or {}).get('name'),
+            'owner' : {
+                'login' : node['owner']['login'],
+                'id' : node['owner'].get('databaseId')
+            },
+            'visibility' : node['visibility'].lower(),
+            'private' : node['isPrivate'],
+            'disabled' : node['isDisabled'],
+            'fork' : node['isFork'],
+            'archived' : node['isArchived'],
+            'default_branch' : (node['defaultBranchRef'] or {}).get('name'),
+            'stargazers_count' : stars,
+            'watchers_count' : stars,
+            'forks_count' : node['forkCount'],
+            'forks' : node['forkCount'],
+            'open_issues_count' : node['issues']['totalCount'] + node['pullRequests']['totalCount'],
+            'created_at' : node['createdAt'],
+            'updated_at' : node['updatedAt'],
+            'pushed_at' : node['pushedAt']
+        }
+
+    def _user_record(self, node):
+        if node is None:
+            return None
+
+        return {'login' : node['login'], 'id' : node.get('databaseId')}
+
+    def _issue_record(self, repo, node):
+        assignees = [self._user_record(assignee) for assignee in node['assignees']['nodes']]
+        author = self._user_record(node['author']) or dict(GHOST_USER)
+
+        return {
+            'id' : node['databaseId'],
+            'number' : node['number'],
+            'title' : node['title'],
+            'repository_url' : f'{self.base_url}repos/{repo}',
+            'user' : author,
+            'state' : node['state'].lower(),
+            'locked' : node['locked'],
+            'comments' : node['comments']['totalCount'],
+            'labels' : [{'name' : label['name'], 'color' : label['color']} for label in node['labels']['nodes']],
+            'assignee' : assignees[0] if assignees else None,
+            'assignees' : assignees,
+            'pull_request' : {'merged_at' : node['mergedAt']} if 'mergedAt' in node else None,
+            'created_at' : node['createdAt'],
+            'updated_at' : node['updatedAt'],
+            'closed_at' : node['closedAt']
+        }
+
+    def _branch_record(self, node):
+        return {
+            'name' : node['name'],
+            'commit' : {'sha' : (node['target'] or {}).get('oid')},
+            'protected' : node['branchProtectionRule'] is not None
+        }
+
+    def _record(self, repo, connection, node):
+        if connection == 'refs':
+            return self._branch_record(node)
+
+        return self._issue_record(repo, node)
+
+    # Extraction
+
+    def _complete_nested(self, parents):
+        # Parents are (repo, connection, node), a node's nested connections are filled in place.
+        # A parent gone between the two queries keeps the pages it already has
+
+        pending = [
+            (repo, connection, node, field, node[field]['pageInfo']['endCursor'])
+            for repo, connection, node in parents for field in NESTED_CONNECTIONS
+            if field in node and node[field]['pageInfo']['hasNextPage']
+        ]
+
+        while pending:
+            batch, pending = pending[:self.batch_size], pending[self.batch_size:]
+            data = self._post_query(*self._nested_query(batch))
+
+            for number, (repo, connection, node, field, _) in enumerate(batch):
+                parent = data.get(f'n{number}')
+
+                if parent is not None and connection in NESTED_PARENTS:
+                    parent = parent[NESTED_PARENTS[connection]]
+
+                if parent is None:
+                    continue
+
+                page = parent[field]
+                node[field]['nodes'] += page['nodes']
+
+                if page['pageInfo']['hasNextPage']:
+                    pending.append((repo, connection, node, field, page['pageInfo']['endCursor']))
+
+    def fetch_repos(self):
+        repo_names = []
+        query = (
+            'query($login: String!, $after: String) {\n'
+            '  repositoryOwner(login: $login) {\n'
+            '    repositories(first: 100, after: $after, ownerAffiliations: [OWNER]) {\n'
+            '      pageInfo { hasNextPage endCursor }\n'
+            f'      nodes {{ {REPO_FIELDS} }}\n'
+            '    }\n'
+            '  }\n'
+            '  rateLimit { cost remaining resetAt }\n'
+            '}'
+        )
+
+        with RawWriter(RAW_DIR, 'repos_raw', self.raw_compression) as writer:
+            for owner in self.owners:
+                cursor = None
+
+                for _ in range(self.max_pages):
+                    data = self._post_query(query, {'login' : owner, 'after' : cursor})
+
+                    if data['repositoryOwner'] is None:
+                        self._log_issue(f'GraphQL | owner {owner} not found.')
+                        break
+
+                    connection = data['repositoryOwner']['repositories']
+                    self._complete_nested([(node['nameWithOwner'], None, node) for node in connection['nodes']])
+                    repos = [self._repo_record(node) for node in connection['nodes']]
+                    writer.write(self._project('repos_raw', repos))
+                    repo_names += [repo['full_name'] for repo in repos if self._is_tracked_repo(repo)]
+
+                    if not connection['pageInfo']['hasNextPage']:
+                        break
+
+                    cursor = connection['pageInfo']['endCursor']
+
+        return repo_names
+
+    def _keep_paging(self, connection, records, pages, watermark):
+        if connection == 'refs':
+            return pages < self.max_pages
+
+        # Pull requests come newest first, so paging stops once the last node of a page is older than the watermark.
+        # Called before the page is filtered down to the watermark
+
+        if connection == 'pullRequests' and watermark and records:
+            return records[-1]['updated_at'] >= watermark
+
+        return True
+
+    def _resume_connections(self, repo_names, connections, checkpoint, pending, pages, since, outstanding):
+        # A checkpointed connection continues from its last cursor, under the since it was started with
+
+        for repo in repo_names:
+            positions = checkpoint.resume_positions(repo) if checkpoint else []
+            since[repo] = positions[0]['since'] if positions else self.watermarks.get(repo)
+            outstanding[repo] = 0
+
+            for connection in connections:
+                latest = max((position for position in positions if position['connection'] == connection), key = lambda position: position['page'], default = None)
+
+                if latest is None:
+                    pending.append((repo, connection, None))
+                elif latest['next'] is not None:
+                    pending.append((repo, connection, latest['next']))
+                    pages[(repo, connection)] = latest['page']
+                else:
+                    continue
+
+                outstanding[repo] += 1
+
+            if checkpoint and outstanding[repo] == 0:
+                checkpoint.complete(repo)
+
+    def fetch_connections(self, repo_names, endpoint, on_records, checkpoint = None):
+        connections = [
+            connection for connection in ENDPOINT_CONNECTIONS[endpoint]
+            if connection != 'pullRequests' or self.include_pull_requests
+        ]
+        pending = []
+        pages = {}
+        since = {}
+        outstanding = {}
+        queries = 0
+
+        # Watermarks advance while pages come in, the filters stay fixed to the start of the run
+
+        self._resume_connections(repo_names, connections, checkpoint, pending, pages, since, outstanding)
+
+        def run_batch(batch):
+            data = self._post_query(*self._connection_query(batch, since))
+            self._complete_nested([
+                (repo, connection, node)
+                for number, (repo, connection, _) in enumerate(batch) if data.get(f'r{number}') is not None
+                for node in data[f'r{number}'][connection]['nodes']
+            ])
+
+            return data
+
+        # Each wave sends a few batched queries at once, mixing first pages and follow-up cursors from any repo
+
+        with ThreadPoolExecutor(max_workers = self.concurrency[endpoint]) as pool:
+            while pending:
+                batches = [pending[start:start + self.batch_size] for start in range(0, len(pending), self.batch_size)]
+                wave, pending = batches[:self.concurrency[endpoint]], [item for batch in batches[self.concurrency[endpoint]:] for item in batch]
+
+                for batch, data in zip(wave, pool.map(run_batch, wave)):
+                    queries += 1
+                    pending += self._handle_batch(batch, data, since, pages, on_records, checkpoint, outstanding)
+
+        self._log_issue(f'GraphQL - Extracted | {len(repo_names)} repos, {endpoint} in {queries} queries.')
+
+    def _handle_batch(self, batch, data, since, pages, on_records, checkpoint, outstanding):
+        follow_ups = []
+
+        for number, (repo, connection, _) in enumerate(batch):
+            repository = data.get(f'r{number}')
+
+            if repository is None:
+                self._finish_connection(repo, checkpoint, outstanding)
+                continue
+
+            page = repository[connection]
+            records = [self._record(repo, connection, node) for node in page['nodes']]
+            watermark = since[repo]
+            pages[(repo, connection)] = pages.get((repo, connection), 0) + 1
+            keep_paging = self._keep_paging(connection, records, pages[(repo, connection)], watermark)
+
+            if connection == 'pullRequests' and watermark:
+                records = [record for record in records if record['updated_at'] >= watermark]
+
+            for record in records:
+                record['repo_full_name'] = repo
+                record['repo_name'] = repo.split('/', 1)[1]
+
+            next_cursor = None
+
+            if page['pageInfo']['hasNextPage'] and keep_paging:
+                next_cursor = page['pageInfo']['endCursor']
+                follow_ups.append((repo, connection, next_cursor))
+
+            if checkpoint is not None:
+                checkpoint.record(repo, {'connection' : connection, 'page' : pages[(repo, connection)], 'next' : next_cursor, 'since' : watermark}, records)
+
+            on_records(connection, records)
+
+            if next_cursor is None:
+                self._finish_connection(repo, checkpoint, outstanding)
+
+        return follow_ups
+
+    def _finish_connection(self, repo, checkpoint, outstanding):
+        outstanding[repo] -= 1
+
+        if checkpoint is not None and outstanding[repo] == 0:
+            checkpoint.complete(repo)
+
+    def fetch_issues(self, repo_names, raw_dir = None):
+        # Same contract as ExtractData.fetch_issues, so streaming, sharding and merge_partitions work unchanged
+
+        previous_path = raw_file_path(RAW_DIR, 'issues_raw')
+        changed_ids = set()
+
+        def on_records(connection, issues):
+            writer.write(self._project('issues_raw', issues))
+
+            for issue in issues:
+                changed_ids.add(issue['id'])
+                self.watermarks.advance(issue['repo_full_name'], issue.get('updated_at'))
+
+        with self._checkpoint(raw_dir, 'issues_raw') as checkpoint, RawWriter(raw_dir or RAW_DIR, 'issues_raw', self.raw_compression) as writer:
+            self._replay_checkpoint(checkpoint, repo_names, lambda issues: on_records(None, issues))
+            self.fetch_connections(checkpoint.pending(repo_names), 'issues', on_records, checkpoint)
+
+            if raw_dir is None:
+                self._carry_forward(writer, previous_path, changed_ids)
+
+        checkpoint.clear()
+
+        if raw_dir is None:
+            self.watermarks.save()
+
+        self._log_issue(f'ISSUES - Extracted | {len(changed_ids)} changed, {writer.records} total.')
+
+    def fetch_branches(self, repo_names, raw_dir = None):
+        with self._checkpoint(raw_dir, 'branches_raw') as checkpoint, RawWriter(raw_dir or RAW_DIR, 'branches_raw', self.raw_compression) as writer:
+            write = lambda records: writer.write(self._project('branches_raw', records))
+
+            self._replay_checkpoint(checkpoint, repo_names, write)
+            self.fetch_connections(checkpoint.pending(repo_names), 'branches', lambda connection, records: write(records), checkpoint)
+
+        checkpoint.clear()
@@ -1,28 +1,53 @@
 import os
+import time
 import datetime
+import numpy as np
 import pandas as pd
+from pathlib import Path
 from sqlalchemy import text
 from sqlalchemy import create_engine
 from sqlalchemy.exc import OperationalError
-from config import CLEAN_DIR, ISSUES_DIR
+from config import CLEAN_DIR
 from dotenv import load_dotenv
+from utils.sql_tables import metadata, LOAD_ORDER
+from utils.columnar import read_parquet
+from utils.constraints import ConstraintValidator
+from utils.issue_log import log_issue
+from utils.metrics import METRICS
+from cdc import ChangeCapture
 
 class LoadData:
-    def __init__(self):
+    def __init__(self, connection_url = None):
         load_dotenv('pipeline.env')
         self.sql_user = os.getenv('DB_USER')
         self.sql_pass = os.getenv('DB_PASS')
         self.sql_db = os.getenv('DB_Name')
         self.sql_host = os.getenv('DB_HOST')
+        self.connection_url = connection_url
         self.engine = None
+        self.clean_dir = CLEAN_DIR
+        self.input_format = 'csv'
+        self.batch_size = 10000
+        self.batch_sizes = {}
+        self.load_stats = {}
+        self.validator = None
 
-    def _log_issue(self, message):
-        timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        # Users and owners are kept forever by the dimension store and repo deletes cascade, so only these are mirrored.
+        # Labels and topics stay like users do, the bridge rows go when a label or topic is taken off
+
+        self.apply_deletes = {'issues', 'branches', 'issue_labels', 'repo_topics'}
 
-        with open(os.path.join(ISSUES_DIR, 'pipeline_error_log.txt'), 'a', encoding = 'UTF-8') as issue_log:
-            issue_log.write(f'{timestamp}: {message}\n')
+    def _log_issue(self, message):
+        log_issue(message)
     
     def connect_db(self):
+        # Any SQLAlchemy URL (e.g. sqlite:///local.db) can stand in for SQL Server
+
+        if self.connection_url:
+            self.engine = create_engine(self.connection_url, future = True)
+            metadata.create_all(self.engine)
+            return
+
         connection_string = (
             f"mssql+pyodbc://{self.sql_user}:{self.sql_pass}"
             f"@{self.sql_host}/{self.sql_db}"
@@ -33,6 +58,7 @@ class LoadData:
         self.engine = create_engine(
             connection_string,
             pool_pre_ping = True,
+            fast_executemany = True,
             future = True
         )
 
@@ -53,8 +79,238 @@ class LoadData:
         except OperationalError as e:
             self._log_issue(f'Failed to connect to the database: {e}')
             raise ConnectionError('Failed to connect to SQL Server!') from e
-        
-    # remember to clean up the githubIDs from the clean datasets, these can be dropped as not needed in the database
-        
-loader = LoadData()
-loader.connect_db()
\ No newline at end of file
+
+    def _prepare_frame(self, table, df):
+        date_cols = [col.name for col in table.columns if col.type.python_type is datetime.datetime]
+        number_cols = [col.name for col in table.columns if col.type.python_type in (int, bool)]
+
+        # Only columns that exist in the table are loaded, github ids and logins stay behind
+
+        df = df[[col.name for col in table.columns if col.name in df.columns]]
+
+        for col in date_cols:
+            if col in df.columns:
+                df[col] = pd.to_datetime(df[col], errors = 'coerce', utc = True).dt.tz_convert(None)
+
+        # BIT columns hold 0/1 in the clean files, like INT columns they are cast from the table definition
+
+        for col in number_cols:
+            if col in df.columns:
+                df[col] = pd.to_numeric(df[col], errors = 'coerce').astype('Int64')
+
+        return df
+
+    def _read_csv(self, file_path):
+        # Read as text and cast by _prepare_frame, inference would turn a branch named 1.10 into 1.1
+        # or drop the leading zeros of an all-digit commit SHA on a small delta
+
+        return pd.read_csv(
+            file_path,
+            dtype = str,
+            encoding = 'UTF-8',
+            keep_default_na = False,
+            na_values = ['']
+        )
+
+    def _read_clean(self, table):
+        file_name = f'{table.name}_clean'
+
+        if self.input_format == 'parquet':
+            df = read_parquet(self.clean_dir, file_name)
+        else:
+            df = self._read_csv(Path(self.clean_dir) / f'{file_name}.csv')
+
+        return self._prepare_frame(table, df)
+
+    def _to_rows(self, df):
+        columns = {}
+
+        for col in df.columns:
+            # DBAPI drivers bind datetime.datetime and plain Python scalars, not pandas types
+
+            if pd.api.types.is_datetime64_any_dtype(df[col]):
+                values = np.array(df[col].dt.to_pydatetime(), dtype = object)
+            else:
+                values = np.array(df[col].to_numpy(dtype = object), dtype = object)
+
+            values[df[col].isna().to_numpy()] = None
+            columns[col] = values
+
+        return [dict(zip(columns, row)) for row in zip(*columns.values())]
+
+    def _stage_name(self, table):
+        if self.engine.dialect.name == 'mssql':
+            return f'#stage_{table.name}'
+
+        return f'stage_{table.name}'
+
+    def _create_stage(self, conn, table, columns):
+        stage = self._stage_name(table)
+        column_list = ', '.join(f'[{col}]' for col in columns)
+
+        if self.engine.dialect.name == 'mssql':
+            conn.execute(text(f'SELECT TOP 0 {column_list} INTO {stage} FROM {table.name}'))
+        else:
+            conn.execute(text(f'CREATE TEMP TABLE {stage} AS SELECT {column_list} FROM {table.name} WHERE 0 = 1'))
+
+        return stage
+
+    def _merge_sql(self, table, stage, columns):
+        keys = [col.name for col in table.primary_key.columns]
+        updates = [col for col in columns if col not in keys]
+        column_list = ', '.join(f'[{col}]' for col in columns)
+
+        if self.engine.dialect.name == 'mssql':
+            return (
+                f'MERGE {table.name} WITH (HOLDLOCK) AS target '
+                f'USING {stage} AS source '
+                'ON ' + ' AND '.join(f'target.[{key}] = source.[{key}]' for key in keys) + ' '
+                'WHEN MATCHED THEN UPDATE SET ' + ', '.join(f'target.[{col}] = source.[{col}]' for col in updates) + ' '
+                f'WHEN NOT MATCHED BY TARGET THEN INSERT ({column_list}) '
+                'VALUES (' + ', '.join(f'source.[{col}]' for col in columns) + ');'
+            )
+
+        # SQLite spells the same upsert as INSERT ... ON CONFLICT. It accepts the [col] quoting used throughout
+        # the loader, Postgres does not, so only SQL Server and SQLite are supported
+
+        return (
+            f'INSERT INTO {table.name} ({column_list}) '
+            f'SELECT {column_list} FROM {stage} WHERE 1 = 1 '
+            'ON CONFLICT (' + ', '.join(f'[{key}]' for key in keys) + ') '
+            'DO UPDATE SET ' + ', '.join(f'[{col}] = excluded.[{col}]' for col in updates)
+        )
+
+    def load_table(self, table, df):
+        batch_size = self.batch_sizes.get(table.name, self.batch_size)
+        columns = list(df.columns)
+        start = time.perf_counter()
+
+        with self.engine.begin() as conn:
+            stage = self._create_stage(conn, table, columns)
+            insert_sql = text(
+                f'INSERT INTO {stage} (' + ', '.join(f'[{col}]' for col in columns) + ') '
+                'VALUES (' + ', '.join(f':{col}' for col in columns) + ')'
+            )
+
+            for batch_start in range(0, len(df), batch_size):
+                rows = self._to_rows(df.iloc[batch_start:batch_start + batch_size])
+                conn.execute(insert_sql, rows)
+
+            conn.execute(text(self._merge_sql(table, stage, columns)))
+            conn.execute(text(f'DROP TABLE {stage}'))
+
+        elapsed = time.perf_counter() - start
+        rows_per_second = len(df) / elapsed if elapsed else 0
+
+        METRICS.counter('load_rows_total', 'Rows upserted per table').inc(len(df), table = table.name)
+        METRICS.histogram('load_seconds', 'Time spent staging and merging a table').observe(elapsed, table = table.name)
+        METRICS.gauge('load_rows_per_second', 'Upsert throughput of the last load per table').set(rows_per_second, table = table.name)
+
+        self.load_stats[table.name] = {
+            'rows' : len(df),
+            'seconds' : elapsed,
+            'rows_per_second' : rows_per_second
+        }
+        self._log_issue(f'{table.name.upper()} - Loaded | {len(df)} rows in {elapsed:.2f}s ({rows_per_second:.0f} rows/s).')
+
+    def _validate(self, table, df):
+        valid_df, reject_counts = self.validator.validate(table, df)
+
+        for constraint, count in reject_counts.items():
+            METRICS.counter('load_rows_rejected_total', 'Rows quarantined before load per table and constraint').inc(count, table = table.name, constraint = constraint)
+
+        if reject_counts:
+            self._log_issue(
+                f'{table.name.upper()} - Rejected | {len(df) - len(valid_df)} rows quarantined to '
+                f'{self.validator.reject_path(table.name)} (' + ', '.join(f'{name} {count}' for name, count in reject_counts.items()) + ').'
+            )
+
+        return valid_df
+
+    def load_all(self):
+        if self.engine is None:
+            self.connect_db()
+
+        self.validator = ConstraintValidator(self.clean_dir, self.input_format)
+
+        for table in LOAD_ORDER:
+            df = self._validate(table, self._read_clean(table))
+
+            if df.empty:
+                self._log_issue(f'{table.name.upper()} - Skipped | no rows to load.')
+                continue
+
+            try:
+                self.load_table(table, df)
+            except Exception as e:
+                self._log_issue(f'{table.name.upper()} - Load failed: {e}')
+                raise
+
+    def delete_keys(self, table, keys_df):
+        key = table.primary_key.columns.values()[0].name
+        start = time.perf_counter()
+
+        with self.engine.begin() as conn:
+            stage = self._create_stage(conn, table, [key])
+            conn.execute(
+                text(f'INSERT INTO {stage} ([{key}]) VALUES (:{key})'),
+                self._to_rows(keys_df[[key]])
+            )
+            conn.execute(text(f'DELETE FROM {table.name} WHERE [{key}] IN (SELECT [{key}] FROM {stage})'))
+            conn.execute(text(f'DROP TABLE {stage}'))
+
+        METRICS.counter('load_rows_deleted_total', 'Rows deleted per table').inc(len(keys_df), table = table.name)
+        self._log_issue(f'{table.name.upper()} - Deleted | {len(keys_df)} rows in {time.perf_counter() - start:.2f}s.')
+
+    def load_deltas(self, change_capture):
+        if self.engine is None:
+            self.connect_db()
+
+        self.validator = ConstraintValidator(self.clean_dir, self.input_format)
+
+        # Deletes run first, children first, so re-keyed rows free their unique slots before upserts run parents first
+
+        for table in reversed(LOAD_ORDER):
+            if table.name not in self.apply_deletes:
+                continue
+
+            keys_df = pd.read_csv(change_capture.delta_path(table.name, 'delete'), dtype = str)
+
+            if not keys_df.empty:
+                self.delete_keys(table, keys_df)
+
+        for table in LOAD_ORDER:
+            changed_df = pd.concat([
+                self._read_csv(change_capture.delta_path(table.name, kind))
+                for kind in ['insert', 'update']
+            ], ignore_index = True)
+
+            if changed_df.empty:
+                self._log_issue(f'{table.name.upper()} - Skipped | no changed rows.')
+                continue
+
+            changed_df = self._prepare_frame(table, changed_df)
+            valid_df = self._validate(table, changed_df)
+
+            if len(valid_df) < len(changed_df):
+                change_capture.retry_later(table.name, list(self.validator.rejected.get(table.name, ())))
+
+            if valid_df.empty:
+                continue
+
+            try:
+                self.load_table(table, valid_df)
+            except Exception as e:
+                self._log_issue(f'{table.name.upper()} - Load failed: {e}')
+                raise
+
+if __name__ == '__main__':
+    loader = LoadData()
+    loader.connect_db()
+
+    change_capture = ChangeCapture()
+    change_capture.input_format = loader.input_format
+    change_capture.capture_all()
+    loader.load_deltas(change_capture)
+    change_capture.commit()
+    METRICS.export()
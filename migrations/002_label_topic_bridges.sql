@@ -0,0 +1,160 @@
+USE incremental_load;
+
+GO
+
+IF NOT EXISTS (
+    SELECT 
+        1 
+    FROM sys.tables WHERE name = 'schema_migrations'
+)
+
+BEGIN
+    CREATE TABLE schema_migrations (
+        migration_name VARCHAR(255) PRIMARY KEY,
+        applied_at DATETIME2 DEFAULT SYSUTCDATETIME()
+    );
+END;
+
+SET XACT_ABORT ON;
+
+DECLARE @migration_name VARCHAR(255) = '002_label_topic_bridges';
+
+IF EXISTS (
+    SELECT 
+        1
+    FROM schema_migrations
+    WHERE migration_name = @migration_name
+)
+BEGIN
+    PRINT 'Migration already applied: ' + @migration_name;
+    RETURN;
+END;
+
+BEGIN TRY
+    BEGIN TRANSACTION;
+
+        IF NOT EXISTS (
+            SELECT
+                1
+            FROM sys.tables t
+            WHERE t.[name] = 'labels'
+                AND t.[type] = 'u'
+        )
+
+        BEGIN
+            CREATE TABLE labels (
+                label_id UNIQUEIDENTIFIER PRIMARY KEY,
+                label_name NVARCHAR (100) NOT NULL,
+                CONSTRAINT UQ_label_name
+                    UNIQUE (label_name)
+            );
+        END;
+
+        IF NOT EXISTS (
+            SELECT
+                1
+            FROM sys.tables t
+            WHERE t.[name] = 'topics'
+                AND t.[type] = 'u'
+        )
+
+        BEGIN
+            CREATE TABLE topics (
+                topic_id UNIQUEIDENTIFIER PRIMARY KEY,
+                topic_name VARCHAR (50) NOT NULL,
+                CONSTRAINT UQ_topic_name
+                    UNIQUE (topic_name)
+            );
+        END;
+
+        IF NOT EXISTS (
+            SELECT
+                1
+            FROM sys.tables t
+            WHERE t.[name] = 'issue_labels'
+                AND t.[type] = 'u'
+        )
+
+        BEGIN
+            CREATE TABLE issue_labels (
+                issue_label_id UNIQUEIDENTIFIER PRIMARY KEY,
+                issue_id UNIQUEIDENTIFIER NOT NULL,
+                label_id UNIQUEIDENTIFIER NOT NULL,
+                CONSTRAINT FK_issue_labels_issue_id
+                    FOREIGN KEY (issue_id)
+                    REFERENCES issues (issue_id) ON DELETE CASCADE,
+                CONSTRAINT FK_issue_labels_label_id
+                    FOREIGN KEY (label_id)
+                    REFERENCES labels (label_id) ON DELETE CASCADE,
+                CONSTRAINT UQ_issue_label
+                    UNIQUE (issue_id, label_id)
+            );
+        END;
+
+        IF NOT EXISTS (
+            SELECT
+                1
+            FROM sys.tables t
+            WHERE t.[name] = 'repo_topics'
+                AND t.[type] = 'u'
+        )
+
+        BEGIN
+            CREATE TABLE repo_topics (
+                repo_topic_id UNIQUEIDENTIFIER PRIMARY KEY,
+                repo_id UNIQUEIDENTIFIER NOT NULL,
+                topic_id UNIQUEIDENTIFIER NOT NULL,
+                CONSTRAINT FK_repo_topics_repo_id
+                    FOREIGN KEY (repo_id)
+                    REFERENCES repos (repo_id) ON DELETE CASCADE,
+                CONSTRAINT FK_repo_topics_topic_id
+                    FOREIGN KEY (topic_id)
+                    REFERENCES topics (topic_id) ON DELETE CASCADE,
+                CONSTRAINT UQ_repo_topic
+                    UNIQUE (repo_id, topic_id)
+            );
+        END;
+
+        IF NOT EXISTS (
+            SELECT
+                1
+            FROM sys.indexes i
+            WHERE i.[name] = 'IX_issue_labels_label_id'
+                AND i.[object_id] = OBJECT_ID('issue_labels')
+        )
+
+        BEGIN
+            CREATE INDEX IX_issue_labels_label_id
+                ON issue_labels (label_id)
+        END;
+
+        IF NOT EXISTS (
+            SELECT
+                1
+            FROM sys.indexes i
+            WHERE i.[name] = 'IX_repo_topics_topic_id'
+                AND i.[object_id] = OBJECT_ID('repo_topics')
+        )
+
+        BEGIN
+            CREATE INDEX IX_repo_topics_topic_id
+                ON repo_topics (topic_id)
+        END;
+
+            INSERT INTO schema_migrations (migration_name)
+    VALUES (@migration_name);
+
+    COMMIT TRANSACTION;
+    PRINT 'Migration applied: ' + @migration_name;
+END TRY
+BEGIN CATCH
+    ROLLBACK TRANSACTION;
+
+    DECLARE @msg NVARCHAR(4000) = ERROR_MESSAGE();
+    RAISERROR (
+        'Migration failed (%s): %s',
+        16, 1,
+        @migration_name,
+        @msg
+    );
+END CATCH;
\ No newline at end of file
@@ -0,0 +1,382 @@
+import os
+import json
+import time
+import queue
+import shutil
+import argparse
+import datetime
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from config import RAW_DIR, STATE_DIR
+from utils.raw_storage import raw_file_path
+from utils.issue_log import log_issue
+from utils.memory import peak_rss_mb
+from utils.metrics import METRICS
+
+class Stage:
+    def __init__(self, name, func, deps):
+        self.name = name
+        self.func = func
+        self.deps = deps
+
+class Pipeline:
+    def __init__(self, stream_batch_size = None, chunked = False, async_mode = False, connection_url = None, shard_workers = None, shard_by = 'owner', graphql = False, transform_workers = None, full_payloads = False):
+        self.stream_batch_size = stream_batch_size
+        self.shard_workers = shard_workers
+        self.shard_by = shard_by
+        self.chunked = chunked
+        self.transform_workers = transform_workers
+        self.async_mode = async_mode
+        self.graphql = graphql
+        self.full_payloads = full_payloads
+        self.connection_url = connection_url
+        self.state_path = Path(STATE_DIR) / 'pipeline_state.json'
+        self.partition_root = Path(RAW_DIR) / 'partitions'
+        self.partition_queues = {
+            'issues_raw' : queue.Queue(),
+            'branches_raw' : queue.Queue()
+        }
+        self.context = {}
+        self.planned = set()
+        self.state = {'stages' : {}, 'context' : self.context}
+        self._extractor = None
+        self._cleaner = None
+        self.stages = self._build_stages()
+
+    def _log_issue(self, message):
+        log_issue(message)
+
+    # Built on first use so stages that are skipped never need tokens or credentials
+
+    @property
+    def extractor(self):
+        if self._extractor is None:
+            if self.graphql:
+                from extract_graphql import GraphQLExtractData as ExtractData
+            else:
+                from extract import ExtractData
+
+            self._extractor = ExtractData()
+            self._extractor.async_mode = self.async_mode
+            self._extractor.project_payloads = not self.full_payloads
+
+        return self._extractor
+
+    @property
+    def cleaner(self):
+        if self._cleaner is None:
+            from transform import CleanData
+
+            self._cleaner = CleanData()
+            self._cleaner.transform_workers = self.transform_workers
+
+        return self._cleaner
+
+    def _build_stages(self):
+        streaming = self.stream_batch_size is not None
+
+        # When streaming, cleaning waits on partitions rather than on the whole extract stage
+
+        issue_deps = ['clean_repos'] if streaming else ['clean_repos', 'fetch_issues']
+        branch_deps = ['clean_repos'] if streaming else ['clean_repos', 'fetch_branches']
+
+        stages = [
+            Stage('validate_token', self.validate_token, []),
+            Stage('fetch_repos', self.fetch_repos, ['validate_token']),
+            Stage('fetch_issues', self.fetch_issues, ['fetch_repos']),
+            Stage('fetch_branches', self.fetch_branches, ['fetch_repos']),
+            Stage('clean_repos', self.clean_repos, ['fetch_repos']),
+            Stage('clean_owners', self.clean_owners, ['clean_repos']),
+            Stage('clean_branches', self.clean_branches, branch_deps),
+            Stage('clean_issues', self.clean_issues, issue_deps),
+            Stage('clean_users', self.clean_users, ['clean_issues']),
+            Stage('load', self.load, ['fetch_issues', 'fetch_branches', 'clean_owners', 'clean_branches', 'clean_users']),
+            Stage('aggregate', self.aggregate, ['load'])
+        ]
+
+        return {stage.name : stage for stage in stages}
+
+    def _repo_names(self):
+        if 'repo_names' not in self.context:
+            self.context['repo_names'] = self.extractor.repo_names_from_raw()
+
+        return self.context['repo_names']
+
+    def validate_token(self):
+        from auth import GithubAuth
+
+        GithubAuth().validate_token()
+
+    def fetch_repos(self):
+        self.context['repo_names'] = self.extractor.fetch_repos()
+
+    def _fetch_stream(self, file_name, fetch):
+        repo_names = self._repo_names()
+        partition_queue = self.partition_queues[file_name]
+        partition_dirs = []
+
+        try:
+            for batch_number, start in enumerate(range(0, len(repo_names), self.stream_batch_size)):
+                partition_dir = self.partition_root / f'{file_name}_{batch_number:04d}'
+                partition_dir.mkdir(parents = True, exist_ok = True)
+
+                fetch(repo_names[start:start + self.stream_batch_size], raw_dir = partition_dir)
+                partition_dirs.append(partition_dir)
+                partition_queue.put(raw_file_path(partition_dir, file_name))
+
+            self.extractor.merge_partitions(file_name, partition_dirs)
+
+            # Unchanged issues only exist in the merged file, so it goes through cleaning last
+
+            if file_name == 'issues_raw':
+                partition_queue.put(raw_file_path(RAW_DIR, file_name))
+
+        # The cleaner gets the failure instead of the end of the stream, so it fails too and reruns on resume
+
+        except BaseException as e:
+            partition_queue.put(e)
+            raise
+
+        partition_queue.put(None)
+
+    def fetch_issues(self):
+        if self.stream_batch_size:
+            self._fetch_stream('issues_raw', self.extractor.fetch_issues)
+        elif self.shard_workers:
+            self.extractor.fetch_sharded(self._repo_names(), 'issues', self.shard_workers, self.shard_by)
+        else:
+            self.extractor.fetch_issues(self._repo_names())
+
+    def fetch_branches(self):
+        if self.stream_batch_size:
+            self._fetch_stream('branches_raw', self.extractor.fetch_branches)
+        elif self.shard_workers:
+            self.extractor.fetch_sharded(self._repo_names(), 'branches', self.shard_workers, self.shard_by)
+        else:
+            self.extractor.fetch_branches(self._repo_names())
+
+    def clean_repos(self):
+        self.cleaner.clean_repos()
+
+    def clean_owners(self):
+        self.cleaner.clean_owners()
+
+    def _clean_stream(self, file_name, start, clean_partition, finish):
+        start()
+
+        while (file_path := self.partition_queues[file_name].get()) is not None:
+            if isinstance(file_path, BaseException):
+                raise RuntimeError(f'{file_name} stream stopped, the fetch failed') from file_path
+
+            clean_partition(file_path)
+
+        finish()
+
+    def _streams_from(self, fetch_stage):
+        return self.stream_batch_size and fetch_stage in self.planned
+
+    def clean_branches(self):
+        if self._streams_from('fetch_branches'):
+            self._clean_stream(
+                'branches_raw',
+                self.cleaner.start_branch_stream,
+                self.cleaner.clean_branch_partition,
+                self.cleaner.finish_branch_stream
+            )
+        elif self.transform_workers:
+            self.cleaner.clean_branches_parallel()
+        elif self.chunked or self.stream_batch_size:
+            self.cleaner.clean_branches_chunked()
+        else:
+            self.cleaner.clean_branches()
+
+    def clean_issues(self):
+        if self._streams_from('fetch_issues'):
+            self._clean_stream(
+                'issues_raw',
+                self.cleaner.start_issue_stream,
+                self.cleaner.clean_issue_partition,
+                self.cleaner.finish_issue_stream
+            )
+        elif self.transform_workers:
+            self.cleaner.clean_issues_parallel()
+        elif self.chunked or self.stream_batch_size:
+            self.cleaner.clean_issues_chunked()
+        else:
+            self.cleaner.clean_issues()
+
+    def clean_users(self):
+        self.cleaner.clean_users()
+
+    def load(self):
+        from load import LoadData
+        from cdc import ChangeCapture
+
+        loader = LoadData(self.connection_url)
+        change_capture = ChangeCapture()
+        change_capture.input_format = loader.input_format
+        change_capture.capture_all()
+        loader.load_deltas(change_capture)
+        change_capture.commit()
+
+    def aggregate(self):
+        from aggregates import AggregateStore
+
+        store = AggregateStore()
+        store.refresh()
+        store.close()
+
+    def _plan(self, only, skip, resume):
+        for name in (only or []) + (skip or []):
+            if name not in self.stages:
+                raise ValueError(f'Unknown stage: {name}')
+
+        planned = set(only) if only else set(self.stages)
+        planned -= set(skip or [])
+
+        if resume and self.state_path.exists():
+            with open(self.state_path, 'r', encoding = 'UTF-8') as file:
+                previous = json.load(file)
+
+            done = {name for name, stage in previous['stages'].items() if stage['status'] == 'completed'}
+            planned -= done
+            self.context.update(previous.get('context', {}))
+            self.state['stages'].update({name : previous['stages'][name] for name in done})
+
+        return planned
+
+    def _save_state(self):
+        tmp_path = self.state_path.with_suffix('.json.tmp')
+
+        with open(tmp_path, 'w', encoding = 'UTF-8') as file:
+            json.dump(self.state, file, indent = 4, default = str)
+
+        os.replace(tmp_path, self.state_path)
+
+    def _run_stage(self, stage):
+        start = time.perf_counter()
+        self.state['stages'][stage.name] = {'status' : 'running', 'started_at' : datetime.datetime.now()}
+
+        try:
+            with METRICS.timer('stage_seconds', 'Wall time per pipeline stage', stage = stage.name):
+                stage.func()
+        finally:
+            self.state['stages'][stage.name]['seconds'] = round(time.perf_counter() - start, 3)
+
+    def run(self, only = None, skip = None, resume = False):
+        self.planned = self._plan(only, skip, resume)
+        satisfied = set(self.stages) - self.planned
+        pending = [name for name in self.stages if name in self.planned]
+        running = {}
+        failed = None
+        run_start = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers = len(self.stages)) as pool:
+            while pending or running:
+                for name in list(pending):
+                    if failed is None and all(dep in satisfied for dep in self.stages[name].deps):
+                        running[pool.submit(self._run_stage, self.stages[name])] = name
+                        pending.remove(name)
+
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when = FIRST_COMPLETED)
+
+                for future in done:
+                    name = running.pop(future)
+
+                    try:
+                        future.result()
+                        satisfied.add(name)
+                        self.state['stages'][name]['status'] = 'completed'
+
+                    except Exception as e:
+                        failed = failed or e
+                        self.state['stages'][name]['status'] = 'failed'
+                        self._log_issue(f'PIPELINE | stage {name} failed: {e}')
+
+                    self._save_state()
+
+        for name in pending:
+            self.state['stages'][name] = {'status' : 'not run'}
+
+        self._save_state()
+        self.report(time.perf_counter() - run_start)
+        self._export_metrics(failed)
+
+        if failed is not None:
+            raise failed
+
+        shutil.rmtree(self.partition_root, ignore_errors = True)
+
+    def _export_metrics(self, failed):
+        if self._extractor is not None:
+            self._extractor.report_cache()
+
+        METRICS.gauge('peak_rss_mb', 'Peak resident memory of the pipeline process', merge = 'max').set_max(peak_rss_mb())
+        METRICS.gauge('run_success', '1 if the last run completed every planned stage').set(0 if failed else 1)
+        METRICS.gauge('run_finished_timestamp_seconds', 'Unix time the last run finished').set(time.time())
+
+        summary_path = METRICS.export()
+        self._log_issue(f'PIPELINE - Metrics | {summary_path}')
+
+    def report(self, wall_seconds):
+        lines = [f'{"stage":<16}{"status":<12}{"seconds":>10}']
+
+        for name in self.stages:
+            stage_state = self.state['stages'].get(name, {'status' : 'skipped'})
+            seconds = stage_state.get('seconds')
+            lines.append(f'{name:<16}{stage_state["status"]:<12}{"" if seconds is None else f"{seconds:.2f}":>10}')
+
+        lines.append(f'{"total (wall)":<28}{wall_seconds:>10.2f}')
+
+        print('\n'.join(lines))
+        self._log_issue(f'PIPELINE - Complete | {wall_seconds:.2f}s wall | ' + ', '.join(
+            f'{name} {state.get("seconds", 0):.2f}s' for name, state in self.state['stages'].items() if 'seconds' in state
+        ))
+
+def parse_args(argv = None):
+    parser = argparse.ArgumentParser(description = 'Run the Github incremental pipeline.')
+    parser.add_argument('--only', nargs = '+', metavar = 'STAGE', help = 'run only these stages')
+    parser.add_argument('--skip', nargs = '+', metavar = 'STAGE', help = 'run every stage except these')
+    parser.add_argument('--resume', action = 'store_true', help = 'skip stages that completed in the last run')
+    extract_mode = parser.add_mutually_exclusive_group()
+    extract_mode.add_argument('--stream-batch-size', type = int, help = 'extract repos in batches and clean each batch as it lands')
+    extract_mode.add_argument('--shard-workers', type = int, help = 'extract issues and branches across this many processes')
+    parser.add_argument('--shard-by', choices = ['owner', 'repo'], default = 'owner', help = 'shard key for --shard-workers')
+    clean_mode = parser.add_mutually_exclusive_group()
+    clean_mode.add_argument('--chunked', action = 'store_true', help = 'clean issues and branches in bounded-memory batches')
+    clean_mode.add_argument('--transform-workers', type = int, help = 'clean issues and branches as repo partitions across this many processes')
+    engine = parser.add_mutually_exclusive_group()
+    engine.add_argument('--async', dest = 'async_mode', action = 'store_true', help = 'use the asyncio extraction engine')
+    engine.add_argument('--graphql', action = 'store_true', help = 'extract issues and branches with batched GraphQL queries')
+    parser.add_argument('--full-payloads', action = 'store_true', help = 'keep whole API payloads in the raw files instead of only the fields the clean step reads')
+    parser.add_argument('--db-url', help = 'SQLAlchemy URL to load into instead of SQL Server')
+    parser.add_argument('--list', action = 'store_true', help = 'print the stage graph and exit')
+
+    return parser.parse_args(argv)
+
+def main(argv = None):
+    args = parse_args(argv)
+    pipeline = Pipeline(
+        stream_batch_size = args.stream_batch_size,
+        chunked = args.chunked,
+        async_mode = args.async_mode,
+        connection_url = args.db_url,
+        shard_workers = args.shard_workers,
+        shard_by = args.shard_by,
+        graphql = args.graphql,
+        transform_workers = args.transform_workers,
+        full_payloads = args.full_payloads
+    )
+
+    if args.list:
+        for stage in pipeline.stages.values():
+            print(f'{stage.name:<16} <- {", ".join(stage.deps) or "-"}')
+        return
+
+    pipeline.run(only = args.only, skip = args.skip, resume = args.resume)
+
+if __name__ == '__main__':
+    main()
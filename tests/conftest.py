@@ -0,0 +1,22 @@
+import os
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    # Every data path in config.py is relative, so each test runs in its own data tree
+
+    import config
+
+    monkeypatch.chdir(tmp_path)
+
+    for directory in [config.RAW_DIR, config.CLEAN_DIR, config.ISSUES_DIR, config.CACHE_DIR, config.STATE_DIR, config.DELTA_DIR, config.METRICS_DIR, config.REJECT_DIR]:
+        os.makedirs(directory, exist_ok = True)
+
+    return tmp_path
@@ -0,0 +1,41 @@
+import pandas as pd
+from transform import CleanData
+from utils.constraints import ConstraintValidator
+from utils.sql_tables import metadata
+
+
+def repos_frame():
+    df = pd.DataFrame({
+        'repo_id' : ['repo-1', 'repo-2'],
+        'repo_name' : ['short', 'x' * 300],
+        'full_name' : ['owner/short', 'owner/long'],
+        'owner_id' : ['owner-1', 'owner-1'],
+        'visibility' : ['public', 'public'],
+        'private' : [False, False]
+    })
+
+    for column in ['created_at', 'updated_at', 'pushed_at']:
+        df[column] = pd.Timestamp('2024-01-01', tz = 'UTC')
+
+    for column in ['stargazers_count', 'watchers_count', 'forks_count', 'open_issues_count']:
+        df[column] = 1
+
+    return df
+
+
+def test_over_length_rows_reach_rejects(workdir):
+    repos_df = CleanData()._apply_schema('repos', repos_frame())
+
+    assert repos_df['repo_name'].str.len().max() == 300
+
+    repos_df.to_csv('data/clean_data/repos_clean.csv', index = False)
+    pd.DataFrame({'owner_id' : ['owner-1']}).to_csv('data/clean_data/owners_clean.csv', index = False)
+
+    validator = ConstraintValidator('data/clean_data', reject_dir = 'data/rejects')
+    valid_df, reject_counts = validator.validate(metadata.tables['repos'], repos_df)
+    rejects_df = pd.read_csv(validator.reject_path('repos'), dtype = str)
+
+    assert list(valid_df['repo_id']) == ['repo-1']
+    assert reject_counts == {'LENGTH_repo_name' : 1}
+    assert list(rejects_df['repo_id']) == ['repo-2']
+    assert rejects_df['repo_name'].str.len().max() == 300
@@ -0,0 +1,69 @@
+import json
+import sqlite3
+import pytest
+from benchmarks.mock_github import MockGithubServer
+from extract import ExtractData
+from pipeline import Pipeline
+from utils.rate_limit import RateLimitScheduler
+from utils.raw_storage import raw_file_path, iter_raw_records
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setenv('GITHUB_TOKEN', 'benchmark-token')
+
+    with MockGithubServer(scale = '1x', seed = 42, latency = 0, rate_limit = 10 ** 9) as server:
+        yield server
+
+
+def make_pipeline(server, workdir, fail_on_batch = None):
+    pipeline = Pipeline(stream_batch_size = 50, connection_url = f'sqlite:///{workdir}/github.sqlite')
+    extractor = ExtractData()
+    extractor.base_url = server.base_url
+    extractor.owners = server.dataset.owners
+    extractor.requests_per_second = None
+    extractor.scheduler = RateLimitScheduler(['benchmark-token'], requests_per_second = None)
+
+    if fail_on_batch is not None:
+        fetch_issues = extractor.fetch_issues
+        calls = []
+
+        def flaky_fetch_issues(repo_names, raw_dir = None):
+            calls.append(raw_dir)
+
+            if len(calls) == fail_on_batch:
+                raise RuntimeError('injected fetch failure')
+
+            return fetch_issues(repo_names, raw_dir = raw_dir)
+
+        extractor.fetch_issues = flaky_fetch_issues
+
+    pipeline._extractor = extractor
+
+    return pipeline
+
+
+def stage_statuses():
+    with open('data/state/pipeline_state.json', encoding = 'UTF-8') as file:
+        return {name : stage['status'] for name, stage in json.load(file)['stages'].items()}
+
+
+def test_failed_stream_fetch_resumes(server, workdir):
+    with pytest.raises(RuntimeError, match = 'injected fetch failure'):
+        make_pipeline(server, workdir, fail_on_batch = 3).run(skip = ['validate_token'])
+
+    statuses = stage_statuses()
+
+    assert statuses['fetch_issues'] == 'failed'
+    assert statuses.get('clean_issues') != 'completed'
+
+    make_pipeline(server, workdir).run(skip = ['validate_token'], resume = True)
+
+    assert set(stage_statuses().values()) == {'completed'}
+
+    raw_ids = {record['id'] for record in iter_raw_records(raw_file_path('data/raw_data', 'issues_raw'))}
+
+    with sqlite3.connect(workdir / 'github.sqlite') as connection:
+        loaded = connection.execute('SELECT COUNT(*) FROM issues').fetchone()[0]
+
+    assert raw_ids and loaded == len(raw_ids)
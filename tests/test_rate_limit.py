@@ -0,0 +1,43 @@
+import time
+from email.utils import formatdate
+from utils.rate_limit import RateLimitScheduler
+
+
+def make_scheduler():
+    return RateLimitScheduler(['token'], requests_per_second = None)
+
+
+def test_permission_403_is_not_retried():
+    scheduler = make_scheduler()
+    headers = {'X-RateLimit-Limit' : '5000', 'X-RateLimit-Remaining' : '4999'}
+    body = '{"message": "Resource protected by organization SAML enforcement."}'
+
+    assert scheduler.retry_delay(403, headers, 0, body) is None
+
+
+def test_secondary_limit_403_backs_off():
+    scheduler = make_scheduler()
+    headers = {'X-RateLimit-Remaining' : '4999'}
+    body = b'{"message": "You have exceeded a secondary rate limit. Please wait a few minutes before you try again."}'
+
+    assert scheduler.retry_delay(403, headers, 0, body) is not None
+
+
+def test_exhausted_primary_limit_403_is_retried():
+    assert make_scheduler().retry_delay(403, {'X-RateLimit-Remaining' : '0'}, 0, '') == 0.0
+
+
+def test_retry_after_seconds():
+    assert make_scheduler().retry_delay(403, {'Retry-After' : '30'}, 0, '') == 30.0
+
+
+def test_retry_after_http_date():
+    delay = make_scheduler().retry_delay(429, {'Retry-After' : formatdate(time.time() + 60, usegmt = True)}, 0, '')
+
+    assert 50 < delay <= 60
+
+
+def test_unparseable_retry_after_falls_back_to_backoff():
+    scheduler = make_scheduler()
+
+    assert 0 <= scheduler.retry_delay(429, {'Retry-After' : 'soon'}, 0, '') <= scheduler.base_backoff
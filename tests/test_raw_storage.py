@@ -0,0 +1,20 @@
+import json
+import importlib.util
+import pytest
+from utils.raw_storage import RawWriter, iter_raw_lines, iter_raw_records
+
+ZSTD = pytest.param('zstd', marks = pytest.mark.skipif(importlib.util.find_spec('zstandard') is None, reason = 'zstandard is not installed'))
+
+
+@pytest.mark.parametrize('compression', [None, 'gzip', ZSTD])
+def test_raw_lines_round_trip(tmp_path, compression):
+    records = [{'id' : number, 'title' : f'issue {number}'} for number in range(1000)]
+
+    with RawWriter(tmp_path, 'issues_raw', compression) as writer:
+        writer.write(records[:400])
+        writer.write(records[400:])
+
+    lines = list(iter_raw_lines(writer.path))
+
+    assert [json.loads(line) for line in lines] == records
+    assert list(iter_raw_records(writer.path)) == records
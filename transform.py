@@ -1,24 +1,92 @@
+import numpy as np
 import pandas as pd
 import json
 import os
-import datetime
+import multiprocessing
+from itertools import islice, compress
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from dotenv import load_dotenv
-from config import RAW_DIR, CLEAN_DIR, ISSUES_DIR
+from config import RAW_DIR, CLEAN_DIR, STATE_DIR
+from utils.raw_storage import raw_file_path, iter_raw_records
+from utils.key_index import KeyIndex, last_occurrences
+from utils.dimension_store import DimensionStore
+from utils.schema import apply_schema
+from utils.explode import explode_names, join_names
+from utils.fields import raw_columns
+from utils.memory import StageMemory
+from utils.raw_partitions import partition_raw_lines, SharedPartitions, read_partition
+from utils.columnar import write_parquet, replace_parquet, read_parquet, frame_to_ipc, frame_from_ipc
+from utils.issue_log import log_issue
+from utils.metrics import METRICS
 from utils.guid_gen import (
-    generate_guid,
+    generate_guids,
     NAMESPACE_REPO,
     NAMESPACE_BRANCH,
     NAMESPACE_ISSUE,
     NAMESPACE_OWNER,
-    NAMESPACE_USER
+    NAMESPACE_USER,
+    NAMESPACE_LABEL,
+    NAMESPACE_TOPIC,
+    NAMESPACE_ISSUE_LABEL,
+    NAMESPACE_REPO_TOPIC
 )
 
+class ChunkProgress:
+    def __init__(self, dataset, key, version = None):
+        self.dataset = dataset
+        self.key = key
+        self.version = version
+        self.index = KeyIndex()
+        self.superseded = np.empty(0, dtype = np.uint64)
+        self.memory = StageMemory()
+        self.batch_number = 0
+        self.rows = 0
+        self.dropped = 0
+        self.missing_repos = 0
+        self.user_frames = []
+        self.label_frames = []
+
+
+# Raw-record keys matching the clean dedupe keys, None for a record the cleaner drops anyway
+
+def _issue_key(record):
+    user = record.get('user') or {}
+
+    if record.get('id') is None or user.get('login') is None or user.get('id') is None:
+        return None
+
+    return str(record['id'])
+
+
+def _issue_version(record):
+    return record.get('updated_at')
+
+
+def _versions(values):
+    # Nanoseconds since the epoch, a copy without a timestamp sorts before every dated copy of its key
+
+    updated = pd.to_datetime(pd.Series(values, dtype = object), utc = True, errors = 'coerce')
+
+    return updated.dt.tz_localize(None).to_numpy(dtype = 'datetime64[ns]').view(np.int64)
+
+
+def _branch_key(record):
+    if record.get('name') is None:
+        return None
+
+    return f'{record.get("repo_full_name") or record.get("repo_name")}|{record["name"]}'
+
+
 class CleanData:
     def __init__(self):
         self.repos_df = pd.DataFrame()
         self.issues_df = pd.DataFrame()
         self.branches_df = pd.DataFrame()
+        self.labels_df = pd.DataFrame()
+        self.issue_labels_df = pd.DataFrame()
+        self.topics_df = pd.DataFrame()
+        self.repo_topics_df = pd.DataFrame()
         self.owners_df = pd.DataFrame(
             columns = [
                 'owner_id',
@@ -31,14 +99,29 @@ class CleanData:
                 'user_login'
             ]
         )
+        self.issue_users_df = None
+        self.new_users_df = None
+        self.new_owners_df = None
+        self.dimension_db_path = os.path.join(STATE_DIR, 'dimensions.db')
+        self.dimensions = {}
+        self.chunk_size = 5000
+        self.min_chunk_size = 500
+        self.memory_budget_mb = 1024
+        self.output_formats = ['csv']
+        self.partition_issues = False
+        self.transform_workers = None
+        self.partitions_per_worker = 4
 
     def _log_issue(self, message):
-        timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-
-        with open(os.path.join(ISSUES_DIR, 'pipeline_error_log.txt'), 'a', encoding = 'UTF-8') as issue_log:
-            issue_log.write(f'{timestamp}: {message}\n')
+        log_issue(message)
 
     def _write_to_file(self, file_name, df):
+        if 'parquet' in self.output_formats:
+            write_parquet(CLEAN_DIR, file_name, df, partitioned = self.partition_issues)
+
+        if 'csv' not in self.output_formats:
+            return
+
         curr_path = Path(CLEAN_DIR) / f'{file_name}.csv'
         backup_path = Path(CLEAN_DIR) / f'{file_name}_backup.csv'
 
@@ -53,27 +136,215 @@ class CleanData:
             index = False,
             encoding = 'UTF-8'
         )
-    
-    def _validate_raw_file(self, file_name):
-        file_path = Path(RAW_DIR) / f'{file_name}.json'
+
+    def _append_to_file(self, file_name, df, batch_number):
+        curr_path = Path(CLEAN_DIR) / f'{file_name}.csv'
+
+        if batch_number == 0:
+            self._write_to_file(file_name, df)
+            return
+
+        if 'parquet' in self.output_formats:
+            write_parquet(CLEAN_DIR, file_name, df, batch_number, partitioned = self.partition_issues)
+
+        if 'csv' in self.output_formats:
+            df.to_csv(
+                curr_path,
+                mode = 'a',
+                header = False,
+                index = False,
+                encoding = 'UTF-8'
+            )
+
+    def read_clean(self, file_name, columns = None, filters = None):
+        return read_parquet(CLEAN_DIR, file_name, columns = columns, filters = filters)
+
+    def _key_pass(self, file_path, progress):
+        # Batches are written as they are cleaned, so a key pass over the raw file first finds the copy
+        # the in-memory clean would keep. Records without a key pass through to be dropped later
+
+        hashes = []
+        keyless = []
+        versions = []
+
+        for raw_batch in self._iter_raw_batches(file_path, progress.memory):
+            keys = pd.Series([progress.key(record) for record in raw_batch], dtype = object)
+            hashes.append(progress.index.hash_keys(keys.fillna('')))
+            keyless.append(keys.isna().to_numpy())
+            versions.append(
+                _versions([progress.version(record) for record in raw_batch]) if progress.version
+                else np.zeros(len(raw_batch), dtype = np.int64)
+            )
+
+        if not hashes:
+            return np.empty(0, dtype = bool), np.empty(0, dtype = np.uint64), np.empty(0, dtype = bool), np.empty(0, dtype = np.int64)
+
+        hashes = np.concatenate(hashes)
+        keyless = np.concatenate(keyless)
+        versions = np.concatenate(versions)
+
+        return last_occurrences(hashes, versions) | keyless, hashes, keyless, versions
+
+    def _latest_batches(self, file_path, progress):
+        keep, hashes, keyless, versions = self._key_pass(file_path, progress)
+
+        # Keys cleaned from an earlier partition are skipped before they are prepared, the merged issues file
+        # repeats every changed issue next to the carried-forward ones. They were counted the first time round.
+        # A newer copy than the one cleaned before is cleaned too, the older row goes when the stream finishes
+
+        seen = progress.index.contains(hashes) & ~keyless
+        newer = seen & keep & (versions > progress.index.versions_of(hashes))
+        seen &= ~newer
+        progress.superseded = np.union1d(progress.superseded, hashes[newer])
+        progress.index.add(hashes[keep & ~seen & ~keyless], versions[keep & ~seen & ~keyless])
+        position = 0
+
+        for raw_batch in self._iter_raw_batches(file_path, progress.memory):
+            batch = slice(position, position + len(raw_batch))
+            position += len(raw_batch)
+            unseen = int((~seen[batch]).sum())
+            latest = list(compress(raw_batch, keep[batch] & ~seen[batch]))
+            progress.dropped += unseen - len(latest)
+
+            if len(latest) < unseen:
+                self._record_rows(progress.dataset, unseen - len(latest), 0)
+
+            if latest:
+                yield latest
+
+    def _iter_raw_batches(self, file_path, memory):
+        file_name = file_path.name
 
         if not file_path.exists():
-            self._log_issue(f'{file_name}.json does not exist!')
+            self._log_issue(f'{file_path.name} does not exist!')
+            raise FileNotFoundError
+
+        records = iter_raw_records(file_path)
+        chunk_size = self.chunk_size
+
+        while True:
+            try:
+                batch = list(islice(records, chunk_size))
+            except json.JSONDecodeError as e:
+                self._log_issue(f'{file_name} contains invalid JSON: {e}')
+                raise ValueError
+
+            if not batch:
+                break
+
+            yield batch
+
+            # Shrink batches whenever the live resident set goes over the budget
+
+            if memory.sample() > self.memory_budget_mb and chunk_size > self.min_chunk_size:
+                chunk_size = max(self.min_chunk_size, chunk_size // 2)
+                self._log_issue(f'{file_name} | over {self.memory_budget_mb} MB budget, batch size now {chunk_size}.')
+
+    def _ensure_clean(self, attr, file_name):
+        # Stages can run in a later process than the one that built their inputs, e.g. on a resumed run.
+        # Parquet-only output is read back as text too, like the CSV
+
+        if not getattr(self, attr).empty:
+            return
+
+        if 'csv' in self.output_formats:
+            df = pd.read_csv(
+                Path(CLEAN_DIR) / f'{file_name}.csv',
+                dtype = 'string',
+                encoding = 'UTF-8'
+            )
+        else:
+            df = self.read_clean(file_name).astype('string')
+
+        setattr(self, attr, df)
+
+    def _record_rows(self, dataset, rows_in, rows_out):
+        METRICS.counter('clean_rows_in_total', 'Raw rows entering each clean step').inc(rows_in, dataset = dataset)
+        METRICS.counter('clean_rows_out_total', 'Clean rows written by each clean step').inc(rows_out, dataset = dataset)
+        METRICS.counter('clean_rows_dropped_total', 'Rows dropped as null, duplicate or already seen').inc(rows_in - rows_out, dataset = dataset)
+
+    def _apply_schema(self, table_name, df):
+        df, over_length = apply_schema(table_name, df)
+
+        for column, count in over_length.items():
+            METRICS.counter('schema_over_length_total', 'Values over their SQL VARCHAR length').inc(count, table = table_name, column = column)
+            self._log_issue(f'{table_name.upper()} | {count} {column} values over the VARCHAR length, left for the load to reject.')
+
+        return df
+
+    def _explode_bridge(self, parent_ids, values, field, parent, entity, namespace, bridge_namespace):
+        # Names are interned, each distinct one is hashed once however many rows carry it.
+        # Labels and topics match case-insensitively on GitHub, so the GUID is keyed on the lowercased name
+
+        exploded = explode_names(parent_ids, values, field)
+        exploded['name'] = exploded['name'].str.strip()
+        name_ids = generate_guids(namespace, exploded['name'].str.lower())
+
+        names_df = pd.DataFrame({
+            f'{entity}_id' : name_ids,
+            f'{entity}_name' : exploded['name']
+        }).drop_duplicates(subset = [f'{entity}_id'])
+
+        bridge_df = pd.DataFrame({
+            f'{parent}_{entity}_id' : generate_guids(bridge_namespace, exploded['id'].astype(str) + '|' + name_ids),
+            f'{parent}_id' : exploded['id'],
+            f'{entity}_id' : name_ids
+        }).drop_duplicates(subset = [f'{parent}_{entity}_id'])
+
+        return self._apply_schema(f'{entity}s', names_df), self._apply_schema(f'{parent}_{entity}s', bridge_df)
+
+    def _write_bridge(self, entity, names_df, bridge_name, bridge_df, parent_count):
+        self._write_to_file(f'{entity}_clean', names_df)
+        self._write_to_file(f'{bridge_name}_clean', bridge_df)
+        self._log_issue(f'{entity.upper()} - Complete | {len(names_df)} distinct, {len(bridge_df)} {bridge_name} rows across {parent_count} parents.')
+
+    def _with_full_names(self, raw_df):
+        # Records extracted before multi-owner support only carry the short repo name of the single owner
+
+        if 'repo_full_name' not in raw_df:
+            raw_df['repo_full_name'] = pd.NA
+
+        legacy = raw_df['repo_full_name'].isna()
+
+        if legacy.any():
+            full_names = self.repos_df.drop_duplicates('repo_name').set_index('repo_name')['full_name']
+            raw_df.loc[legacy, 'repo_full_name'] = raw_df.loc[legacy, 'repo_name'].map(full_names)
+
+        return raw_df
+
+    def _guid_repo_keys(self, full_names):
+        # Issue and branch GUIDs were seeded with the short repo name before multi-owner support. A name only one
+        # tracked repo has keeps that seed so its ids don't change, names shared across owners seed with owner/name
+
+        repo_names = self.repos_df['repo_name'].astype(str)
+        shared = self.repos_df.loc[repo_names.duplicated(keep = False), 'full_name'].astype(str)
+        full_names = full_names.astype(str)
+
+        return full_names.where(full_names.isin(shared), full_names.str.split('/', n = 1).str[1])
+
+    def _check_raw_file(self, file_name):
+        file_path = raw_file_path(RAW_DIR, file_name)
+
+        if not file_path.exists():
+            self._log_issue(f'{file_path.name} does not exist!')
             raise FileNotFoundError
 
         if os.path.getsize(file_path) == 0:
-            self._log_issue(f'{file_name}.json is empty!')
+            self._log_issue(f'{file_path.name} is empty!')
             raise ValueError
+
+        return file_path
+
+    def _validate_raw_file(self, file_name):
+        file_path = self._check_raw_file(file_name)
         
         try:
-            with open(file_path, 'r', encoding = 'UTF-8') as file:
-                data = json.load(file)
-        except json.JSONDecodeError as e:
-            self._log_issue(f'{file_name}.json contains invalid JSON: {e}')
+            data = list(iter_raw_records(file_path))
+        except (json.JSONDecodeError, EOFError, OSError) as e:
+            self._log_issue(f'{file_path.name} contains invalid JSON: {e}')
             raise ValueError
-        
-        if not isinstance(data, list):
-            self._log_issue(f'Incorrect top-level type in {file_name}.json')
+        except TypeError:
+            self._log_issue(f'Incorrect top-level type in {file_path.name}')
             raise TypeError
         
         return data
@@ -82,30 +353,7 @@ class CleanData:
         raw_data = self._validate_raw_file('repos_raw')
         self.repos_df = pd.json_normalize(raw_data)
 
-        self.repos_df = self.repos_df[[
-            'id',
-            'name',
-            'full_name',
-            'description',
-            'topics',
-            'language',
-            'owner.id',
-            'owner.login',
-            'visibility',
-            'private',
-            'disabled',
-            'fork',
-            'archived',
-            'default_branch',
-            'stargazers_count',
-            'watchers_count',
-            'forks_count',
-            'forks',
-            'open_issues_count',
-            'created_at',
-            'updated_at',
-            'pushed_at'
-        ]]
+        self.repos_df = self.repos_df[raw_columns('repos_raw')]
 
         # Rename cols to match SQL format
 
@@ -140,49 +388,36 @@ class CleanData:
         new_rows = len(self.repos_df)
 
         if og_rows != new_rows:
-            self._log_issues(f'REPOS | {og_rows - new_rows} dropped during cleaning.')
+            self._log_issue(f'REPOS | {og_rows - new_rows} dropped during cleaning.')
+
+        self._record_rows('repos', og_rows, new_rows)
 
         # Generate GUIDs for repo_id
 
-        self.repos_df['repo_id'] = self.repos_df.apply(
-            lambda r: generate_guid(
-                NAMESPACE_REPO,
-                f"{r['owner_login']}|{r['repo_name']}"
-            ),
-            axis = 1
-        )
-
-        self.repos_df['owner_id'] = self.repos_df.apply(
-            lambda r: generate_guid(
-                NAMESPACE_OWNER,
-                r['owner_login']
-            ),
-            axis = 1
-        )
-
-        # Data type casting
-
-        self.repos_df = self.repos_df.astype({
-            'repo_id': 'string',
-            'repo_name': 'string',
-            'full_name': 'string',
-            'description': 'string',
-            'language': 'string',
-            'owner_id': 'string',
-            'owner_login': 'string',
-            'visibility': 'string',
-            'default_branch': 'string',
-            'stargazers_count': 'int64',
-            'watchers_count': 'int64',
-            'forks': 'int64',
-            'forks_count': 'int64',
-            'open_issues_count': 'int64',
-        })
-
-        self.repos_df['topics'] = self.repos_df['topics'].apply(
-            lambda x: ','.join(x) if isinstance(x, list) else None
+        self.repos_df['repo_id'] = generate_guids(
+            NAMESPACE_REPO,
+            self.repos_df['owner_login'].astype(str) + '|' + self.repos_df['repo_name'].astype(str)
         )
 
+        self.repos_df['owner_id'] = generate_guids(
+            NAMESPACE_OWNER,
+            self.repos_df['owner_login']
+        )
+
+        # Topics go to their own bridge table, the comma list is kept for existing readers of repos_clean
+
+        self.topics_df, self.repo_topics_df = self._explode_bridge(
+            self.repos_df['repo_id'],
+            self.repos_df['topics'],
+            None,
+            'repo',
+            'topic',
+            NAMESPACE_TOPIC,
+            NAMESPACE_REPO_TOPIC
+        )
+
+        self.repos_df['topics'] = join_names(self.repos_df['topics'], index = self.repos_df.index)
+
         date_cols = ['created_at', 'updated_at', 'pushed_at']
         
         for col in date_cols:
@@ -190,11 +425,6 @@ class CleanData:
                 self.repos_df[col], 
                 errors='coerce', 
                 utc=True)
-            
-        bool_cols = ['private', 'disabled', 'fork', 'archived']
-
-        for col in bool_cols:
-            self.repos_df[col] = self.repos_df[col].astype('Int64')
 
         self.repos_df = self.repos_df[[
             'repo_id', 'github_repo_id', 'repo_name','full_name', 
@@ -205,33 +435,21 @@ class CleanData:
             'created_at', 'updated_at', 'pushed_at'
             ]]
 
+        # Data type casting, from the schema registry
+
+        self.repos_df = self._apply_schema('repos', self.repos_df)
+
         self._write_to_file('repos_clean', self.repos_df)
         self._log_issue(f'REPOS - Complete | {len(self.repos_df)} rows loaded.')
+        self._write_bridge('topics', self.topics_df, 'repo_topics', self.repo_topics_df, len(self.repos_df))
 
-    def clean_issues(self):
-        raw_data = self._validate_raw_file('issues_raw')
-        self.issues_df = pd.json_normalize(raw_data)
-
-        self.issues_df = self.issues_df[[
-            'id',
-            'repo_name',
-            'number',
-            'user.login',
-            'user.id',
-            'title',
-            'state',
-            'locked',
-            'comments',
-            'pull_request.merged_at',
-            'created_at',
-            'updated_at',
-            'closed_at',
-            'labels',
-            'assignee.login',
-            'assignee.id'
-        ]]
+    def _prepare_issues(self, raw_data):
+        self._ensure_clean('repos_df', 'repos_clean')
+        issues_df = self._with_full_names(pd.json_normalize(raw_data))
 
-        self.issues_df = self.issues_df.rename(
+        issues_df = issues_df[raw_columns('issues_raw')]
+
+        issues_df = issues_df.rename(
             columns = {
                 'id' : 'github_issue_id',
                 'user.login' : 'author_login',
@@ -242,186 +460,382 @@ class CleanData:
             }
         )
 
-        og_rows = len(self.issues_df)
+        og_rows = len(issues_df)
 
-        self.issues_df = self.issues_df.dropna(
+        issues_df = issues_df.dropna(
             subset = [
                 'github_issue_id',
-                'repo_name',
+                'repo_full_name',
                 'author_login',
                 'github_author_id'
             ]
         )
 
-        self.issues_df = self.issues_df.drop_duplicates(
-            subset = ['github_issue_id'],
-            keep = 'last'
+        # The most recently updated copy of an issue wins, file order only breaks ties
+
+        issues_df = (
+            issues_df
+            .sort_values('updated_at', kind = 'stable', na_position = 'first')
+            .drop_duplicates(subset = ['github_issue_id'], keep = 'last')
+            .sort_index()
         )
 
-        new_rows = len(self.issues_df)
+        new_rows = len(issues_df)
 
-        if og_rows != new_rows:
-            self._log_issues(f'ISSUES | {og_rows - new_rows} dropped during cleaning.')
+        dropped = og_rows - new_rows
 
-        self.issues_df['issue_id'] = self.issues_df.apply(
-            lambda r: generate_guid(
-                NAMESPACE_ISSUE,
-                f"{r['repo_name']}|{r['number']}"
-            ),
-            axis = 1
+        issues_df['issue_id'] = generate_guids(
+            NAMESPACE_ISSUE,
+            self._guid_repo_keys(issues_df['repo_full_name']) + '|' + issues_df['number'].astype(str)
         )
 
-        self.issues_df['author_id'] = self.issues_df.apply(
-            lambda r: generate_guid(
-                NAMESPACE_USER,
-                r['author_login']
-            ),
-            axis = 1
+        issues_df['author_id'] = generate_guids(
+            NAMESPACE_USER,
+            issues_df['author_login']
         )
 
-        self.issues_df['assignee_id'] = self.issues_df.apply(
-            lambda r: generate_guid(
-                NAMESPACE_USER,
-                r['assignee_login']
-            ) if pd.notna(r['assignee_login']) else None,
-            axis = 1
+        issues_df['assignee_id'] = generate_guids(
+            NAMESPACE_USER,
+            issues_df['assignee_login']
         )
 
-        self.issues_df = self.issues_df.merge(
-            self.repos_df[['repo_id', 'repo_name']],
-            on = 'repo_name',
+        issues_df = issues_df.merge(
+            self.repos_df[['repo_id', 'full_name']].rename(columns = {'full_name' : 'repo_full_name'}),
+            on = 'repo_full_name',
             how = 'left',
             validate = 'many_to_one'
         )
 
-        self.issues_df = self.issues_df.drop(
-            columns = ['repo_name']
+        issues_df = issues_df.drop(
+            columns = ['repo_full_name']
         )
 
-        missing_repos = self.issues_df['repo_id'].isna().sum()
+        missing_repos = issues_df['repo_id'].isna().sum()
 
-        if missing_repos > 0:
-            self._log_issue(f'ISSUES | {missing_repos} rows with missing repo_id (FK Enforcement).')
-
-        self.issues_df = self.issues_df.dropna(
+        issues_df = issues_df.dropna(
             subset = ['repo_id']
         )
 
-        self.issues_df = self.issues_df.astype({
-            'issue_id' : 'string',
-            'github_issue_id' : 'Int64',
-            'repo_id' : 'string',
-            'author_id' : 'string',
-            'assignee_id' : 'string',
-            'author_login' : 'string',
-            'assignee_login' : 'string',
-            'number' : 'Int64',
-            'title' : 'string',
-            'state' : 'string',
-            'comments' : 'Int64',
-        })
-
         date_cols = ['created_at', 'updated_at', 'closed_at', 'pr_merged_at']
 
         for col in date_cols:
-            self.issues_df[col] = pd.to_datetime(
-                self.issues_df[col],
+            issues_df[col] = pd.to_datetime(
+                issues_df[col],
                 errors = 'coerce',
                 utc = True
             )
 
-        self.issues_df['locked'] = self.issues_df['locked'].astype('Int64')
+        # Labels go to their own bridge table, the comma list is kept for existing readers of issues_clean
 
-        self.issues_df['labels'] = self.issues_df['labels'].apply(
-            lambda labels: ','.join(
-                label['name'] for label in labels
-            ) if isinstance(labels, list) and labels else None
+        labels_df, issue_labels_df = self._explode_bridge(
+            issues_df['issue_id'],
+            issues_df['labels'],
+            'name',
+            'issue',
+            'label',
+            NAMESPACE_LABEL,
+            NAMESPACE_ISSUE_LABEL
         )
 
-        self.issues_df = self.issues_df[[
+        issues_df['labels'] = join_names(issues_df['labels'], 'name', issues_df.index).replace('', None)
+
+        issues_df = issues_df[[
             'issue_id', 'github_issue_id', 'number', 'author_id', 'github_author_id',
             'author_login', 'title', 'state', 'locked', 'comments', 'pr_merged_at', 'created_at',
             'updated_at', 'closed_at', 'labels', 'assignee_id', 'assignee_login', 'repo_id'
         ]]
 
+        issues_df = self._apply_schema('issues', issues_df)
+
+        return issues_df, labels_df, issue_labels_df, dropped, missing_repos
+
+    def _log_issue_drops(self, dropped, missing_repos):
+        if dropped > 0:
+            self._log_issue(f'ISSUES | {dropped} dropped during cleaning.')
+
+        if missing_repos > 0:
+            self._log_issue(f'ISSUES | {missing_repos} rows with missing repo_id (FK Enforcement).')
+
+    def clean_issues(self):
+        raw_data = self._validate_raw_file('issues_raw')
+        self.issues_df, self.labels_df, self.issue_labels_df, dropped, missing_repos = self._prepare_issues(raw_data)
+        self._log_issue_drops(dropped, missing_repos)
+        self._record_rows('issues', len(raw_data), len(self.issues_df))
+
         self._write_to_file('issues_clean', self.issues_df)
         self._log_issue(f'ISSUES - Complete | {len(self.issues_df)} rows loaded.')
+        self._write_bridge('labels', self.labels_df, 'issue_labels', self.issue_labels_df, len(self.issues_df))
 
-    def clean_branches(self):
-        raw_data = self._validate_raw_file('branches_raw')
-        self.branches_df = pd.json_normalize(raw_data)
+    def start_issue_stream(self):
+        self.issue_progress = ChunkProgress('issues', _issue_key, _issue_version)
 
-        self.branches_df = self.branches_df[[
-            'name',
-            'protected',
-            'repo_name',
-            'commit.sha'
-        ]]
+    def clean_issue_partition(self, file_path):
+        progress = self.issue_progress
+
+        # Within a raw file and across streamed partitions the most recently updated copy of an issue wins,
+        # as in clean_issues. An issue only repeats across partitions when it moved repos
+
+        for raw_batch in self._latest_batches(file_path, progress):
+            issues_df, labels_df, issue_labels_df, batch_dropped, batch_missing = self._prepare_issues(raw_batch)
+            progress.dropped += batch_dropped
+            progress.missing_repos += batch_missing
+            self._record_rows('issues', len(raw_batch), len(issues_df))
+
+            self._append_to_file('issues_clean', issues_df, progress.batch_number)
+            self._append_to_file('issue_labels_clean', issue_labels_df, progress.batch_number)
+            progress.user_frames.append(self._issue_users(issues_df).drop_duplicates(subset = ['user_id']))
+            progress.label_frames.append(labels_df)
+            progress.batch_number += 1
+            progress.rows += len(issues_df)
+
+    def _read_clean_columns(self, file_name, columns):
+        if 'csv' in self.output_formats:
+            return pd.read_csv(Path(CLEAN_DIR) / f'{file_name}.csv', usecols = columns, dtype = str, encoding = 'UTF-8')
+
+        return self.read_clean(file_name, columns = columns).astype(str)
+
+    def _drop_clean_rows(self, file_name, column, values):
+        # Rewrites a clean file without the given rows, the backup of the previous run is left alone
+
+        if 'parquet' in self.output_formats:
+            df = self.read_clean(file_name)
+            replace_parquet(CLEAN_DIR, file_name, df[~df[column].astype(str).isin(values)], partitioned = self.partition_issues)
+
+        if 'csv' not in self.output_formats:
+            return
+
+        curr_path = Path(CLEAN_DIR) / f'{file_name}.csv'
+        tmp_path = Path(CLEAN_DIR) / f'{file_name}.csv.tmp'
+        header = True
+
+        for chunk in pd.read_csv(curr_path, dtype = str, keep_default_na = False, chunksize = self.chunk_size, encoding = 'UTF-8'):
+            chunk[~chunk[column].isin(values)].to_csv(tmp_path, mode = 'w' if header else 'a', header = header, index = False, encoding = 'UTF-8')
+            header = False
+
+        os.replace(tmp_path, curr_path)
+
+    def _drop_superseded_issues(self, progress):
+        # A copy is only cleaned again when it is newer, so the most recently updated row of a moved issue stays
+
+        clean_ids = self._read_clean_columns('issues_clean', ['github_issue_id', 'issue_id', 'updated_at'])
+        hashes = progress.index.hash_keys(clean_ids['github_issue_id'])
+        latest = last_occurrences(hashes, _versions(clean_ids['updated_at']))
+        stale = clean_ids.loc[np.isin(hashes, progress.superseded) & ~latest, 'issue_id']
+
+        for file_name in ['issues_clean', 'issue_labels_clean']:
+            self._drop_clean_rows(file_name, 'issue_id', stale)
+
+        # The older copies were counted as clean rows when they were written
+
+        progress.rows -= len(stale)
+        progress.dropped += len(stale)
+        self._record_rows('issues', 0, -len(stale))
+
+    def finish_issue_stream(self):
+        progress = self.issue_progress
+
+        if len(progress.superseded):
+            self._drop_superseded_issues(progress)
+
+        self.issue_users_df = pd.concat(progress.user_frames, ignore_index = True) if progress.user_frames else None
+
+        if progress.label_frames:
+            self.labels_df = pd.concat(progress.label_frames, ignore_index = True).drop_duplicates(subset = ['label_id'])
+            self._write_to_file('labels_clean', self.labels_df)
+            self._log_issue(f'LABELS - Complete | {len(self.labels_df)} distinct across {progress.rows} issues.')
+
+        self._log_issue_drops(progress.dropped, progress.missing_repos)
+        METRICS.gauge('clean_peak_rss_mb', 'Peak resident memory while cleaning', merge = 'max').set_max(progress.memory.peak_mb, dataset = 'issues')
+        self._log_issue(f'ISSUES - Complete | {progress.rows} rows loaded | peak RSS {progress.memory.peak_mb:.0f} MB.')
+
+    def clean_issues_chunked(self):
+        self.start_issue_stream()
+        self.clean_issue_partition(raw_file_path(RAW_DIR, 'issues_raw'))
+        self.finish_issue_stream()
+
+    def _clean_parallel(self, dataset, file_name):
+        # Partitions are cut by repo in this process and cleaned in a pool, each worker gets the repo lookup once.
+        # Raw lines travel through shared memory and clean frames come back as Arrow buffers, neither is pickled
+
+        self._ensure_clean('repos_df', 'repos_clean')
+        file_path = self._check_raw_file(file_name)
+        workers = self.transform_workers or os.cpu_count()
+        partitions = partition_raw_lines(file_path, workers * self.partitions_per_worker)
+        repo_lookup = frame_to_ipc(self.repos_df[['repo_id', 'repo_name', 'full_name']])
+        results = []
+
+        try:
+            with SharedPartitions(partitions) as shared, ProcessPoolExecutor(
+                max_workers = max(1, min(workers, len(partitions))),
+                mp_context = multiprocessing.get_context('spawn'),
+                initializer = _init_transform_worker,
+                initargs = (repo_lookup,)
+            ) as pool:
+                futures = [
+                    pool.submit(_clean_partition, dataset, shared.name, offset, length)
+                    for offset, length in shared.slices
+                ]
+
+                for future in futures:
+                    buffers, counts, snapshot = future.result()
+                    METRICS.merge(snapshot)
+                    results.append(({name : frame_from_ipc(buffer) for name, buffer in buffers.items()}, counts))
+
+        except json.JSONDecodeError as e:
+            self._log_issue(f'{file_path.name} contains invalid JSON: {e}')
+            raise ValueError
+
+        self._log_issue(f'{dataset.upper()} | {sum(counts["records"] for _, counts in results)} records cleaned in {len(partitions)} partitions across {workers} workers.')
+
+        return results
+
+    def _merge_partitions(self, table_name, results):
+        # Concatenating partitions with different categories falls back to plain strings, the schema restores them
+
+        return self._apply_schema(table_name, pd.concat([frames[table_name] for frames, _ in results], ignore_index = True))
+
+    def clean_issues_parallel(self):
+        results = self._clean_parallel('issues', 'issues_raw')
+        issues_df = self._merge_partitions('issues', results)
+
+        # Only an issue transferred between repos can show up in two partitions, the most recently updated copy wins
+
+        self.issues_df = (
+            issues_df
+            .sort_values('updated_at', kind = 'stable', na_position = 'first')
+            .drop_duplicates(subset = ['github_issue_id'], keep = 'last')
+            .sort_index()
+            .reset_index(drop = True)
+        )
+        issue_labels_df = self._merge_partitions('issue_labels', results)
+        self.issue_labels_df = issue_labels_df[issue_labels_df['issue_id'].isin(self.issues_df['issue_id'])]
+        self.labels_df = self._merge_partitions('labels', results).drop_duplicates(subset = ['label_id'])
+
+        self._log_issue_drops(
+            sum(counts['dropped'] for _, counts in results) + len(issues_df) - len(self.issues_df),
+            sum(counts['missing_repos'] for _, counts in results)
+        )
+        self._record_rows('issues', sum(counts['records'] for _, counts in results), len(self.issues_df))
 
-        self.branches_df = self.branches_df.rename(
+        self._write_to_file('issues_clean', self.issues_df)
+        self._log_issue(f'ISSUES - Complete | {len(self.issues_df)} rows loaded.')
+        self._write_bridge('labels', self.labels_df, 'issue_labels', self.issue_labels_df, len(self.issues_df))
+
+    def _prepare_branches(self, raw_data):
+        self._ensure_clean('repos_df', 'repos_clean')
+        branches_df = self._with_full_names(pd.json_normalize(raw_data))
+
+        branches_df = branches_df[raw_columns('branches_raw')]
+
+        branches_df = branches_df.rename(
             columns = {
                 'name' : 'branch_name',
                 'commit.sha' : 'commit_sha'}
         )
 
-        og_rows = len(self.branches_df)
+        og_rows = len(branches_df)
 
-        self.branches_df = self.branches_df.dropna(
+        branches_df = branches_df.dropna(
             subset = ['branch_name']
         )
 
-        self.branches_df = self.branches_df.drop_duplicates(
-            subset = ['repo_name', 'branch_name'],
+        branches_df = branches_df.drop_duplicates(
+            subset = ['repo_full_name', 'branch_name'],
             keep = 'last'
         )
 
-        new_rows = len(self.branches_df)
+        new_rows = len(branches_df)
 
-        if og_rows != new_rows:
-            self._log_issues(f'BRANCHES | {og_rows - new_rows} dropped during cleaning.')
+        dropped = og_rows - new_rows
 
-        self.branches_df['branch_id'] = self.branches_df.apply(
-            lambda r: generate_guid(
-                NAMESPACE_BRANCH,
-                f"{r['repo_name']}|{r['branch_name']}"
-            ),
-            axis = 1
+        branches_df['branch_id'] = generate_guids(
+            NAMESPACE_BRANCH,
+            self._guid_repo_keys(branches_df['repo_full_name']) + '|' + branches_df['branch_name'].astype(str)
         )
 
-        self.branches_df = self.branches_df.merge(
-            self.repos_df[['repo_id', 'repo_name']],
-            on = 'repo_name',
+        branches_df = branches_df.merge(
+            self.repos_df[['repo_id', 'full_name']].rename(columns = {'full_name' : 'repo_full_name'}),
+            on = 'repo_full_name',
             how = 'left',
             validate = 'many_to_one'
         )
 
-        self.branches_df = self.branches_df.drop(
-            columns = ['repo_name']
+        branches_df = branches_df.drop(
+            columns = ['repo_full_name']
         )
 
-        self.branches_df = self.branches_df.astype({
-            'branch_id' : 'string',
-            'repo_id' : 'string',
-            'protected' : 'Int64',
-            'commit_sha' : 'string'
-        })
+        branches_df['ingested_at'] = pd.Timestamp.utcnow()
+
+        branches_df = branches_df[['branch_id', 'branch_name', 'protected', 'commit_sha', 'repo_id', 'ingested_at']]
+        branches_df = self._apply_schema('branches', branches_df)
 
+        return branches_df, dropped
+
+    def clean_branches(self):
+        raw_data = self._validate_raw_file('branches_raw')
+        self.branches_df, dropped = self._prepare_branches(raw_data)
+        self._record_rows('branches', len(raw_data), len(self.branches_df))
+
+        if dropped > 0:
+            self._log_issue(f'BRANCHES | {dropped} dropped during cleaning.')
+
+        self._write_to_file('branches_clean', self.branches_df)
+        self._log_issue(f'BRANCHES - Complete | {len(self.branches_df)} rows loaded.')
+
+    def clean_branches_parallel(self):
+        results = self._clean_parallel('branches', 'branches_raw')
+
+        # Branches are unique per repo and every repo sits in one partition, so there is nothing to dedupe across them
+
+        self.branches_df = self._merge_partitions('branches', results)
         self.branches_df['ingested_at'] = pd.Timestamp.utcnow()
+        dropped = sum(counts['dropped'] for _, counts in results)
+        self._record_rows('branches', sum(counts['records'] for _, counts in results), len(self.branches_df))
 
-        self.branches_df = self.branches_df[['branch_id', 'branch_name', 'protected', 'commit_sha', 'repo_id', 'ingested_at']]
+        if dropped > 0:
+            self._log_issue(f'BRANCHES | {dropped} dropped during cleaning.')
 
         self._write_to_file('branches_clean', self.branches_df)
         self._log_issue(f'BRANCHES - Complete | {len(self.branches_df)} rows loaded.')
 
-    def clean_users(self):
-        new_authors = self.issues_df[['author_id', 'author_login']].rename(
+    def start_branch_stream(self):
+        self.branch_progress = ChunkProgress('branches', _branch_key)
+
+    def clean_branch_partition(self, file_path):
+        progress = self.branch_progress
+
+        for raw_batch in self._latest_batches(file_path, progress):
+            branches_df, batch_dropped = self._prepare_branches(raw_batch)
+            progress.dropped += batch_dropped
+            self._record_rows('branches', len(raw_batch), len(branches_df))
+
+            self._append_to_file('branches_clean', branches_df, progress.batch_number)
+            progress.batch_number += 1
+            progress.rows += len(branches_df)
+
+    def finish_branch_stream(self):
+        progress = self.branch_progress
+
+        if progress.dropped > 0:
+            self._log_issue(f'BRANCHES | {progress.dropped} dropped during cleaning.')
+
+        METRICS.gauge('clean_peak_rss_mb', 'Peak resident memory while cleaning', merge = 'max').set_max(progress.memory.peak_mb, dataset = 'branches')
+        self._log_issue(f'BRANCHES - Complete | {progress.rows} rows loaded | peak RSS {progress.memory.peak_mb:.0f} MB.')
+
+    def clean_branches_chunked(self):
+        self.start_branch_stream()
+        self.clean_branch_partition(raw_file_path(RAW_DIR, 'branches_raw'))
+        self.finish_branch_stream()
+
+    def _issue_users(self, issues_df):
+        new_authors = issues_df[['author_id', 'author_login']].rename(
             columns = {
                 'author_id' : 'user_id',
                 'author_login' : 'user_login'
             }
         )
 
-        new_assignees = self.issues_df[['assignee_id', 'assignee_login']].rename(
+        new_assignees = issues_df[['assignee_id', 'assignee_login']].rename(
             columns = {
                 'assignee_id' : 'user_id',
                 'assignee_login' : 'user_login'
@@ -433,65 +847,121 @@ class CleanData:
             ignore_index = True
         )
 
-        new_users = (
+        return (
             new_users
             .drop_duplicates(subset = ['user_id'])
             .dropna(subset = ['user_id', 'user_login'])
         )
 
-        self.users_df = pd.concat(
-            [self.users_df, new_users],
-            ignore_index = True
-        )
+    def _dimension(self, entity, key_column, login_column):
+        if entity not in self.dimensions:
+            self.dimensions[entity] = DimensionStore(self.dimension_db_path, entity, key_column, [login_column])
+
+        return self.dimensions[entity]
+
+    def _merge_dimension(self, entity, store, run_df):
+        # The clean file is the whole dimension from the store, not just the entities this run happened to see
+
+        new_df, changed_df = store.merge(run_df)
+        dimension_df = store.frame()
 
-        og_rows = len(self.users_df)
+        METRICS.counter('dimension_rows_total', 'Dimension rows seen per run by entity and kind').inc(len(new_df), entity = entity, kind = 'new')
+        METRICS.counter('dimension_rows_total', 'Dimension rows seen per run by entity and kind').inc(len(changed_df), entity = entity, kind = 'changed')
+        METRICS.gauge('dimension_size', 'Rows held in each dimension store').set(len(dimension_df), entity = entity)
 
-        self.users_df = self.users_df.drop_duplicates(
-            subset = ['user_id']
+        self._write_to_file(f'{entity}_clean', dimension_df)
+        self._log_issue(
+            f'{entity.upper()} - Complete | {len(new_df)} new, {len(changed_df)} changed, '
+            f'{len(run_df) - len(new_df) - len(changed_df)} already known, {len(dimension_df)} total.'
         )
 
-        new_rows = len(self.users_df)
+        return dimension_df, new_df
+
+    def clean_users(self):
+        # Chunked issue cleaning leaves only the user pairs behind, not the full issues frame
+
+        if self.issue_users_df is not None:
+            run_users = self.issue_users_df
+        else:
+            self._ensure_clean('issues_df', 'issues_clean')
+            run_users = self._issue_users(self.issues_df)
+
+        og_rows = len(run_users)
+        run_users = run_users.drop_duplicates(subset = ['user_id'])
+        new_rows = len(run_users)
 
         if og_rows != new_rows:
-            self._log_issues(f'USERS | {og_rows - new_rows} dropped during cleaning.')
+            self._log_issue(f'USERS | {og_rows - new_rows} dropped during cleaning.')
 
-        self.users_df = self.users_df.astype({
-            'user_id' : 'string',
-            'user_id' : 'string'
-        })
+        self._record_rows('users', og_rows, new_rows)
 
-        self._write_to_file('users_clean', self.users_df)
-        self._log_issue(f'USERS - Complete | {len(self.users_df)} rows loaded.')
+        store = self._dimension('users', 'user_id', 'user_login')
+        self.users_df, self.new_users_df = self._merge_dimension('users', store, run_users)
 
-    def clean_owners(self):
-        new_owners = self.repos_df[['owner_id', 'owner_login']]
+        return self.new_users_df
 
-        self.owners_df = pd.concat(
-            [self.owners_df, new_owners],
-            ignore_index = True
-        )
+    def clean_owners(self):
+        self._ensure_clean('repos_df', 'repos_clean')
+        run_owners = self.repos_df[['owner_id', 'owner_login']]
 
-        og_rows = len(self.owners_df)
+        og_rows = len(run_owners)
 
-        self.owners_df = (
-            self.owners_df
+        run_owners = (
+            run_owners
             .dropna(subset = ['owner_id', 'owner_login'])
             .drop_duplicates(subset = ['owner_id'])
             .reset_index(drop = True)
         )
         
-        new_rows = len(self.owners_df)
+        new_rows = len(run_owners)
 
         if og_rows != new_rows:
             self._log_issue(f'OWNERS | {og_rows - new_rows} dropped during cleaning.')
 
-        self._write_to_file('owners_clean', self.owners_df)
-        self._log_issue(f'OWNERS - Complete | {len(self.owners_df)} rows loaded.')
+        self._record_rows('owners', og_rows, new_rows)
+
+        store = self._dimension('owners', 'owner_id', 'owner_login')
+        self.owners_df, self.new_owners_df = self._merge_dimension('owners', store, run_owners)
+
+        return self.new_owners_df
+
+
+# Set once per worker process by the pool initializer
+
+_worker_cleaner = None
+
+
+def _init_transform_worker(repo_lookup):
+    global _worker_cleaner
+
+    _worker_cleaner = CleanData()
+    _worker_cleaner.repos_df = frame_from_ipc(repo_lookup)
+
+
+def _clean_partition(dataset, shm_name, offset, length):
+    # Metrics are reset per partition so the snapshot sent back only holds this partition's counts
+
+    METRICS.reset()
+    raw_batch = read_partition(shm_name, offset, length)
+
+    if dataset == 'issues':
+        issues_df, labels_df, issue_labels_df, dropped, missing_repos = _worker_cleaner._prepare_issues(raw_batch)
+        frames = {'issues' : issues_df, 'labels' : labels_df, 'issue_labels' : issue_labels_df}
+    else:
+        branches_df, dropped = _worker_cleaner._prepare_branches(raw_batch)
+        frames = {'branches' : branches_df}
+        missing_repos = 0
+
+    counts = {'records' : len(raw_batch), 'dropped' : dropped, 'missing_repos' : missing_repos}
+
+    return {name : frame_to_ipc(df) for name, df in frames.items()}, counts, METRICS.snapshot()
 
 
-data_cleaner = CleanData()
-data_cleaner.clean_repos()
-data_cleaner.clean_owners()
-data_cleaner.clean_branches()
-data_cleaner.clean_issues()
-data_cleaner.clean_users()
\ No newline at end of file
+if __name__ == '__main__':
+    data_cleaner = CleanData()
+    data_cleaner.clean_repos()
+    data_cleaner.clean_owners()
+    data_cleaner.clean_branches()
+    data_cleaner.clean_issues()
+    data_cleaner.clean_users()
+    METRICS.export()
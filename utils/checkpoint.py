@@ -0,0 +1,94 @@
+import os
+import json
+import threading
+from pathlib import Path
+
+
+class ExtractCheckpoint:
+    # One append-only journal per raw file, each line is a fetched page with the position it reached.
+    # Records and progress share a line, so a crash can never keep one without the other
+
+    def __init__(self, checkpoint_dir, file_name):
+        self.path = Path(checkpoint_dir) / f'{file_name}.ndjson'
+        self.completed = set()
+        self.positions = {}
+        self.records = 0
+        self._lock = threading.Lock()
+        self._file = None
+
+    def __enter__(self):
+        self.path.parent.mkdir(parents = True, exist_ok = True)
+        valid_bytes = self._scan()
+
+        # A torn last line from a crash is cut off so new pages append cleanly
+
+        if self.path.exists() and os.path.getsize(self.path) > valid_bytes:
+            with open(self.path, 'r+b') as file:
+                file.truncate(valid_bytes)
+
+        self._file = open(self.path, 'ab')
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._file.close()
+        return False
+
+    def _lines(self):
+        if not self.path.exists():
+            return
+
+        with open(self.path, 'rb') as file:
+            for line in file:
+                try:
+                    yield len(line), json.loads(line)
+                except json.JSONDecodeError:
+                    return
+
+    def _scan(self):
+        valid_bytes = 0
+
+        for size, entry in self._lines():
+            valid_bytes += size
+
+            if entry.get('done'):
+                self.completed.add(entry['repo'])
+            else:
+                self.positions.setdefault(entry['repo'], []).append(entry['position'])
+                self.records += len(entry['records'])
+
+        return valid_bytes
+
+    @property
+    def resumed(self):
+        return bool(self.completed or self.positions)
+
+    def resume_positions(self, repo):
+        return self.positions.get(repo, [])
+
+    def pending(self, repo_names):
+        return [repo for repo in repo_names if repo not in self.completed]
+
+    def replay(self, repo_names):
+        # Pages already fetched for repos still in this run, in the order they were journaled
+
+        repo_names = set(repo_names)
+
+        for _, entry in self._lines():
+            if not entry.get('done') and entry['repo'] in repo_names:
+                yield entry['repo'], entry['position'], entry['records']
+
+    def _append(self, entry):
+        line = (json.dumps(entry, ensure_ascii = False) + '\n').encode('UTF-8')
+
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def record(self, repo, position, records):
+        self._append({'repo' : repo, 'position' : position, 'records' : records})
+
+    def complete(self, repo):
+        self._append({'repo' : repo, 'done' : True})
+
+    def clear(self):
+        self.path.unlink(missing_ok = True)
@@ -0,0 +1,188 @@
+import shutil
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Types follow the migrations/*.sql files: UNIQUEIDENTIFIER and VARCHAR as strings,
+# INT as int32, BIT as bool and DATETIME2(3) as UTC millisecond timestamps.
+# github_* ids and *_login columns are carried for downstream joins and are not in the SQL tables.
+
+GUID = pa.string()
+TIMESTAMP = pa.timestamp('ms', tz = 'UTC')
+
+CLEAN_SCHEMAS = {
+    'repos_clean' : pa.schema([
+        ('repo_id', GUID),
+        ('github_repo_id', pa.int64()),
+        ('repo_name', pa.string()),
+        ('full_name', pa.string()),
+        ('description', pa.string()),
+        ('topics', pa.string()),
+        ('language', pa.string()),
+        ('owner_id', GUID),
+        ('github_owner_id', pa.int64()),
+        ('owner_login', pa.string()),
+        ('visibility', pa.string()),
+        ('private', pa.bool_()),
+        ('disabled', pa.bool_()),
+        ('fork', pa.bool_()),
+        ('archived', pa.bool_()),
+        ('default_branch', pa.string()),
+        ('stargazers_count', pa.int32()),
+        ('watchers_count', pa.int32()),
+        ('forks_count', pa.int32()),
+        ('forks', pa.int32()),
+        ('open_issues_count', pa.int32()),
+        ('created_at', TIMESTAMP),
+        ('updated_at', TIMESTAMP),
+        ('pushed_at', TIMESTAMP)
+    ]),
+    'issues_clean' : pa.schema([
+        ('issue_id', GUID),
+        ('github_issue_id', pa.int64()),
+        ('number', pa.int32()),
+        ('author_id', GUID),
+        ('github_author_id', pa.int64()),
+        ('author_login', pa.string()),
+        ('title', pa.string()),
+        ('state', pa.string()),
+        ('locked', pa.bool_()),
+        ('comments', pa.int32()),
+        ('pr_merged_at', TIMESTAMP),
+        ('created_at', TIMESTAMP),
+        ('updated_at', TIMESTAMP),
+        ('closed_at', TIMESTAMP),
+        ('labels', pa.string()),
+        ('assignee_id', GUID),
+        ('assignee_login', pa.string()),
+        ('repo_id', GUID)
+    ]),
+    'branches_clean' : pa.schema([
+        ('branch_id', GUID),
+        ('branch_name', pa.string()),
+        ('protected', pa.bool_()),
+        ('commit_sha', pa.string()),
+        ('repo_id', GUID),
+        ('ingested_at', TIMESTAMP)
+    ]),
+    'users_clean' : pa.schema([
+        ('user_id', GUID),
+        ('user_login', pa.string())
+    ]),
+    'owners_clean' : pa.schema([
+        ('owner_id', GUID),
+        ('owner_login', pa.string())
+    ]),
+    'labels_clean' : pa.schema([
+        ('label_id', GUID),
+        ('label_name', pa.string())
+    ]),
+    'issue_labels_clean' : pa.schema([
+        ('issue_label_id', GUID),
+        ('issue_id', GUID),
+        ('label_id', GUID)
+    ]),
+    'topics_clean' : pa.schema([
+        ('topic_id', GUID),
+        ('topic_name', pa.string())
+    ]),
+    'repo_topics_clean' : pa.schema([
+        ('repo_topic_id', GUID),
+        ('repo_id', GUID),
+        ('topic_id', GUID)
+    ])
+}
+
+PARTITION_COLS = {
+    'issues_clean' : ['repo_id']
+}
+
+
+def dataset_path(clean_dir, file_name):
+    return Path(clean_dir) / f'{file_name}.parquet'
+
+
+def to_table(df, file_name):
+    schema = CLEAN_SCHEMAS[file_name]
+    arrays = []
+
+    for field in schema:
+        # Sub-millisecond precision is dropped to match DATETIME2(3), everything else must cast cleanly
+
+        array = pa.array(df[field.name], from_pandas = True)
+        arrays.append(array.cast(field.type, safe = not pa.types.is_timestamp(field.type)))
+
+    return pa.Table.from_arrays(arrays, schema = schema)
+
+
+def write_parquet(clean_dir, file_name, df, batch_number = 0, partitioned = False):
+    curr_path = dataset_path(clean_dir, file_name)
+    backup_path = dataset_path(clean_dir, f'{file_name}_backup')
+
+    if batch_number == 0:
+        if backup_path.exists():
+            shutil.rmtree(backup_path)
+
+        if curr_path.exists():
+            curr_path.rename(backup_path)
+
+    pq.write_to_dataset(
+        to_table(df, file_name),
+        root_path = curr_path,
+        partition_cols = PARTITION_COLS.get(file_name) if partitioned else None,
+        basename_template = f'batch{batch_number:05d}-{{i}}.parquet',
+        compression = 'zstd'
+    )
+
+
+def replace_parquet(clean_dir, file_name, df, partitioned = False):
+    # Swaps a dataset for a rewritten one, unlike a first batch this leaves the backup alone
+
+    curr_path = dataset_path(clean_dir, file_name)
+    tmp_path = dataset_path(clean_dir, f'{file_name}_tmp')
+
+    if tmp_path.exists():
+        shutil.rmtree(tmp_path)
+
+    pq.write_to_dataset(
+        to_table(df, file_name),
+        root_path = tmp_path,
+        partition_cols = PARTITION_COLS.get(file_name) if partitioned else None,
+        basename_template = 'batch00000-{i}.parquet',
+        compression = 'zstd'
+    )
+
+    if curr_path.exists():
+        shutil.rmtree(curr_path)
+
+    tmp_path.rename(curr_path)
+
+
+def read_parquet(clean_dir, file_name, columns = None, filters = None):
+    # filters use the pyarrow DNF form, e.g. [('repo_id', '=', repo_id)], and prune partitions and row groups
+
+    table = pq.read_table(
+        dataset_path(clean_dir, file_name),
+        columns = columns,
+        filters = filters,
+        schema = CLEAN_SCHEMAS[file_name]
+    )
+
+    return table.to_pandas()
+
+
+def frame_to_ipc(df):
+    # Arrow IPC stream for handing frames between processes, the pandas metadata keeps every dtype intact
+
+    table = pa.Table.from_pandas(df, preserve_index = False)
+    sink = pa.BufferOutputStream()
+
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+
+    return sink.getvalue()
+
+
+def frame_from_ipc(buffer):
+    return pa.ipc.open_stream(buffer).read_all().to_pandas()
@@ -0,0 +1,199 @@
+import os
+import re
+import datetime
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from config import REJECT_DIR
+from utils.schema import CREATE_TABLE, MIGRATION_DIR, load_schema
+from utils.columnar import read_parquet
+
+# UNIQUE and FOREIGN KEY constraints are read from the migrations, CHECK bodies are T-SQL and are
+# mirrored below as masks by constraint name. Every mask flags the rows that would fail on the server.
+
+CONSTRAINT = re.compile(r'CONSTRAINT (\w+)\s+(UNIQUE|FOREIGN KEY|CHECK)\s*\(([^)]*)\)(?:\s*REFERENCES (\w+) \(\[?(\w+)\]?\))?')
+
+HEX_SHA = r'[0-9a-fA-F]*'
+
+
+def _before(df, column, earlier):
+    # NULL on either side makes a T-SQL CHECK unknown, which passes
+
+    return (df[column] < df[earlier]).fillna(False)
+
+
+CHECKS = {
+    'CK_repos_visibility' : lambda df: df['visibility'].notna() & ~df['visibility'].isin(['public', 'private', 'internal']),
+    'CK_non_negative_counts' : lambda df: (
+        df[['stargazers_count', 'forks_count', 'watchers_count', 'open_issues_count']]
+        .apply(pd.to_numeric, errors = 'coerce')
+        .lt(0)
+        .any(axis = 1)
+    ),
+    'CK_repos_timestamps' : lambda df: _before(df, 'updated_at', 'created_at'),
+    'CK_repos_pushed_at' : lambda df: _before(df, 'pushed_at', 'created_at'),
+    'CK_issues_timestamps' : lambda df: _before(df, 'updated_at', 'created_at'),
+    'CK_closed_at' : lambda df: _before(df, 'closed_at', 'created_at'),
+    'CK_commit_sha_hex' : lambda df: df['commit_sha'].notna() & ~df['commit_sha'].astype('string').str.fullmatch(HEX_SHA).fillna(True)
+}
+
+
+def _as_text(values):
+    # CSV frames infer their own dtypes, so values are compared as text with nulls spelled the same way
+
+    return values.astype(object).where(values.notna(), None).astype(str)
+
+
+def _hash_rows(df):
+    return pd.util.hash_pandas_object(df.apply(_as_text), index = False).to_numpy()
+
+
+class TableConstraints:
+    def __init__(self):
+        self.unique = {}
+        self.foreign = {}
+        self.checks = []
+
+
+def parse_constraints(migration_path):
+    tables = {}
+
+    with open(migration_path, 'r', encoding = 'UTF-8') as file:
+        sql = file.read()
+
+    for table_name, body in CREATE_TABLE.findall(sql):
+        constraints = TableConstraints()
+
+        for name, kind, columns, parent, parent_column in CONSTRAINT.findall(body):
+            if kind == 'UNIQUE':
+                constraints.unique[name] = [column.strip().strip('[]') for column in columns.split(',')]
+            elif kind == 'FOREIGN KEY':
+                constraints.foreign[name] = (columns.strip().strip('[]'), parent, parent_column)
+            else:
+                constraints.checks.append(name)
+
+        tables[table_name] = constraints
+
+    return tables
+
+
+@lru_cache(maxsize = None)
+def load_constraints():
+    tables = {}
+
+    for migration_path in sorted(Path(MIGRATION_DIR).glob('*.sql')):
+        tables.update(parse_constraints(migration_path))
+
+    missing = [name for constraints in tables.values() for name in constraints.checks if name not in CHECKS]
+
+    if missing:
+        raise ValueError('utils/constraints.py has no mask for: ' + ', '.join(missing))
+
+    return tables
+
+
+class ConstraintValidator:
+    # Rows that would fail a constraint are quarantined before the bulk load, so one bad row never
+    # rolls back a whole batch. Rejected parents take their children with them through the foreign keys
+
+    def __init__(self, clean_dir, input_format = 'csv', reject_dir = REJECT_DIR):
+        self.clean_dir = clean_dir
+        self.input_format = input_format
+        self.reject_dir = reject_dir
+        self.rejected = {}
+        self._clean_columns = {}
+
+        os.makedirs(self.reject_dir, exist_ok = True)
+
+    def reject_path(self, table_name):
+        return Path(self.reject_dir) / f'{table_name}_rejects.csv'
+
+    def _clean_column(self, table_name, column):
+        # Deltas only hold changed rows, the clean file stands in for everything already on the server
+
+        if (table_name, column) not in self._clean_columns:
+            file_name = f'{table_name}_clean'
+
+            if self.input_format == 'parquet':
+                values = read_parquet(self.clean_dir, file_name, columns = [column])[column]
+            else:
+                values = pd.read_csv(Path(self.clean_dir) / f'{file_name}.csv', usecols = [column], dtype = str)[column]
+
+            self._clean_columns[(table_name, column)] = _as_text(values)
+
+        return self._clean_columns[(table_name, column)]
+
+    def _parent_keys(self, table_name, column):
+        keys = self._clean_column(table_name, column)
+
+        return keys[~keys.isin(self.rejected.get(table_name, ()))]
+
+    def _taken(self, table, df, key, columns):
+        # Duplicates inside the frame keep their last row, a value held by any other row of the clean file is taken
+
+        others = pd.DataFrame({column : self._clean_column(table.name, column) for column in [key] + columns})
+        others = others[~others[key].isin(df[key].astype(str))]
+
+        return df.duplicated(subset = columns, keep = 'last') | pd.Series(np.isin(_hash_rows(df[columns]), _hash_rows(others[columns])), index = df.index)
+
+    def masks(self, table, df):
+        columns = load_schema()[table.name]
+        constraints = load_constraints()[table.name]
+        masks = {}
+
+        for name, spec in columns.items():
+            if name not in df.columns:
+                continue
+
+            if not spec.nullable:
+                masks[f'NOT_NULL_{name}'] = df[name].isna()
+
+            if spec.length is not None:
+                masks[f'LENGTH_{name}'] = (df[name].astype('string').str.len() > spec.length).fillna(False)
+
+        for name in constraints.checks:
+            masks[name] = CHECKS[name](df)
+
+        # Within one load the last row for a key wins, as it would have in the clean step
+
+        key_columns = [col.name for col in table.primary_key.columns]
+        masks[f'PK_{table.name}'] = df.duplicated(subset = key_columns, keep = 'last')
+
+        for name, unique_columns in constraints.unique.items():
+            masks[name] = self._taken(table, df, key_columns[0], unique_columns)
+
+        for name, (column, parent, parent_column) in constraints.foreign.items():
+            masks[name] = df[column].notna() & ~df[column].astype(str).isin(self._parent_keys(parent, parent_column))
+
+        return pd.DataFrame(masks, index = df.index).astype(bool)
+
+    def validate(self, table, df):
+        # Returns the rows safe to load and the number of rows failing each constraint
+
+        masks = self.masks(table, df)
+        bad = masks.any(axis = 1)
+
+        if not bad.any():
+            return df, {}
+
+        failed = masks[bad]
+        rejects_df = df[bad].copy()
+        rejects_df['reject_reason'] = failed.dot(failed.columns + ';').str.rstrip(';')
+        rejects_df['rejected_at'] = datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+        reject_path = self.reject_path(table.name)
+        rejects_df.to_csv(reject_path, mode = 'a', header = not reject_path.exists(), index = False, encoding = 'UTF-8')
+
+        # A key only counts as rejected when no row for it is left to load
+
+        key = table.primary_key.columns.values()[0].name
+        valid_df = df[~bad]
+        rejected_keys = set(rejects_df[key].dropna().astype(str)) - set(valid_df[key].dropna().astype(str))
+        self.rejected.setdefault(table.name, set()).update(rejected_keys)
+
+        counts = failed.sum()
+
+        return valid_df, counts[counts > 0].to_dict()
@@ -0,0 +1,98 @@
+import sqlite3
+import datetime
+import threading
+import pandas as pd
+
+
+class DimensionStore:
+    # Every user or owner ever seen, keyed by GUID, so a run only has to look up the keys it brings
+
+    def __init__(self, db_path, entity, key_column, columns):
+        self.entity = entity
+        self.key_column = key_column
+        self.columns = columns
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread = False)
+        self._conn.execute('PRAGMA journal_mode = WAL')
+        self._conn.execute('PRAGMA synchronous = NORMAL')
+
+        column_defs = ', '.join(f'{column} TEXT' for column in columns)
+
+        self._conn.execute(
+            f'''
+            CREATE TABLE IF NOT EXISTS {entity} (
+                {key_column} TEXT PRIMARY KEY,
+                {column_defs},
+                first_seen_at TEXT NOT NULL,
+                last_seen_at TEXT NOT NULL
+            ) WITHOUT ROWID
+            '''
+        )
+        self._conn.execute(f'CREATE TEMP TABLE IF NOT EXISTS incoming_{entity} ({key_column} TEXT PRIMARY KEY, {column_defs})')
+        self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute(f'SELECT COUNT(*) FROM {self.entity}').fetchone()[0]
+
+    def __contains__(self, key):
+        with self._lock:
+            return self._conn.execute(
+                f'SELECT 1 FROM {self.entity} WHERE {self.key_column} = ?',
+                (key,)
+            ).fetchone() is not None
+
+    def merge(self, df):
+        # Returns the rows never seen before and the known rows whose attributes changed, e.g. a renamed login
+
+        all_columns = [self.key_column] + self.columns
+        df = df.dropna(subset = [self.key_column]).drop_duplicates(subset = [self.key_column], keep = 'last')
+        values = df[all_columns].astype(object).where(df[all_columns].notna(), None)
+        now = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        column_list = ', '.join(all_columns)
+        placeholders = ', '.join('?' for _ in all_columns)
+        changed_filter = ' OR '.join(f'known.{column} IS NOT incoming.{column}' for column in self.columns)
+
+        with self._lock:
+            self._conn.execute(f'DELETE FROM incoming_{self.entity}')
+            self._conn.executemany(
+                f'INSERT INTO incoming_{self.entity} ({column_list}) VALUES ({placeholders})',
+                values.itertuples(index = False, name = None)
+            )
+
+            rows = self._conn.execute(
+                f'''
+                SELECT incoming.*, known.{self.key_column} IS NULL
+                FROM incoming_{self.entity} AS incoming
+                LEFT JOIN {self.entity} AS known ON known.{self.key_column} = incoming.{self.key_column}
+                WHERE known.{self.key_column} IS NULL OR {changed_filter}
+                '''
+            ).fetchall()
+
+            self._conn.execute(
+                f'''
+                INSERT INTO {self.entity} ({column_list}, first_seen_at, last_seen_at)
+                SELECT {column_list}, ?, ? FROM incoming_{self.entity} WHERE true
+                ON CONFLICT ({self.key_column}) DO UPDATE SET
+                    {', '.join(f'{column} = excluded.{column}' for column in self.columns)},
+                    last_seen_at = excluded.last_seen_at
+                ''',
+                (now, now)
+            )
+            self._conn.commit()
+
+        changes = pd.DataFrame(rows, columns = all_columns + ['is_new'], dtype = 'string')
+        is_new = changes.pop('is_new') == '1'
+
+        return changes[is_new].reset_index(drop = True), changes[~is_new].reset_index(drop = True)
+
+    def frame(self):
+        with self._lock:
+            return pd.read_sql_query(
+                f'SELECT {self.key_column}, {", ".join(self.columns)} FROM {self.entity} ORDER BY first_seen_at, {self.key_column}',
+                self._conn,
+                dtype = 'string'
+            )
+
+    def close(self):
+        self._conn.close()
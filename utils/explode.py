@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+
+def _name_lists(values, field = None):
+    # Lists of names, or of dicts holding a name field, as one Arrow list<string> array.
+    # Anything that is not a list comes through as a null list
+
+    item_type = pa.struct([(field, pa.string())]) if field else pa.string()
+    lists = pa.array(values, type = pa.list_(item_type), from_pandas = True)
+
+    if not field:
+        return lists
+
+    return pa.ListArray.from_arrays(lists.offsets, pc.list_flatten(lists).field(field), mask = lists.is_null())
+
+
+def explode_names(ids, values, field = None):
+    # One (id, name) row per list element in list order, flattened in Arrow rather than row by row in Python.
+    # Blank names are dropped
+
+    lists = _name_lists(values, field)
+    parents = pc.list_parent_indices(lists).to_numpy()
+
+    exploded = pd.DataFrame({
+        'id' : np.asarray(ids)[parents],
+        'name' : pc.list_flatten(lists).to_pandas(types_mapper = pd.ArrowDtype).astype(pd.StringDtype('pyarrow'))
+    })
+
+    return exploded[exploded['name'].notna() & (exploded['name'].str.strip() != '')].reset_index(drop = True)
+
+
+def join_names(values, field = None, index = None):
+    # The same lists comma-joined, an empty list gives '' and a missing one gives null
+
+    joined = pc.binary_join(_name_lists(values, field), ',')
+
+    return pd.Series(joined.to_pandas(types_mapper = pd.ArrowDtype).array, index = index).astype(pd.StringDtype('pyarrow'))
@@ -0,0 +1,119 @@
+from functools import lru_cache
+
+# Raw fields each clean step reads, as dotted paths into the API payload and in the order CleanData
+# selects them. A [] segment maps over a list, so labels[].name keeps only the name of each label.
+
+RAW_FIELDS = {
+    'repos_raw' : [
+        'id',
+        'name',
+        'full_name',
+        'description',
+        'topics',
+        'language',
+        'owner.id',
+        'owner.login',
+        'visibility',
+        'private',
+        'disabled',
+        'fork',
+        'archived',
+        'default_branch',
+        'stargazers_count',
+        'watchers_count',
+        'forks_count',
+        'forks',
+        'open_issues_count',
+        'created_at',
+        'updated_at',
+        'pushed_at'
+    ],
+    'issues_raw' : [
+        'id',
+        'repo_full_name',
+        'number',
+        'user.login',
+        'user.id',
+        'title',
+        'state',
+        'locked',
+        'comments',
+        'pull_request.merged_at',
+        'created_at',
+        'updated_at',
+        'closed_at',
+        'labels[].name',
+        'assignee.login',
+        'assignee.id'
+    ],
+    'branches_raw' : [
+        'name',
+        'protected',
+        'repo_full_name',
+        'commit.sha'
+    ]
+}
+
+# Kept in the raw files without being selected, repo_name resolves records from before multi-owner support
+
+EXTRA_FIELDS = {
+    'repos_raw' : [],
+    'issues_raw' : ['repo_name'],
+    'branches_raw' : ['repo_name']
+}
+
+
+def raw_columns(file_name):
+    # The json_normalize column each field ends up in, lists stay whole in a single column
+
+    return [path.split('[]', 1)[0] for path in RAW_FIELDS[file_name]]
+
+
+@lru_cache(maxsize = None)
+def field_tree(file_name):
+    # Nested dict of the fields to keep, None marks a value that is kept whole
+
+    tree = {}
+
+    for path in RAW_FIELDS[file_name] + EXTRA_FIELDS[file_name]:
+        node = tree
+        parts = path.split('.')
+
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+
+        node[parts[-1]] = None
+
+    return tree
+
+
+def _project(value, tree):
+    projected = {}
+
+    for key, subtree in tree.items():
+        many = key.endswith('[]')
+        name = key[:-2] if many else key
+
+        # Missing keys stay missing and nulls stay null, json_normalize then builds the same columns as before
+
+        if name not in value:
+            continue
+
+        item = value[name]
+
+        if subtree is None or item is None:
+            projected[name] = item
+        elif many and isinstance(item, list):
+            projected[name] = [_project(element, subtree) if isinstance(element, dict) else element for element in item]
+        elif isinstance(item, dict):
+            projected[name] = _project(item, subtree)
+        else:
+            projected[name] = item
+
+    return projected
+
+
+def project_records(file_name, records):
+    tree = field_tree(file_name)
+
+    return [_project(record, tree) for record in records]
@@ -1,10 +1,35 @@
 import uuid
+from functools import lru_cache
+
+import pandas as pd
 
 NAMESPACE_OWNER  = uuid.uuid5(uuid.NAMESPACE_DNS, 'github.owner')
 NAMESPACE_REPO   = uuid.uuid5(uuid.NAMESPACE_DNS, 'github.repo')
 NAMESPACE_ISSUE  = uuid.uuid5(uuid.NAMESPACE_DNS, 'github.issue')
 NAMESPACE_BRANCH = uuid.uuid5(uuid.NAMESPACE_DNS, 'github.branch')
 NAMESPACE_USER = uuid.uuid5(uuid.NAMESPACE_DNS, 'github.user')
+NAMESPACE_LABEL = uuid.uuid5(uuid.NAMESPACE_DNS, 'github.label')
+NAMESPACE_TOPIC = uuid.uuid5(uuid.NAMESPACE_DNS, 'github.topic')
+NAMESPACE_ISSUE_LABEL = uuid.uuid5(uuid.NAMESPACE_DNS, 'github.issue_label')
+NAMESPACE_REPO_TOPIC = uuid.uuid5(uuid.NAMESPACE_DNS, 'github.repo_topic')
+
+GUID_CACHE_SIZE = 1_000_000
 
 def generate_guid(namespace: uuid.UUID, key: str) -> str:
-    return str(uuid.uuid5(namespace, key))
\ No newline at end of file
+    return str(uuid.uuid5(namespace, key))
+
+@lru_cache(maxsize = GUID_CACHE_SIZE)
+def _cached_guid(namespace: uuid.UUID, key: str) -> str:
+    return generate_guid(namespace, key)
+
+def generate_guids(namespace: uuid.UUID, keys) -> pd.Series:
+    # Hash each distinct key once and broadcast back, nulls stay null
+
+    keys = keys if isinstance(keys, pd.Series) else pd.Series(keys)
+    codes, uniques = pd.factorize(keys, use_na_sentinel = True)
+    unique_guids = [_cached_guid(namespace, str(key)) for key in uniques]
+
+    # Null keys are coded -1, which take() maps onto the trailing None
+    guids = pd.Series(unique_guids + [None], dtype = 'object').take(codes).to_numpy()
+
+    return pd.Series(guids, index = keys.index, dtype = 'object')
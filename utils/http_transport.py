@@ -0,0 +1,107 @@
+import random
+import asyncio
+import threading
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from utils.metrics import METRICS
+
+RETRY_STATUSES = (500, 502, 503, 504)
+RETRY_EXCEPTIONS = (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError)
+
+
+class CountingRetry(Retry):
+    # urllib3 retries happen below requests, counting them here is the only way to see them
+
+    def increment(self, method = None, url = None, response = None, error = None, _pool = None, _stacktrace = None):
+        reason = type(error).__name__ if error is not None else str(getattr(response, 'status', 'unknown'))
+        METRICS.counter('http_retries_total', 'Requests retried after a 5xx or connection failure').inc(reason = reason)
+
+        return super().increment(method, url, response, error, _pool, _stacktrace)
+
+
+class HttpTransport:
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, pool_size = 10, connect_timeout = 5.0, read_timeout = 30.0, max_retries = 4, backoff_factor = 0.5, max_backoff = 30.0):
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self._lock = threading.Lock()
+        self.session = requests.Session()
+        self.session.headers['Accept-Encoding'] = 'gzip, deflate'
+        self._mount(pool_size)
+
+    # One pooled session per process, shared by GithubAuth and ExtractData
+
+    @classmethod
+    def shared(cls):
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+
+            return cls._shared
+
+    def _mount(self, pool_size):
+        # Only idempotent GETs are retried, 403/429 are left to the rate limit scheduler
+
+        retry = CountingRetry(
+            total = self.max_retries,
+            connect = self.max_retries,
+            read = self.max_retries,
+            status = self.max_retries,
+            status_forcelist = RETRY_STATUSES,
+            allowed_methods = frozenset({'GET', 'HEAD'}),
+            backoff_factor = self.backoff_factor,
+            backoff_max = self.max_backoff,
+            raise_on_status = False
+        )
+        adapter = HTTPAdapter(pool_connections = 4, pool_maxsize = pool_size, max_retries = retry)
+
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.pool_size = pool_size
+
+    def ensure_pool_size(self, pool_size):
+        with self._lock:
+            if pool_size > self.pool_size:
+                self._mount(pool_size)
+
+    def get(self, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+
+        return self.session.get(url, **kwargs)
+
+    def post(self, url, **kwargs):
+        # Not covered by the adapter retries, callers retry with retry_delay
+
+        kwargs.setdefault('timeout', self.timeout)
+
+        return self.session.post(url, **kwargs)
+
+    def async_session(self, limit):
+        connector = aiohttp.TCPConnector(limit = limit, keepalive_timeout = 30)
+        timeout = aiohttp.ClientTimeout(total = None, sock_connect = self.timeout[0], sock_read = self.timeout[1])
+
+        return aiohttp.ClientSession(
+            connector = connector,
+            timeout = timeout,
+            headers = {'Accept-Encoding' : 'gzip, deflate'}
+        )
+
+    def retry_delay(self, attempt, reason):
+        # Async requests retry by hand, with the same budget and full jitter backoff as the sync path
+
+        if attempt >= self.max_retries:
+            return None
+
+        METRICS.counter('http_retries_total', 'Requests retried after a 5xx or connection failure').inc(reason = reason)
+
+        return random.uniform(0, min(self.max_backoff, self.backoff_factor * 2 ** attempt))
+
+    def close(self):
+        self.session.close()
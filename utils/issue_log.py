@@ -0,0 +1,14 @@
+import os
+import threading
+import datetime
+from config import ISSUES_DIR
+
+_lock = threading.Lock()
+
+
+def log_issue(message, file_name = 'pipeline_error_log.txt'):
+    timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    with _lock:
+        with open(os.path.join(ISSUES_DIR, file_name), 'a', encoding = 'UTF-8') as issue_log:
+            issue_log.write(f'{timestamp}: {message}\n')
@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+
+
+class KeyIndex:
+    # Sorted uint64 key hashes, 8 bytes per key instead of a full DataFrame of seen rows.
+    # Each key keeps the int64 version it was last added with, 0 when keys carry no version
+
+    def __init__(self):
+        self.keys = np.empty(0, dtype = np.uint64)
+        self.versions = np.empty(0, dtype = np.int64)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def hash_keys(self, keys):
+        return pd.util.hash_array(np.asarray(keys, dtype = object))
+
+    def contains(self, hashed):
+        return np.isin(hashed, self.keys)
+
+    def versions_of(self, hashed):
+        # Only meaningful where contains() is True
+
+        if not len(self.keys):
+            return np.zeros(len(hashed), dtype = np.int64)
+
+        return self.versions[np.searchsorted(self.keys, hashed).clip(max = len(self.keys) - 1)]
+
+    def add(self, hashed, versions = None):
+        if versions is None:
+            versions = np.zeros(len(hashed), dtype = np.int64)
+
+        keys = np.concatenate([self.keys, hashed])
+        all_versions = np.concatenate([self.versions, versions])
+        latest = last_occurrences(keys)
+        order = np.argsort(keys[latest], kind = 'stable')
+
+        self.keys = keys[latest][order]
+        self.versions = all_versions[latest][order]
+
+
+def last_occurrences(hashes, versions = None):
+    # True at the last position of every hash, so a row is only kept when no later row shares its key.
+    # With versions the highest one wins and the position only breaks ties
+
+    order = np.arange(len(hashes)) if versions is None else np.argsort(versions, kind = 'stable')
+    first_from_end = np.unique(hashes[order][::-1], return_index = True)[1]
+    keep = np.zeros(len(hashes), dtype = bool)
+    keep[order[len(hashes) - 1 - first_from_end]] = True
+
+    return keep
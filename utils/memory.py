@@ -0,0 +1,31 @@
+import os
+import resource
+
+
+def current_rss_mb():
+    # /proc gives the live resident set on Linux, elsewhere fall back to the process peak
+
+    try:
+        with open('/proc/self/statm', 'r') as statm:
+            resident_pages = int(statm.read().split()[1])
+
+        return resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+
+    except (OSError, ValueError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class StageMemory:
+    def __init__(self):
+        self.start_mb = current_rss_mb()
+        self.peak_mb = self.start_mb
+
+    def sample(self):
+        rss_mb = current_rss_mb()
+        self.peak_mb = max(self.peak_mb, rss_mb)
+
+        return rss_mb
@@ -0,0 +1,304 @@
+import os
+import json
+import time
+import random
+import bisect
+import datetime
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+from config import METRICS_DIR
+
+PREFIX = 'github_pipeline_'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+RESERVOIR_SIZE = 10000
+
+
+def _label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(label_key, extra = ()):
+    pairs = list(label_key) + list(extra)
+
+    if not pairs:
+        return ''
+
+    escaped = [
+        (name, value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in pairs
+    ]
+
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help_text, lock):
+        self.name = name
+        self.help_text = help_text
+        self.values = {}
+        self._lock = lock
+
+    def inc(self, amount = 1, **labels):
+        key = _label_key(labels)
+
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def _merge(self, key, value):
+        self.values[key] = self.values.get(key, 0) + value
+
+
+class Gauge:
+    kind = 'gauge'
+
+    # merge decides how values from other processes combine, e.g. min for quota left, max for peak memory
+
+    def __init__(self, name, help_text, lock, merge = 'last'):
+        self.name = name
+        self.help_text = help_text
+        self.merge = merge
+        self.values = {}
+        self._lock = lock
+
+    def set(self, value, **labels):
+        with self._lock:
+            self.values[_label_key(labels)] = value
+
+    def set_max(self, value, **labels):
+        key = _label_key(labels)
+
+        with self._lock:
+            self.values[key] = max(self.values.get(key, value), value)
+
+    def _merge(self, key, value):
+        if key not in self.values or self.merge == 'last':
+            self.values[key] = value
+        elif self.merge == 'max':
+            self.values[key] = max(self.values[key], value)
+        elif self.merge == 'min':
+            self.values[key] = min(self.values[key], value)
+
+
+class HistogramSeries:
+    def __init__(self, buckets):
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = []
+
+    def observe(self, value, buckets):
+        index = bisect.bisect_left(buckets, value)
+
+        if index < len(buckets):
+            self.bucket_counts[index] += 1
+
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+        # Reservoir sampling keeps percentiles honest without holding every observation
+
+        if len(self.samples) < RESERVOIR_SIZE:
+            self.samples.append(value)
+        else:
+            slot = random.randrange(self.count)
+
+            if slot < RESERVOIR_SIZE:
+                self.samples[slot] = value
+
+    def percentile(self, q):
+        if not self.samples:
+            return None
+
+        ordered = sorted(self.samples)
+
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, lock, buckets = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.values = {}
+        self._lock = lock
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+
+        with self._lock:
+            if key not in self.values:
+                self.values[key] = HistogramSeries(self.buckets)
+
+            self.values[key].observe(value, self.buckets)
+
+    def _merge(self, key, state):
+        series = self.values.setdefault(key, HistogramSeries(self.buckets))
+        series.bucket_counts = [a + b for a, b in zip(series.bucket_counts, state['bucket_counts'])]
+        series.count += state['count']
+        series.total += state['total']
+        series.max = max(series.max, state['max'])
+        series.samples = (series.samples + state['samples'])[:RESERVOIR_SIZE]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = {}
+        self.started_at = datetime.datetime.now()
+        self._lock = threading.RLock()
+
+    def _get(self, metric_class, name, help_text, **kwargs):
+        with self._lock:
+            if name not in self.metrics:
+                self.metrics[name] = metric_class(name, help_text, self._lock, **kwargs)
+
+            metric = self.metrics[name]
+
+        if not isinstance(metric, metric_class):
+            raise TypeError(f'Metric {name} is already registered as a {metric.kind}.')
+
+        return metric
+
+    def counter(self, name, help_text = ''):
+        return self._get(Counter, name, help_text)
+
+    def gauge(self, name, help_text = '', merge = 'last'):
+        return self._get(Gauge, name, help_text, merge = merge)
+
+    def histogram(self, name, help_text = '', buckets = LATENCY_BUCKETS):
+        return self._get(Histogram, name, help_text, buckets = buckets)
+
+    @contextmanager
+    def timer(self, name, help_text = '', **labels):
+        start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            self.histogram(name, help_text).observe(time.perf_counter() - start, **labels)
+
+    def reset(self):
+        with self._lock:
+            self.metrics = {}
+            self.started_at = datetime.datetime.now()
+
+    # Snapshots are plain data so worker processes can hand their metrics back to the parent
+
+    def snapshot(self):
+        with self._lock:
+            return [
+                {
+                    'kind' : metric.kind,
+                    'name' : metric.name,
+                    'help_text' : metric.help_text,
+                    'merge' : getattr(metric, 'merge', None),
+                    'buckets' : getattr(metric, 'buckets', None),
+                    'values' : [
+                        (key, value.__dict__.copy() if metric.kind == 'histogram' else value)
+                        for key, value in metric.values.items()
+                    ]
+                }
+                for metric in self.metrics.values()
+            ]
+
+    def merge(self, snapshot):
+        for state in snapshot:
+            if state['kind'] == 'counter':
+                metric = self.counter(state['name'], state['help_text'])
+            elif state['kind'] == 'gauge':
+                metric = self.gauge(state['name'], state['help_text'], state['merge'])
+            else:
+                metric = self.histogram(state['name'], state['help_text'], state['buckets'])
+
+            with self._lock:
+                for key, value in state['values']:
+                    metric._merge(tuple(tuple(pair) for pair in key), value)
+
+    def summary(self):
+        summary = {
+            'started_at' : self.started_at.isoformat(timespec = 'seconds'),
+            'finished_at' : datetime.datetime.now().isoformat(timespec = 'seconds'),
+            'counters' : {},
+            'gauges' : {},
+            'histograms' : {}
+        }
+
+        with self._lock:
+            for metric in self.metrics.values():
+                series = {}
+
+                for key, value in metric.values.items():
+                    label = ','.join(f'{name}={label_value}' for name, label_value in key) or 'total'
+
+                    if metric.kind == 'histogram':
+                        series[label] = {
+                            'count' : value.count,
+                            'sum' : round(value.total, 6),
+                            'mean' : round(value.total / value.count, 6) if value.count else None,
+                            'p50' : value.percentile(0.50),
+                            'p90' : value.percentile(0.90),
+                            'p99' : value.percentile(0.99),
+                            'max' : value.max
+                        }
+                    else:
+                        series[label] = value
+
+                summary[metric.kind + 's'][metric.name] = series
+
+        return summary
+
+    def prometheus_text(self):
+        lines = []
+
+        with self._lock:
+            for metric in self.metrics.values():
+                name = PREFIX + metric.name
+                lines.append(f'# HELP {name} {metric.help_text or metric.name}')
+                lines.append(f'# TYPE {name} {metric.kind}')
+
+                for key, value in metric.values.items():
+                    if metric.kind != 'histogram':
+                        lines.append(f'{name}{_format_labels(key)} {value}')
+                        continue
+
+                    cumulative = 0
+
+                    for bound, bucket_count in zip(metric.buckets, value.bucket_counts):
+                        cumulative += bucket_count
+                        lines.append(f'{name}_bucket{_format_labels(key, [("le", str(bound))])} {cumulative}')
+
+                    lines.append(f'{name}_bucket{_format_labels(key, [("le", "+Inf")])} {value.count}')
+                    lines.append(f'{name}_sum{_format_labels(key)} {value.total}')
+                    lines.append(f'{name}_count{_format_labels(key)} {value.count}')
+
+        return '\n'.join(lines) + '\n'
+
+    def _write_atomic(self, file_path, content):
+        tmp_path = file_path.with_name(file_path.name + '.tmp')
+
+        with open(tmp_path, 'w', encoding = 'UTF-8') as file:
+            file.write(content)
+
+        os.replace(tmp_path, file_path)
+
+    def export(self, run_id = None, metrics_dir = METRICS_DIR):
+        # One JSON summary per run, the textfile is overwritten so the collector only sees the latest run
+
+        run_id = run_id or self.started_at.strftime('%Y%m%dT%H%M%S')
+        runs_dir = Path(metrics_dir) / 'runs'
+        runs_dir.mkdir(parents = True, exist_ok = True)
+
+        summary_path = runs_dir / f'run_{run_id}.json'
+        self._write_atomic(summary_path, json.dumps({'run_id' : run_id, **self.summary()}, indent = 4, default = str))
+        self._write_atomic(Path(metrics_dir) / 'pipeline.prom', self.prometheus_text())
+
+        return summary_path
+
+
+METRICS = MetricsRegistry()
@@ -0,0 +1,188 @@
+import os
+import time
+import random
+import asyncio
+import threading
+from email.utils import parsedate_to_datetime
+from utils.metrics import METRICS
+
+
+def load_token_pool():
+    # GITHUB_TOKENS takes a comma separated pool, GITHUB_TOKEN is kept for single token setups
+
+    tokens = [token.strip() for token in os.getenv('GITHUB_TOKENS', '').split(',') if token.strip()]
+    single_token = os.getenv('GITHUB_TOKEN')
+
+    if single_token and single_token not in tokens:
+        tokens.append(single_token)
+
+    return tokens
+
+
+def mask_token(token):
+    return f'...{token[-4:]}'
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def reserve(self):
+        # Takes a slot now and returns how long the caller must wait before using it
+
+        if self.rate is None:
+            return 0.0
+
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        self.tokens -= 1
+
+        if self.tokens >= 0:
+            return 0.0
+
+        return -self.tokens / self.rate
+
+
+class TokenState:
+    def __init__(self, token, rate, capacity, limit = 5000):
+        self.token = token
+        self.limit = limit
+        self.remaining = limit
+        self.reset_at = 0.0
+        self.bucket = TokenBucket(rate, capacity)
+
+    def budget(self, now):
+        if self.reset_at and now >= self.reset_at:
+            return self.limit
+
+        return self.remaining
+
+
+class RateLimitScheduler:
+    def __init__(self, tokens, requests_per_second = 10, burst = 20, max_retries = 5, base_backoff = 1.0, max_backoff = 60.0):
+        if not tokens:
+            raise ValueError('At least one Github token is required.')
+
+        self.tokens = {token: TokenState(token, requests_per_second, burst) for token in tokens}
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        with self._lock:
+            now = time.time()
+            state = max(self.tokens.values(), key = lambda s: s.budget(now))
+
+            # Every token is spent, wait for the earliest primary window to reset
+
+            if state.budget(now) <= 0:
+                reset_at = min(s.reset_at for s in self.tokens.values())
+                return None, max(reset_at - now, 1.0)
+
+            # Count the request against the token until the response headers correct it
+
+            if state.reset_at:
+                state.remaining = state.budget(now) - 1
+
+            return state.token, state.bucket.reserve()
+
+    def acquire(self):
+        while True:
+            token, wait = self._reserve()
+
+            if wait > 0:
+                time.sleep(wait)
+
+            if token is not None:
+                return token
+
+    async def acquire_async(self):
+        while True:
+            token, wait = self._reserve()
+
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+            if token is not None:
+                return token
+
+    def update(self, token, headers):
+        state = self.tokens[token]
+
+        with self._lock:
+            if 'X-RateLimit-Limit' in headers:
+                state.limit = int(headers['X-RateLimit-Limit'])
+
+            if 'X-RateLimit-Remaining' in headers:
+                state.remaining = int(headers['X-RateLimit-Remaining'])
+                METRICS.gauge('rate_limit_remaining', 'Requests left in the current rate-limit window', merge = 'min').set(
+                    state.remaining,
+                    token = mask_token(token)
+                )
+
+            if 'X-RateLimit-Reset' in headers:
+                state.reset_at = float(headers['X-RateLimit-Reset'])
+
+    def _is_secondary_limit(self, body):
+        # X-RateLimit-* headers come with nearly every response, only the message tells a secondary limit
+        # apart from a permissions or SSO 403. Older responses called it abuse detection
+
+        if isinstance(body, bytes):
+            body = body.decode('UTF-8', errors = 'replace')
+
+        message = (body or '').lower()
+
+        return 'secondary rate limit' in message or 'abuse detection' in message
+
+    def _retry_after(self, value):
+        # Seconds or an HTTP date, None when it is neither
+
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+    def retry_delay(self, status_code, headers, attempt, body = None):
+        # Returns seconds to wait before retrying, or None when the response should be surfaced
+
+        if attempt >= self.max_retries:
+            return None
+
+        if status_code not in (403, 429):
+            return None
+
+        if 'Retry-After' in headers:
+            retry_after = self._retry_after(headers['Retry-After'])
+
+            if retry_after is not None:
+                return retry_after
+
+            return random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** attempt))
+
+        # Primary limit hit, acquire moves on to another token or waits out the reset
+
+        if headers.get('X-RateLimit-Remaining') == '0':
+            return 0.0
+
+        # GitHub sends secondary rate limits as a 403 with remaining calls left, any other 403 is a
+        # permissions problem, not something to wait out
+
+        if status_code == 403 and not self._is_secondary_limit(body):
+            return None
+
+        # Secondary rate limits, exponential backoff with full jitter
+
+        return random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** attempt))
+
+    def remaining(self):
+        return {mask_token(state.token): state.remaining for state in self.tokens.values()}
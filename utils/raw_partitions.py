@@ -0,0 +1,72 @@
+import re
+import json
+import zlib
+from multiprocessing import shared_memory
+from utils.raw_storage import iter_raw_lines
+
+# RawWriter writes records with json.dumps, so the repo can be read off the line without parsing it.
+# An unescaped quote never occurs inside a JSON string, so this can only match the real key
+
+REPO_FULL_NAME = re.compile(rb'"repo_full_name": "([^"\\]*)"')
+
+
+def repo_key(line):
+    match = REPO_FULL_NAME.search(line)
+
+    if match:
+        return match.group(1)
+
+    # Records extracted before multi-owner support only carry the short repo name
+
+    record = json.loads(line)
+
+    return str(record.get('repo_full_name') or record.get('repo_name') or '').encode('UTF-8')
+
+
+def partition_raw_lines(path, partition_count):
+    # Every record of a repo lands in the same partition, in file order
+
+    partitions = [[] for _ in range(max(1, partition_count))]
+
+    for line in iter_raw_lines(path):
+        partitions[zlib.crc32(repo_key(line)) % len(partitions)].append(line)
+
+    return [b'\n'.join(lines) for lines in partitions if lines]
+
+
+class SharedPartitions:
+    # All partitions in one shared memory block, workers attach by name and copy out only their own slice
+
+    def __init__(self, partitions):
+        self.slices = []
+        offset = 0
+
+        for data in partitions:
+            self.slices.append((offset, len(data)))
+            offset += len(data)
+
+        self._shm = shared_memory.SharedMemory(create = True, size = max(1, offset))
+
+        for data, (offset, length) in zip(partitions, self.slices):
+            self._shm.buf[offset:offset + length] = data
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._shm.close()
+        self._shm.unlink()
+        return False
+
+
+def read_partition(shm_name, offset, length):
+    shm = shared_memory.SharedMemory(name = shm_name)
+
+    try:
+        return [json.loads(line) for line in bytes(shm.buf[offset:offset + length]).split(b'\n')]
+    finally:
+        shm.close()
@@ -0,0 +1,174 @@
+import os
+import io
+import json
+import gzip
+import datetime
+import tempfile
+import threading
+from pathlib import Path
+
+EXTENSIONS = {
+    None : '.ndjson',
+    'gzip' : '.ndjson.gz',
+    'zstd' : '.ndjson.zst'
+}
+
+# Writers for different raw files commit from concurrent stages, each read-modify-write of the manifest holds this
+
+_manifest_lock = threading.Lock()
+
+
+def _open_binary(path, mode, compression):
+    if compression is None:
+        return open(path, mode)
+
+    if compression == 'gzip':
+        return gzip.open(path, mode, compresslevel = 6)
+
+    if compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError as e:
+            raise ImportError('zstd raw compression requires the zstandard package.') from e
+
+        if 'w' in mode:
+            return zstandard.ZstdCompressor(level = 3).stream_writer(open(path, mode))
+
+        return zstandard.ZstdDecompressor().stream_reader(open(path, mode))
+
+    raise ValueError(f'Unsupported raw compression: {compression}')
+
+
+def _compression_for(path):
+    for compression, extension in EXTENSIONS.items():
+        if compression and path.name.endswith(extension):
+            return compression
+
+    return None
+
+
+def read_manifest(raw_dir):
+    manifest_path = Path(raw_dir) / 'manifest.json'
+
+    if not manifest_path.exists():
+        return {}
+
+    with open(manifest_path, 'r', encoding = 'UTF-8') as file:
+        return json.load(file)
+
+
+def _write_manifest(raw_dir, manifest):
+    manifest_path = Path(raw_dir) / 'manifest.json'
+
+    with tempfile.NamedTemporaryFile('w', dir = raw_dir, prefix = 'manifest.', suffix = '.json.tmp', encoding = 'UTF-8', delete = False) as file:
+        json.dump(manifest, file, indent = 4, sort_keys = True)
+
+    os.replace(file.name, manifest_path)
+
+
+def raw_file_path(raw_dir, file_name):
+    # The manifest points at the latest NDJSON file, older runs left a plain JSON array
+
+    entry = read_manifest(raw_dir).get(file_name)
+
+    if entry and (Path(raw_dir) / entry['path']).exists():
+        return Path(raw_dir) / entry['path']
+
+    return Path(raw_dir) / f'{file_name}.json'
+
+
+def iter_raw_records(path):
+    path = Path(path)
+
+    if path.suffix == '.json':
+        with open(path, 'r', encoding = 'UTF-8') as file:
+            data = json.load(file)
+
+        if not isinstance(data, list):
+            raise TypeError(f'Incorrect top-level type in {path.name}')
+
+        yield from data
+        return
+
+    with _open_binary(path, 'rb', _compression_for(path)) as binary:
+        for line in io.TextIOWrapper(binary, encoding = 'UTF-8'):
+            if line.strip():
+                yield json.loads(line)
+
+
+def iter_raw_lines(path):
+    # One encoded JSON record per line, without the newline, for callers that route records before parsing them
+
+    path = Path(path)
+
+    if path.suffix == '.json':
+        for record in iter_raw_records(path):
+            yield json.dumps(record, ensure_ascii = False).encode('UTF-8')
+        return
+
+    # The zstandard reader cannot be iterated by line, a buffered wrapper gives every format readline
+
+    with io.BufferedReader(_open_binary(path, 'rb', _compression_for(path))) as binary:
+        for line in binary:
+            line = line.strip()
+
+            if line:
+                yield line
+
+
+class RawWriter:
+    def __init__(self, raw_dir, file_name, compression = None):
+        self.raw_dir = Path(raw_dir)
+        self.file_name = file_name
+        self.compression = compression
+        self.extension = EXTENSIONS[compression]
+        self.path = self.raw_dir / f'{file_name}{self.extension}'
+        self.tmp_path = self.raw_dir / f'{file_name}{self.extension}.tmp'
+        self.records = 0
+        self._file = None
+
+    def __enter__(self):
+        self._file = _open_binary(self.tmp_path, 'wb', self.compression)
+        return self
+
+    def write(self, records):
+        lines = ''.join(json.dumps(record, ensure_ascii = False) + '\n' for record in records)
+        self._file.write(lines.encode('UTF-8'))
+        self.records += len(records)
+
+    def __exit__(self, exc_type, exc, tb):
+        self._file.close()
+
+        if exc_type is not None:
+            self.tmp_path.unlink(missing_ok = True)
+            return False
+
+        self._commit()
+        return False
+
+    def _commit(self):
+        with _manifest_lock:
+            self._commit_locked()
+
+    def _commit_locked(self):
+        manifest = read_manifest(self.raw_dir)
+        previous = manifest.get(self.file_name, {'path' : f'{self.file_name}.json'})
+        previous_path = self.raw_dir / previous['path']
+
+        # The previous output becomes the backup, whatever format it was written in
+
+        if previous_path.exists():
+            backup_name = previous['path'].replace(self.file_name, f'{self.file_name}_backup', 1)
+            os.replace(previous_path, self.raw_dir / backup_name)
+
+        os.replace(self.tmp_path, self.path)
+
+        manifest[self.file_name] = {
+            'path' : self.path.name,
+            'compression' : self.compression,
+            'records' : self.records,
+            'bytes' : os.path.getsize(self.path),
+            'written_at' : datetime.datetime.now(datetime.timezone.utc).isoformat()
+        }
+
+        _write_manifest(self.raw_dir, manifest)
@@ -0,0 +1,155 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+
+class ResponseCache:
+    def __init__(self, cache_dir, max_bytes = 500 * 1024 * 1024, max_age_days = 7):
+        self.db_path = os.path.join(cache_dir, 'responses.db')
+        self.max_bytes = max_bytes
+        self.max_age = max_age_days * 86400
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread = False)
+        self._conn.execute('PRAGMA journal_mode = WAL')
+        self._conn.execute('PRAGMA synchronous = NORMAL')
+        self._conn.execute(
+            '''
+            CREATE TABLE IF NOT EXISTS responses (
+                cache_key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                link TEXT,
+                body TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                stored_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            '''
+        )
+
+        # Caches created before Link headers were stored need the extra column
+
+        columns = [row[1] for row in self._conn.execute('PRAGMA table_info(responses)')]
+
+        if 'link' not in columns:
+            self._conn.execute('ALTER TABLE responses ADD COLUMN link TEXT')
+
+        self._conn.commit()
+
+    def _key(self, url, params):
+        raw_key = json.dumps([url, sorted((params or {}).items())], default = str)
+        return hashlib.sha256(raw_key.encode('UTF-8')).hexdigest()
+
+    def conditional_headers(self, url, params):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT etag, last_modified FROM responses WHERE cache_key = ?',
+                (self._key(url, params),)
+            ).fetchone()
+
+        if row is None:
+            return {}
+
+        etag, last_modified = row
+        headers = {}
+
+        if etag:
+            headers['If-None-Match'] = etag
+
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+
+        return headers
+
+    def get(self, url, params):
+        cache_key = self._key(url, params)
+
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT body, link FROM responses WHERE cache_key = ?',
+                (cache_key,)
+            ).fetchone()
+
+            if row is None:
+                return None
+
+            # A body that no longer parses is dropped with its ETag, the caller then treats it as a miss
+
+            try:
+                records = json.loads(row[0])
+            except ValueError:
+                self._conn.execute('DELETE FROM responses WHERE cache_key = ?', (cache_key,))
+                self._conn.commit()
+                return None
+
+            self._conn.execute(
+                'UPDATE responses SET accessed_at = ? WHERE cache_key = ?',
+                (time.time(), cache_key)
+            )
+            self._conn.commit()
+
+            self.hits += 1
+            self.bytes_saved += len(row[0])
+
+        return records, row[1]
+
+    def store(self, url, params, headers, body):
+        self.misses += 1
+        etag = headers.get('ETag')
+        last_modified = headers.get('Last-Modified')
+
+        # Nothing to revalidate against, so there is no point keeping the body
+
+        if not etag and not last_modified:
+            return
+
+        now = time.time()
+
+        with self._lock:
+            self._conn.execute(
+                '''
+                INSERT OR REPLACE INTO responses
+                    (cache_key, url, etag, last_modified, link, body, size, stored_at, accessed_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''',
+                (self._key(url, params), url, etag, last_modified, headers.get('Link'), body, len(body), now, now)
+            )
+            self._conn.commit()
+
+    def evict(self):
+        with self._lock:
+            self._conn.execute(
+                'DELETE FROM responses WHERE stored_at < ?',
+                (time.time() - self.max_age,)
+            )
+
+            total_bytes = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+            # Least recently served entries go first once over the size budget
+
+            if total_bytes > self.max_bytes:
+                rows = self._conn.execute('SELECT cache_key, size FROM responses ORDER BY accessed_at').fetchall()
+                stale_keys = []
+
+                for cache_key, size in rows:
+                    if total_bytes <= self.max_bytes:
+                        break
+
+                    stale_keys.append((cache_key,))
+                    total_bytes -= size
+
+                self._conn.executemany('DELETE FROM responses WHERE cache_key = ?', stale_keys)
+
+            self._conn.commit()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
@@ -0,0 +1,183 @@
+import re
+from functools import lru_cache
+from pathlib import Path
+
+import pandas as pd
+
+# Clean frame dtypes, generated from the migrations/*.sql files so the two cannot drift apart.
+# UNIQUEIDENTIFIER and VARCHAR become Arrow-backed strings, INT becomes Int32 and BIT becomes Int8,
+# which keeps the 0/1 text the CSV outputs have always had. DATETIME2 columns are parsed by the cleaners.
+
+MIGRATION_DIR = Path(__file__).resolve().parent.parent / 'migrations'
+
+CREATE_TABLE = re.compile(r'CREATE TABLE (\w+) \((.*?)\n\s*\);', re.S)
+COLUMN = re.compile(r'^\s*\[?(\w+)\]?\s+(UNIQUEIDENTIFIER|NVARCHAR|VARCHAR|BIT|INT|DATETIME2)\b\s*(?:\((\d+)\))?(.*?),?$')
+
+STRING = pd.StringDtype('pyarrow')
+
+# Migration bookkeeping, not part of the data model
+
+IGNORED_TABLES = {'schema_migrations'}
+
+SQL_DTYPES = {
+    'UNIQUEIDENTIFIER' : STRING,
+    'VARCHAR' : STRING,
+    'NVARCHAR' : STRING,
+    'INT' : 'Int32',
+    'BIT' : 'Int8',
+    'DATETIME2' : None
+}
+
+# A handful of distinct values repeated on every row, stored once per frame as categories
+
+CATEGORICAL = {
+    'repos' : ['language', 'visibility', 'default_branch', 'owner_id', 'owner_login'],
+    'issues' : ['state', 'repo_id', 'author_id', 'author_login', 'assignee_id', 'assignee_login'],
+    'branches' : ['repo_id'],
+    'issue_labels' : ['label_id'],
+    'repo_topics' : ['topic_id']
+}
+
+# Carried in the clean files for joins and lookups, not loaded into SQL
+
+EXTRA_COLUMNS = {
+    'repos' : {
+        'github_repo_id' : 'Int64',
+        'github_owner_id' : 'Int64',
+        'owner_login' : STRING,
+        'forks' : 'Int32'
+    },
+    'issues' : {
+        'github_issue_id' : 'Int64',
+        'github_author_id' : 'Int64',
+        'author_login' : STRING,
+        'assignee_login' : STRING,
+        'state' : STRING
+    },
+    'branches' : {}
+}
+
+
+class ColumnSpec:
+    def __init__(self, name, sql_type, length, nullable):
+        self.name = name
+        self.sql_type = sql_type
+        self.length = length
+        self.nullable = nullable
+
+    @property
+    def dtype(self):
+        return SQL_DTYPES[self.sql_type]
+
+
+def parse_migration(migration_path):
+    tables = {}
+
+    with open(migration_path, 'r', encoding = 'UTF-8') as file:
+        sql = file.read()
+
+    for table_name, body in CREATE_TABLE.findall(sql):
+        if table_name in IGNORED_TABLES:
+            continue
+
+        columns = {}
+
+        for line in body.splitlines():
+            match = COLUMN.match(line)
+
+            if match is None:
+                continue
+
+            name, sql_type, length, rest = match.groups()
+            columns[name] = ColumnSpec(
+                name,
+                sql_type,
+                int(length) if length and sql_type in ('VARCHAR', 'NVARCHAR') else None,
+                'NOT NULL' not in rest and 'PRIMARY KEY' not in rest
+            )
+
+        tables[table_name] = columns
+
+    return tables
+
+
+def parse_migrations(migration_dir = MIGRATION_DIR):
+    # Applied in file name order, the same order they run against SQL Server
+
+    tables = {}
+
+    for migration_path in sorted(Path(migration_dir).glob('*.sql')):
+        tables.update(parse_migration(migration_path))
+
+    return tables
+
+
+def check_metadata(tables, metadata):
+    # utils/sql_tables.py mirrors the migration by hand for SQLite, so any drift is caught here
+
+    mismatches = []
+
+    for table_name, columns in tables.items():
+        table = metadata.tables.get(table_name)
+
+        if table is None:
+            mismatches.append(f'{table_name} missing from sql_tables')
+            continue
+
+        for name, spec in columns.items():
+            if name not in table.columns:
+                mismatches.append(f'{table_name}.{name} missing from sql_tables')
+            elif spec.length is not None and table.columns[name].type.length != spec.length:
+                mismatches.append(f'{table_name}.{name} is {spec.length} long in the migration, {table.columns[name].type.length} in sql_tables')
+            elif table.columns[name].nullable != spec.nullable:
+                mismatches.append(f'{table_name}.{name} nullability differs from the migration')
+
+    return mismatches
+
+
+@lru_cache(maxsize = None)
+def load_schema():
+    from utils.sql_tables import metadata
+
+    tables = parse_migrations()
+    mismatches = check_metadata(tables, metadata)
+
+    if mismatches:
+        raise ValueError('utils/sql_tables.py is out of sync with the migrations: ' + '; '.join(mismatches))
+
+    return tables
+
+
+def clean_dtypes(table_name):
+    dtypes = {name : spec.dtype for name, spec in load_schema()[table_name].items() if spec.dtype is not None}
+    dtypes.update(EXTRA_COLUMNS.get(table_name, {}))
+
+    for name in CATEGORICAL.get(table_name, []):
+        dtypes[name] = 'category'
+
+    return dtypes
+
+
+def apply_schema(table_name, df):
+    # Values over their VARCHAR length are counted but kept whole, the validator rejects those rows at load
+
+    over_length = {}
+    columns = load_schema()[table_name]
+    df = df.copy()
+
+    for name, dtype in clean_dtypes(table_name).items():
+        if name not in df.columns:
+            continue
+
+        spec = columns.get(name)
+        values = df[name].astype(STRING) if dtype == 'category' else df[name].astype(dtype)
+
+        if spec is not None and spec.length is not None:
+            too_long = values.str.len() > spec.length
+
+            if too_long.any():
+                over_length[name] = int(too_long.sum())
+
+        df[name] = values.astype('category') if dtype == 'category' else values
+
+    return df, over_length
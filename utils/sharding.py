@@ -0,0 +1,43 @@
+import os
+import zlib
+from config import OWNERS
+
+def load_owners():
+    # GITHUB_OWNERS takes a comma separated list of users and orgs, falling back to config
+
+    owners = [owner.strip() for owner in os.getenv('GITHUB_OWNERS', '').split(',') if owner.strip()]
+
+    return owners or list(OWNERS)
+
+
+def shard_repos(repo_names, shard_count, shard_by = 'owner'):
+    shards = [[] for _ in range(max(1, shard_count))]
+
+    if shard_by == 'repo':
+        for repo in repo_names:
+            shards[zlib.crc32(repo.encode('UTF-8')) % len(shards)].append(repo)
+
+    elif shard_by == 'owner':
+        owner_repos = {}
+
+        for repo in repo_names:
+            owner_repos.setdefault(repo.split('/')[0], []).append(repo)
+
+        # Biggest owners go first onto the lightest shard so shard sizes stay close
+
+        for repos in sorted(owner_repos.values(), key = len, reverse = True):
+            min(shards, key = len).extend(repos)
+
+    else:
+        raise ValueError(f'Unknown shard key: {shard_by}')
+
+    return [shard for shard in shards if shard]
+
+
+def split_tokens(tokens, shard_count):
+    # With enough tokens every shard gets its own, otherwise shards share the pool at a divided rate
+
+    if len(tokens) >= shard_count:
+        return [tokens[shard::shard_count] for shard in range(shard_count)], 1
+
+    return [list(tokens)] * shard_count, shard_count
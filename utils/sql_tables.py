@@ -0,0 +1,131 @@
+from sqlalchemy import (
+    MetaData,
+    Table,
+    Column,
+    String,
+    Unicode,
+    Integer,
+    Boolean,
+    DateTime,
+    ForeignKey,
+    UniqueConstraint,
+    CheckConstraint
+)
+
+# Mirrors the migrations/*.sql files for local stand-in databases such as SQLite.
+# SQL Server is always built from the migration itself, never from this metadata.
+# CK_commit_sha_hex relies on T-SQL LIKE character classes and is left out here.
+
+metadata = MetaData()
+
+GUID_LENGTH = 36
+
+owners = Table(
+    'owners', metadata,
+    Column('owner_id', String(GUID_LENGTH), primary_key = True),
+    Column('owner_login', String(250), nullable = False),
+    UniqueConstraint('owner_login', name = 'UQ_owner_login')
+)
+
+users = Table(
+    'users', metadata,
+    Column('user_id', String(GUID_LENGTH), primary_key = True),
+    Column('user_login', String(250), nullable = False),
+    UniqueConstraint('user_login', name = 'UQ_user_login')
+)
+
+repos = Table(
+    'repos', metadata,
+    Column('repo_id', String(GUID_LENGTH), primary_key = True),
+    Column('repo_name', String(200), nullable = False),
+    Column('full_name', String(255), nullable = False),
+    Column('description', Unicode(1000)),
+    Column('topics', Unicode(1000)),
+    Column('language', String(100)),
+    Column('owner_id', String(GUID_LENGTH), ForeignKey('owners.owner_id', ondelete = 'CASCADE'), nullable = False),
+    Column('visibility', String(50), nullable = False),
+    Column('private', Boolean, default = False),
+    Column('disabled', Boolean, default = False),
+    Column('fork', Boolean, default = False),
+    Column('archived', Boolean, default = False),
+    Column('default_branch', String(255)),
+    Column('stargazers_count', Integer, nullable = False, default = 0),
+    Column('watchers_count', Integer, nullable = False, default = 0),
+    Column('forks_count', Integer, nullable = False, default = 0),
+    Column('open_issues_count', Integer, nullable = False, default = 0),
+    Column('created_at', DateTime, nullable = False),
+    Column('updated_at', DateTime),
+    Column('pushed_at', DateTime),
+    UniqueConstraint('full_name', name = 'UQ_repos_full_name'),
+    CheckConstraint("visibility IN ('public', 'private', 'internal')", name = 'CK_repos_visibility'),
+    CheckConstraint(
+        'stargazers_count >= 0 AND forks_count >= 0 AND watchers_count >= 0 AND open_issues_count >= 0',
+        name = 'CK_non_negative_counts'
+    ),
+    CheckConstraint('updated_at IS NULL OR updated_at >= created_at', name = 'CK_repos_timestamps'),
+    CheckConstraint('pushed_at IS NULL OR pushed_at >= created_at', name = 'CK_repos_pushed_at')
+)
+
+issues = Table(
+    'issues', metadata,
+    Column('issue_id', String(GUID_LENGTH), primary_key = True),
+    Column('number', Integer, nullable = False),
+    Column('author_id', String(GUID_LENGTH), ForeignKey('users.user_id', ondelete = 'CASCADE'), nullable = False),
+    Column('title', String(250), nullable = False),
+    Column('locked', Boolean, default = False),
+    Column('comments', Integer, nullable = False, default = 0),
+    Column('pr_merged_at', DateTime),
+    Column('created_at', DateTime, nullable = False),
+    Column('updated_at', DateTime),
+    Column('closed_at', DateTime),
+    Column('labels', Unicode(1000)),
+    Column('assignee_id', String(GUID_LENGTH), ForeignKey('users.user_id', ondelete = 'CASCADE')),
+    Column('repo_id', String(GUID_LENGTH), ForeignKey('repos.repo_id', ondelete = 'CASCADE'), nullable = False),
+    CheckConstraint('updated_at IS NULL OR updated_at >= created_at', name = 'CK_issues_timestamps'),
+    CheckConstraint('closed_at IS NULL OR closed_at >= created_at', name = 'CK_closed_at')
+)
+
+branches = Table(
+    'branches', metadata,
+    Column('branch_id', String(GUID_LENGTH), primary_key = True),
+    Column('branch_name', String(250), nullable = False),
+    Column('protected', Boolean, default = False),
+    Column('commit_sha', String(40)),
+    Column('repo_id', String(GUID_LENGTH), ForeignKey('repos.repo_id', ondelete = 'CASCADE'), nullable = False),
+    Column('ingested_at', DateTime),
+    UniqueConstraint('repo_id', 'branch_name', name = 'UQ_repo_branch')
+)
+
+labels = Table(
+    'labels', metadata,
+    Column('label_id', String(GUID_LENGTH), primary_key = True),
+    Column('label_name', Unicode(100), nullable = False),
+    UniqueConstraint('label_name', name = 'UQ_label_name')
+)
+
+topics = Table(
+    'topics', metadata,
+    Column('topic_id', String(GUID_LENGTH), primary_key = True),
+    Column('topic_name', String(50), nullable = False),
+    UniqueConstraint('topic_name', name = 'UQ_topic_name')
+)
+
+issue_labels = Table(
+    'issue_labels', metadata,
+    Column('issue_label_id', String(GUID_LENGTH), primary_key = True),
+    Column('issue_id', String(GUID_LENGTH), ForeignKey('issues.issue_id', ondelete = 'CASCADE'), nullable = False),
+    Column('label_id', String(GUID_LENGTH), ForeignKey('labels.label_id', ondelete = 'CASCADE'), nullable = False),
+    UniqueConstraint('issue_id', 'label_id', name = 'UQ_issue_label')
+)
+
+repo_topics = Table(
+    'repo_topics', metadata,
+    Column('repo_topic_id', String(GUID_LENGTH), primary_key = True),
+    Column('repo_id', String(GUID_LENGTH), ForeignKey('repos.repo_id', ondelete = 'CASCADE'), nullable = False),
+    Column('topic_id', String(GUID_LENGTH), ForeignKey('topics.topic_id', ondelete = 'CASCADE'), nullable = False),
+    UniqueConstraint('repo_id', 'topic_id', name = 'UQ_repo_topic')
+)
+
+# Parents before children so every MERGE satisfies its foreign keys
+
+LOAD_ORDER = [owners, users, labels, topics, repos, repo_topics, issues, issue_labels, branches]
@@ -0,0 +1,29 @@
+import os
+import json
+
+
+class WatermarkStore:
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.watermarks = {}
+
+        if os.path.exists(file_path):
+            with open(file_path, 'r', encoding = 'UTF-8') as file:
+                self.watermarks = json.load(file)
+
+    def get(self, key):
+        return self.watermarks.get(key)
+
+    def advance(self, key, value):
+        # GitHub timestamps are ISO 8601 in UTC, so string order is time order
+
+        if value and (key not in self.watermarks or value > self.watermarks[key]):
+            self.watermarks[key] = value
+
+    def save(self):
+        tmp_path = f'{self.file_path}.tmp'
+
+        with open(tmp_path, 'w', encoding = 'UTF-8') as file:
+            json.dump(self.watermarks, file, indent = 4, sort_keys = True)
+
+        os.replace(tmp_path, self.file_path)